@@ -0,0 +1,120 @@
+"""Runs blocking Google Calendar calls off the event loop, with optional per calendar limits.
+
+Calls run concurrently on a shared thread pool. With CALENDAR_WRITES_PER_SECOND set,
+calls of one calendar start no faster than the calendar's write bucket allows, so
+throughput grows with the number of calendars. Calls of one event run one at a time
+in arrival order, so read modify write updates of an event never interleave. Limits
+are per API process, divide CALENDAR_WRITES_PER_SECOND by the number of workers.
+"""
+
+import asyncio
+import contextlib
+import functools
+import inspect
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# writes started per second and calendar, unset or 0 leaves writes unlimited and
+# Google's own quota errors to the caller, set it below the quota of the project
+CALENDAR_WRITES_PER_SECOND = float(os.getenv("CALENDAR_WRITES_PER_SECOND") or 0)
+
+# writes a calendar can start at once after being idle
+CALENDAR_WRITE_BURST = int(os.getenv("CALENDAR_WRITE_BURST", 10))
+
+# threads running calendar calls, the most calendars written at the same time
+CALENDAR_MAX_WORKERS = int(os.getenv("CALENDAR_MAX_WORKERS", 16))
+
+_executor = ThreadPoolExecutor(
+    max_workers=CALENDAR_MAX_WORKERS, thread_name_prefix="calendar"
+)
+
+
+class TokenBucket:
+    """Write budget of one calendar, refilled at rate tokens per second up to burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CalendarLane:
+    """Write budget of one calendar, the lock hands out tokens in arrival order"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.bucket = TokenBucket(CALENDAR_WRITES_PER_SECOND, CALENDAR_WRITE_BURST)
+
+
+# calendar ID -> lane
+_lanes = {}
+
+
+def _lane(calendar_id):
+    lane = _lanes.get(calendar_id)
+    if lane is None:
+        lane = _lanes[calendar_id] = CalendarLane()
+    return lane
+
+
+# event ID -> [lock, calls holding or waiting for it], dropped once no call needs it
+_event_locks = {}
+
+
+@contextlib.asynccontextmanager
+async def _event_lock(event_id):
+    entry = _event_locks.setdefault(event_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _event_locks[event_id]
+
+
+@functools.cache
+def _takes_event_id(function):
+    """True for calendar_func functions changing an existing event,
+    function(service, calendar_id, event_id, ...)"""
+    return list(inspect.signature(function).parameters)[2:3] == ["event_id"]
+
+
+async def calendar_call(function, service, calendar_id, *args):
+    """Runs function(service, calendar_id, *args) from calendar_func in the calendar
+    thread pool once the event's earlier calls finished and the calendar's bucket allows
+    """
+    lane = _lane(calendar_id)
+    event_lock = (
+        _event_lock(args[0]) if _takes_event_id(function) else contextlib.nullcontext()
+    )
+    async with event_lock:
+        # the lock only orders token reservations, the call runs without it
+        async with lane.lock:
+            await lane.bucket.acquire()
+        return await asyncio.get_running_loop().run_in_executor(
+            _executor, functools.partial(function, service, calendar_id, *args)
+        )
+
+
+async def fan_out(calls):
+    """Runs (function, service, calendar_id, *args) tuples concurrently across calendars,
+    returns results in order"""
+    return await asyncio.gather(*[calendar_call(*call) for call in calls])
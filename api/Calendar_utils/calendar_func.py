@@ -2,13 +2,6 @@ import datetime
 import os.path
 
 import dotenv
-from fastapi import Depends
-from google.auth.transport.requests import Request
-from google.oauth2 import service_account
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 from api.logger import api_logger
 
@@ -17,9 +10,23 @@ dotenv.load_dotenv()
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
+# calendar of teachers without their own calendar_id
 CALENDAR_ID = os.getenv("CALENDAR_ID")
 
 
+def calendar_or_default(calendar_id):
+    """Calendar of a teacher or class, CALENDAR_ID when unset"""
+    return calendar_id or CALENDAR_ID
+
+
+def _http_error():
+    """Returns googleapiclient HttpError, imported on first exception so the
+    Google client libraries stay out of application startup"""
+    from googleapiclient.errors import HttpError
+
+    return HttpError
+
+
 # def get_calendar_service():
 #     """Returns a calendar service, needs creds.json, creates token.json"""
 #     creds = None
@@ -59,7 +66,9 @@ CALENDAR_ID = os.getenv("CALENDAR_ID")
 #         return None
 
 
-def add_event_to_calendar(service, name, start_time, end_time, description, frequency):
+def add_event_to_calendar(
+    service, calendar_id, name, start_time, end_time, description, frequency
+):
     """Adds new event to calendar, requires service to be set up first, takes name,start_time,end_time,reccuerence"""
 
     notifications = [
@@ -100,19 +109,20 @@ def add_event_to_calendar(service, name, start_time, end_time, description, freq
     event["reminders"] = {"useDefault": False, "overrides": notifications}
 
     try:
-        event = service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
-    except HttpError as e:
+        event = service.events().insert(calendarId=calendar_id, body=event).execute()
+    except _http_error() as e:
         api_logger.error("Error with creating event: %s", e)
+        return None
     api_logger.info("New event created, at event %s", event.get("htmlLink"))
     return event
 
 
-def add_reservation_to_calendar(service, event_id, new_student_mail):
+def add_reservation_to_calendar(service, calendar_id, event_id, new_student_mail):
     """Adds student email to atendees of event/makes a reservation"""
 
     try:
         target_event = (
-            service.events().get(calendarId=CALENDAR_ID, eventId=event_id).execute()
+            service.events().get(calendarId=calendar_id, eventId=event_id).execute()
         )
         current_students = target_event.get("attendees", [])
         new_student = {"email": new_student_mail}
@@ -122,61 +132,83 @@ def add_reservation_to_calendar(service, event_id, new_student_mail):
             try:
                 updated_event = (
                     service.events()
-                    .update(calendarId=CALENDAR_ID, eventId=event_id, body=target_event)
+                    .update(calendarId=calendar_id, eventId=event_id, body=target_event)
                     .execute()
                 )
                 api_logger.info("Updated event at %s", updated_event.get("htmlLink"))
                 return target_event
-            except HttpError as e:
+            except _http_error() as e:
                 api_logger.error("Error has occured: %s", e)
         else:
             api_logger.error("Student in attendees")
-    except HttpError as e:
+    except _http_error() as e:
         api_logger.error("Error has occured: %s", e)
 
 
-def delete_reservation_from_calendar(service, event_id, target_student_mail):
+def delete_reservation_from_calendar(
+    service, calendar_id, event_id, target_student_mail
+):
     """Removes student from atendees"""
+    return delete_reservations_from_calendar(
+        service, calendar_id, event_id, [target_student_mail]
+    )
 
+
+def delete_reservations_from_calendar(
+    service, calendar_id, event_id, target_student_mails
+):
+    """Removes all given student emails from atendees with one get and one update"""
+    targets = set(target_student_mails)
     try:
         target_event = (
-            service.events().get(calendarId=CALENDAR_ID, eventId=event_id).execute()
+            service.events().get(calendarId=calendar_id, eventId=event_id).execute()
         )
         current_attendees = target_event.get("attendees", [])
-
-        for student in current_attendees:
-            if student.get("email") == target_student_mail:
-                current_attendees.remove(student)
-                break
-        target_event["attendees"] = current_attendees
+        target_event["attendees"] = [
+            student
+            for student in current_attendees
+            if student.get("email") not in targets
+        ]
         try:
             updated_event = (
                 service.events()
-                .update(calendarId=CALENDAR_ID, eventId=event_id, body=target_event)
+                .update(calendarId=calendar_id, eventId=event_id, body=target_event)
                 .execute()
             )
             api_logger.info("Updated event at %s", updated_event.get("htmlLink"))
             return updated_event
-        except HttpError as e:
+        except _http_error() as e:
             api_logger.error("Error has occured: %s", e)
 
-    except HttpError as e:
+    except _http_error() as e:
         api_logger.error("Error has occured: %s", e)
 
 
-def delete_class_from_calendar(service, event_id):
+def delete_class_from_calendar(service, calendar_id, event_id):
     """Delete class from calendar based on event id"""
     try:
         target_event = (
-            service.events().delete(calendarId=CALENDAR_ID, eventId=event_id).execute()
+            service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
         )
         return target_event
-    except HttpError as e:
+    except _http_error() as e:
+        api_logger.error("Error has occured: %s", e)
+
+
+def move_event_to_calendar(service, calendar_id, event_id, destination):
+    """Moves event to destination calendar, keeps its ID"""
+    try:
+        return (
+            service.events()
+            .move(calendarId=calendar_id, eventId=event_id, destination=destination)
+            .execute()
+        )
+    except _http_error() as e:
         api_logger.error("Error has occured: %s", e)
 
 
 def update_event_calendar(
-    service, event_id, name, description, start_time, end_time, frequency
+    service, calendar_id, event_id, name, description, start_time, end_time, frequency
 ):
     """Updates data for calendar event"""
 
@@ -217,10 +249,10 @@ def update_event_calendar(
     try:
         updated_event = (
             service.events()
-            .update(calendarId=CALENDAR_ID, eventId=event_id, body=event)
+            .update(calendarId=calendar_id, eventId=event_id, body=event)
             .execute()
         )
-    except HttpError as e:
+    except _http_error() as e:
         api_logger.error("Error with creating event: %s", e)
         api_logger.info("New event created, at event %s", event.get("htmlLink"))
         return event
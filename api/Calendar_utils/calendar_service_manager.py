@@ -1,78 +1,300 @@
+import abc
+import asyncio
+import datetime
+import json
 import os
+import time
 from typing import Annotated
 
-from fastapi import Depends
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from fastapi import Depends, HTTPException, status
+from starlette.concurrency import run_in_threadpool
 
+from api.Calendar_utils.token_store import (
+    CALENDAR_TENANT,
+    SCOPES,
+    get_token_store,
+    pop_login,
+    save_login,
+)
 from api.logger import api_logger
 
-SCOPES = ["https://www.googleapis.com/auth/calendar"]
+# google for Google Calendar API, fake for offline in memory calendar used in tests and benchmarks
+CALENDAR_BACKEND = os.getenv("CALENDAR_BACKEND", "google")
 
+# seconds cached credentials are used before the token store is read again
+CALENDAR_CREDENTIALS_TTL = float(os.getenv("CALENDAR_CREDENTIALS_TTL", 300))
 
-class CalendarServiceManager:
-    """Service manager for builidng calendar service, needs creds.json, creates token.json, handles login, logout and service creation"""
+# credentials expiring within this many seconds are refreshed in the background
+CALENDAR_REFRESH_MARGIN = float(os.getenv("CALENDAR_REFRESH_MARGIN", 300))
+
+# redirect URI registered for the OAuth client, Google sends the login code there
+OAUTH_REDIRECT_URI = os.getenv(
+    "OAUTH_REDIRECT_URI", "http://localhost:8000/auth/callback"
+)
+
+
+class CalendarBackend(abc.ABC):
+    """Interface of calendar backends, get_calendar_service returns a Google Calendar API
+    compatible service resource or None if not logged in"""
+
+    @abc.abstractmethod
+    def get_calendar_service(self): ...
+
+    @abc.abstractmethod
+    async def login(self): ...
+
+    @abc.abstractmethod
+    async def callback(self, code: str, state: str): ...
+
+    @abc.abstractmethod
+    async def logout(self): ...
+
+
+def _build_service(creds):
+    """Builds the calendar service resource, blocking"""
+    import google_auth_httplib2
+    import httplib2
+    from googleapiclient.discovery import build
+    from googleapiclient.http import HttpRequest
+
+    def build_request(http, *args, **kwargs):
+        # httplib2 is not thread safe, calendar calls run on a thread pool so
+        # every request gets its own authorized connection
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+        return HttpRequest(http, *args, **kwargs)
+
+    return build("calendar", "v3", credentials=creds, requestBuilder=build_request)
+
+
+def _expires_in(creds):
+    """Seconds until creds expire, 0 without a token, None if they never expire"""
+    if not creds.token:
+        return 0
+    if creds.expiry is None:
+        return None
+    # google keeps expiry as naive UTC
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return (creds.expiry - now).total_seconds()
+
+
+class CachedCredentials:
+    """Credentials of a tenant with the service built on them, token_info is what the
+    store returned, compared on reload to rebuild only after a change"""
+
+    __slots__ = ("store", "token_info", "creds", "service", "loaded")
+
+    def __init__(self, store, token_info, creds, service):
+        self.store = store
+        self.token_info = token_info
+        self.creds = creds
+        self.service = service
+        self.loaded = time.monotonic()
+
+
+class CredentialCache:
+    """Per process credentials and calendar service of each tenant. The store is read
+    once per CALENDAR_CREDENTIALS_TTL, tokens are refreshed off the event loop, ahead of
+    expiry by refresh_credentials or on use once expired, refreshed OAuth tokens are saved
+    back so other workers pick them up"""
 
     def __init__(self):
-        self.token_path = os.path.abspath("api/Credentials/token.json")
-        self.creds_path = os.path.abspath("api/Credentials/creds.json")
+        self.entries = {}
+        self.locks = {}
 
-    def get_credentials(self):
-        """Gets OAuth2 credentials."""
-        creds = None
-        if os.path.exists(self.token_path):
-            creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                return None  # if no token service cant be built
-        return creds
+    def _lock(self, tenant: str):
+        lock = self.locks.get(tenant)
+        if lock is None:
+            lock = self.locks[tenant] = asyncio.Lock()
+        return lock
 
-    def get_calendar_service(self):
-        """Builds and returns the calendar service."""
-        creds = self.get_credentials()
-        if creds is None:
-            return None  # If there are no valid credentials, service cannot be built
+    async def get(self, tenant: str, store):
+        """Returns CachedCredentials with valid creds or None if not logged in"""
+        entry = self.entries.get(tenant)
+        if entry is None or time.monotonic() - entry.loaded > CALENDAR_CREDENTIALS_TTL:
+            async with self._lock(tenant):
+                entry = self.entries.get(tenant)
+                if (
+                    entry is None
+                    or time.monotonic() - entry.loaded > CALENDAR_CREDENTIALS_TTL
+                ):
+                    entry = await self._load(tenant, store, entry)
+        if entry is None:
+            return None
+        expires = _expires_in(entry.creds)
+        if expires is not None and expires <= 0:
+            try:
+                await self.refresh(tenant, margin=0)
+            except Exception as e:
+                api_logger.error("Error refreshing calendar credentials: %s", e)
+                return None
+        return entry
+
+    async def _load(self, tenant: str, store, entry):
+        token_info = await store.load()
+        if token_info is None:
+            self.entries.pop(tenant, None)
+            return None
+        if entry is not None and entry.token_info == token_info:
+            entry.loaded = time.monotonic()
+            return entry
+        creds = store.credentials(token_info)
         try:
-            service = build("calendar", "v3", credentials=creds)
-            return service
+            service = await asyncio.to_thread(_build_service, creds)
         except Exception as e:
             api_logger.error("Error occurred: %s", e)
             return None
+        entry = self.entries[tenant] = CachedCredentials(
+            store, token_info, creds, service
+        )
+        return entry
 
-    def login(self):
-        """Performs login and builds calendar service."""
-        flow = InstalledAppFlow.from_client_secrets_file(self.creds_path, SCOPES)
-        creds = flow.run_local_server(port=0)
-        with open(self.token_path, "w") as token:
-            token.write(creds.to_json())
-        try:
-            service = build("calendar", "v3", credentials=creds)
+    async def refresh(self, tenant: str, margin: float = CALENDAR_REFRESH_MARGIN):
+        """Refreshes the tenant's token if it expires within margin seconds"""
+        async with self._lock(tenant):
+            entry = self.entries.get(tenant)
+            if entry is None:
+                return
+            expires = _expires_in(entry.creds)
+            if expires is None or expires > margin:
+                return
+            from google.auth.transport.requests import Request
+
+            await asyncio.to_thread(entry.creds.refresh, Request())
+            if entry.store.needs_login:
+                token_json = entry.creds.to_json()
+                await entry.store.save(token_json)
+                entry.token_info = json.loads(token_json)
+
+    def invalidate(self, tenant: str):
+        self.entries.pop(tenant, None)
+
+
+credential_cache = CredentialCache()
+
+
+async def refresh_credentials():
+    """Refreshes cached credentials of every tenant before they expire, runs in every
+    worker from the server lifespan"""
+    while True:
+        await asyncio.sleep(CALENDAR_REFRESH_MARGIN / 3)
+        for tenant in list(credential_cache.entries):
+            try:
+                await credential_cache.refresh(tenant)
+            except Exception as e:
+                api_logger.error("Error refreshing calendar credentials: %s", e)
+
+
+class CalendarServiceManager(CalendarBackend):
+    """Service manager for builidng calendar service, needs creds.json or a service account key,
+    takes credentials from the credential cache, handles login, logout and service creation
+    """
+
+    def __init__(self, token_store=None, tenant: str = CALENDAR_TENANT):
+        self.tenant = tenant
+        self.token_store = token_store or get_token_store(tenant)
+        self.cached = None
+        self.creds_path = os.path.abspath("api/Credentials/creds.json")
+
+    async def load_credentials(self):
+        """Loads cached credentials, call before get_calendar_service"""
+        self.cached = await credential_cache.get(self.tenant, self.token_store)
+
+    def get_credentials(self):
+        """Gets OAuth2 or service account credentials."""
+        return None if self.cached is None else self.cached.creds
+
+    def get_calendar_service(self):
+        """Returns the calendar service, None without valid credentials"""
+        return None if self.cached is None else self.cached.service
+
+    async def login(self):
+        """Starts OAuth web flow, returns Google consent screen URL, Google then sends
+        the code to OAUTH_REDIRECT_URI (callback)"""
+        if not self.token_store.needs_login:
+            if self.cached is None:
+                return {"error": "Service account key not found"}
             return {"message": "Logged in"}
+        from google_auth_oauthlib.flow import Flow
+
+        flow = await run_in_threadpool(
+            Flow.from_client_secrets_file,
+            self.creds_path,
+            SCOPES,
+            redirect_uri=OAUTH_REDIRECT_URI,
+        )
+        # offline access returns a refresh token, workers refresh without a new login
+        url, state = flow.authorization_url(access_type="offline", prompt="consent")
+        await save_login(state, flow.code_verifier)
+        return {"authorization_url": url}
+
+    async def callback(self, code: str, state: str):
+        """Exchanges code from Google for a token and stores it"""
+        login = await pop_login(state)
+        if login is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Login expired or unknown, start again at /auth/login",
+            )
+        from google_auth_oauthlib.flow import Flow
+
+        flow = await run_in_threadpool(
+            Flow.from_client_secrets_file,
+            self.creds_path,
+            SCOPES,
+            state=state,
+            redirect_uri=OAUTH_REDIRECT_URI,
+            code_verifier=login.code_verifier,
+        )
+        try:
+            await asyncio.to_thread(flow.fetch_token, code=code)
         except Exception as e:
             api_logger.error("Error occurred: %s", e)
             return {"error": str(e)}
+        if not flow.credentials.refresh_token:
+            # the stored token would stop working once the access token expires
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Google returned no refresh token, start again at /auth/login",
+            )
+        await self.token_store.save(flow.credentials.to_json())
+        credential_cache.invalidate(self.tenant)
+        return {"message": "Logged in"}
 
-    def logout(self):
-        """Removes token.json, logging user out and requiring authorization again."""
+    async def logout(self):
+        """Removes stored token, logging user out and requiring authorization again."""
+        credential_cache.invalidate(self.tenant)
         try:
-            os.remove(self.token_path)
-            return {"message": "logged out"}
-        except FileNotFoundError:
-            return {"message": "token.json file not found"}
+            if await self.token_store.delete():
+                return {"message": "logged out"}
+            return {"message": "token not found"}
         except Exception as e:
             api_logger.error("Error removing token file: %s", e)
             return {"error": str(e)}
 
 
+_fake_backend = None
+
+
+def get_fake_calendar_backend():
+    """Returns process wide fake backend configured via FAKE_CALENDAR_LATENCY_MS and FAKE_CALENDAR_ERROR_RATE"""
+    global _fake_backend
+    if _fake_backend is None:
+        from api.Calendar_utils.fake_calendar import FakeCalendarServiceManager
+
+        _fake_backend = FakeCalendarServiceManager(
+            latency=float(os.getenv("FAKE_CALENDAR_LATENCY_MS", 0)) / 1000,
+            error_rate=float(os.getenv("FAKE_CALENDAR_ERROR_RATE", 0)),
+        )
+    return _fake_backend
+
+
 # Dependency injection for creating calendar service, handles login and logout
-def get_calendar_service_manager():
-    return CalendarServiceManager()
+async def get_calendar_service_manager() -> CalendarBackend:
+    if CALENDAR_BACKEND == "fake":
+        return get_fake_calendar_backend()
+    manager = CalendarServiceManager()
+    await manager.load_credentials()
+    return manager
 
 
-service_dependancy = Annotated[
-    CalendarServiceManager, Depends(get_calendar_service_manager)
-]
+service_dependancy = Annotated[CalendarBackend, Depends(get_calendar_service_manager)]
@@ -0,0 +1,222 @@
+import json
+import random
+import threading
+import time
+import uuid
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from api.Calendar_utils.calendar_service_manager import CalendarBackend
+
+
+def _http_error(status_code: int, message: str):
+    """Builds googleapiclient HttpError so calendar_func handles fake errors like real ones"""
+    response = httplib2.Response({"status": status_code})
+    content = json.dumps({"error": {"code": status_code, "message": message}})
+    return HttpError(response, content.encode())
+
+
+class FakeRequest:
+    """Deferred call, mirrors googleapiclient HttpRequest.execute"""
+
+    def __init__(self, service, call):
+        self.service = service
+        self.call = call
+
+    def execute(self):
+        self.service.round_trip()
+        return self.call()
+
+
+class FakeBatchRequest:
+    """Mirrors BatchHttpRequest, all added requests cost one round trip"""
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = request_id or str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        self.service.round_trip()
+        for request_id, request, callback in self.requests:
+            response, exception = None, None
+            try:
+                self.service.inject_error()
+                response = request.call()
+            except HttpError as e:
+                exception = e
+            if callback:
+                callback(request_id, response, exception)
+
+
+class FakeEvents:
+    """Events collection with insert, get, update, patch, delete, move and list with syncToken"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def _calendar(self, calendar_id):
+        return self.service.calendars.setdefault(calendar_id, {})
+
+    def _event(self, calendar_id, event_id):
+        event = self._calendar(calendar_id).get(event_id)
+        if event is None or event["status"] == "cancelled":
+            raise _http_error(404, "Not Found")
+        return event
+
+    def _store(self, calendar_id, event):
+        sequence = self.service.next_sequence()
+        event.update(
+            etag=f'"{sequence}"',
+            updated=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            _sequence=sequence,
+        )
+        self._calendar(calendar_id)[event["id"]] = event
+        return self._public(event)
+
+    @staticmethod
+    def _public(event):
+        return {k: v for k, v in event.items() if not k.startswith("_")}
+
+    def insert(self, calendarId, body, **kwargs):
+        def call():
+            event_id = body.get("id") or uuid.uuid4().hex
+            event = dict(
+                body,
+                id=event_id,
+                status="confirmed",
+                htmlLink=f"https://calendar.fake/event?eid={event_id}",
+            )
+            return self._store(calendarId, event)
+
+        return FakeRequest(self.service, call)
+
+    def get(self, calendarId, eventId, **kwargs):
+        return FakeRequest(
+            self.service, lambda: self._public(self._event(calendarId, eventId))
+        )
+
+    def update(self, calendarId, eventId, body, **kwargs):
+        def call():
+            current = self._event(calendarId, eventId)
+            event = dict(body, id=eventId, status="confirmed")
+            event["htmlLink"] = current["htmlLink"]
+            return self._store(calendarId, event)
+
+        return FakeRequest(self.service, call)
+
+    def patch(self, calendarId, eventId, body, **kwargs):
+        def call():
+            event = dict(self._event(calendarId, eventId), **body)
+            return self._store(calendarId, event)
+
+        return FakeRequest(self.service, call)
+
+    def delete(self, calendarId, eventId, **kwargs):
+        def call():
+            event = dict(self._event(calendarId, eventId), status="cancelled")
+            self._store(calendarId, event)
+            return ""
+
+        return FakeRequest(self.service, call)
+
+    def move(self, calendarId, eventId, destination, **kwargs):
+        def call():
+            event = self._event(calendarId, eventId)
+            self._store(calendarId, dict(event, status="cancelled"))
+            return self._store(destination, dict(event, status="confirmed"))
+
+        return FakeRequest(self.service, call)
+
+    def list(self, calendarId, syncToken=None, showDeleted=False, **kwargs):
+        """Full listing returns nextSyncToken, listing with syncToken returns only events changed since,
+        including deleted ones as cancelled, like the Google API"""
+
+        def call():
+            if syncToken is not None and not syncToken.isdigit():
+                raise _http_error(410, "Sync token is no longer valid")
+            since = int(syncToken) if syncToken else 0
+            next_token = self.service.last_sequence
+            items = [
+                self._public(event)
+                for event in self._calendar(calendarId).values()
+                if event["_sequence"] > since
+                and (syncToken or showDeleted or event["status"] != "cancelled")
+            ]
+            return {"items": items, "nextSyncToken": str(next_token)}
+
+        return FakeRequest(self.service, call)
+
+
+class FakeCalendarService:
+    """In memory Google Calendar service resource, latency in seconds is slept per round trip,
+    error_rate is the share of calls failing with HttpError 503"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calendars = {}
+        self.last_sequence = 0
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def next_sequence(self):
+        """Change counter used for etags and sync tokens"""
+        with self.lock:
+            self.last_sequence += 1
+            return self.last_sequence
+
+    def inject_error(self):
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise _http_error(503, "Injected backend error")
+
+    def round_trip(self):
+        """Blocks like the real client would, then fails at configured rate"""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.inject_error()
+
+    def seed_events(self, events):
+        """Stores (calendar_id, event_id, attendee emails) tuples as existing events without
+        round trips, mirrors classes of generated datasets"""
+        store = FakeEvents(self)
+        for calendar_id, event_id, emails in events:
+            event = {
+                "id": event_id,
+                "status": "confirmed",
+                "htmlLink": f"https://calendar.fake/event?eid={event_id}",
+                "attendees": [{"email": email} for email in emails],
+            }
+            store._store(calendar_id, event)
+
+    def events(self):
+        return FakeEvents(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self, callback)
+
+
+class FakeCalendarServiceManager(CalendarBackend):
+    """Offline calendar backend for tests and load benchmarks, always logged in"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = None):
+        self.service = FakeCalendarService(latency, error_rate, seed)
+
+    def get_calendar_service(self):
+        return self.service
+
+    async def login(self):
+        return {"message": "Logged in"}
+
+    async def callback(self, code: str, state: str):
+        return {"message": "Logged in"}
+
+    async def logout(self):
+        return {"message": "logged out"}
@@ -0,0 +1,232 @@
+import abc
+import datetime
+import json
+import os
+
+from sqlalchemy import delete, insert, select
+from starlette.concurrency import run_in_threadpool
+
+from api.db.db_manager import AsyncSessionLocal
+from api.db.models import CalendarTokens, OAuthLogins
+from api.logger import api_logger
+
+SCOPES = ["https://www.googleapis.com/auth/calendar"]
+
+# file keeps token.json on local disk, db shares the token between workers and nodes,
+# service_account uses a service account key with domain wide delegation, no login needed
+TOKEN_STORE = os.getenv("TOKEN_STORE", "file")
+
+# name of the stored token, schools sharing a database keep one token each
+CALENDAR_TENANT = os.getenv("CALENDAR_TENANT", "default")
+
+# comma separated Fernet keys encrypting tokens stored in the db, the first one encrypts,
+# all of them decrypt so keys can be rotated, unset stores tokens as plain JSON
+TOKEN_ENCRYPTION_KEYS = os.getenv("TOKEN_ENCRYPTION_KEYS")
+
+# service account key file and the Google Workspace user whose calendars it acts on
+GOOGLE_SERVICE_ACCOUNT_FILE = os.getenv(
+    "GOOGLE_SERVICE_ACCOUNT_FILE", "api/Credentials/service_account.json"
+)
+GOOGLE_DELEGATED_USER = os.getenv("GOOGLE_DELEGATED_USER")
+
+# seconds a started login can be completed
+OAUTH_STATE_TTL = 600
+
+
+async def save_login(state: str, code_verifier: str):
+    """Stores a started OAuth login in the database so any worker can finish it,
+    drops expired ones"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=OAUTH_STATE_TTL)
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(OAuthLogins).where(OAuthLogins.created_at < cutoff)
+        )
+        await session.execute(
+            insert(OAuthLogins).values(state=state, code_verifier=code_verifier)
+        )
+        await session.commit()
+
+
+async def pop_login(state: str):
+    """Removes a started login and returns its code verifier, None if the state is
+    unknown, expired or already used"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=OAUTH_STATE_TTL)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            delete(OAuthLogins)
+            .where(OAuthLogins.state == state)
+            .returning(OAuthLogins.code_verifier, OAuthLogins.created_at)
+        )
+        login = result.first()
+        await session.commit()
+    if login is None or login.created_at < cutoff:
+        return None
+    return login
+
+
+class TokenStore(abc.ABC):
+    """Interface of credential stores, load returns the stored token info or None if not
+    logged in, credentials builds Google credentials from it, save and delete manage the
+    stored OAuth token"""
+
+    # False when credentials come from configuration instead of a login
+    needs_login = True
+
+    @abc.abstractmethod
+    async def load(self): ...
+
+    @abc.abstractmethod
+    async def save(self, token_json: str): ...
+
+    @abc.abstractmethod
+    async def delete(self): ...
+
+    def credentials(self, token_info: dict):
+        # google libraries are imported on first use to keep startup fast
+        from google.oauth2.credentials import Credentials
+
+        return Credentials.from_authorized_user_info(token_info, SCOPES)
+
+
+def _read_json(path: str):
+    """Parsed JSON file, None if it does not exist, blocking"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_text(path: str, text: str):
+    with open(path, "w") as file:
+        file.write(text)
+
+
+def _remove(path: str):
+    """Returns False if there was no file, blocking"""
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class FileTokenStore(TokenStore):
+    """Stores OAuth token as json file, only usable with a single API process,
+    file access runs in the thread pool"""
+
+    def __init__(self, path: str = "api/Credentials/token.json"):
+        self.path = os.path.abspath(path)
+
+    async def load(self):
+        return await run_in_threadpool(_read_json, self.path)
+
+    async def save(self, token_json: str):
+        await run_in_threadpool(_write_text, self.path, token_json)
+
+    async def delete(self):
+        """Returns False if there was no token"""
+        return await run_in_threadpool(_remove, self.path)
+
+
+def _fernet():
+    from cryptography.fernet import Fernet, MultiFernet
+
+    return MultiFernet([Fernet(key) for key in TOKEN_ENCRYPTION_KEYS.split(",")])
+
+
+class DatabaseTokenStore(TokenStore):
+    """Stores OAuth token in calendar_tokens table shared by all workers, encrypted when
+    TOKEN_ENCRYPTION_KEYS is set"""
+
+    def __init__(self, name: str = CALENDAR_TENANT):
+        self.name = name
+
+    async def load(self):
+        async with AsyncSessionLocal() as session:
+            query = select(CalendarTokens.token).filter(
+                CalendarTokens.name == self.name
+            )
+            token = (await session.execute(query)).scalar()
+        if token is None:
+            return None
+        # tokens saved before encryption was configured are plain JSON
+        if not token.startswith("{"):
+            if not TOKEN_ENCRYPTION_KEYS:
+                api_logger.error(
+                    "Token %s is encrypted, set TOKEN_ENCRYPTION_KEYS", self.name
+                )
+                return None
+            token = _fernet().decrypt(token.encode()).decode()
+        return json.loads(token)
+
+    async def save(self, token_json: str):
+        if TOKEN_ENCRYPTION_KEYS:
+            token_json = _fernet().encrypt(token_json.encode()).decode()
+        async with AsyncSessionLocal() as session:
+            if session.bind.dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            # one statement, workers saving a refreshed token at once dont race on the name
+            query = upsert(CalendarTokens).values(
+                name=self.name, token=token_json, updated_at=datetime.datetime.now()
+            )
+            query = query.on_conflict_do_update(
+                index_elements=[CalendarTokens.name],
+                set_={
+                    "token": query.excluded.token,
+                    "updated_at": query.excluded.updated_at,
+                },
+            )
+            await session.execute(query)
+            await session.commit()
+
+    async def delete(self):
+        """Returns False if there was no token"""
+        async with AsyncSessionLocal() as session:
+            query = delete(CalendarTokens).where(CalendarTokens.name == self.name)
+            result = await session.execute(query)
+            await session.commit()
+        return result.rowcount > 0
+
+
+class ServiceAccountStore(TokenStore):
+    """Service account acting on delegated_user's calendars through domain wide delegation,
+    the key file is read once and tokens are minted from it, nothing is stored"""
+
+    needs_login = False
+
+    def __init__(
+        self,
+        path: str = GOOGLE_SERVICE_ACCOUNT_FILE,
+        delegated_user: str = GOOGLE_DELEGATED_USER,
+    ):
+        self.path = os.path.abspath(path)
+        self.delegated_user = delegated_user
+        self.key_info = None
+
+    async def load(self):
+        if self.key_info is None:
+            self.key_info = await run_in_threadpool(_read_json, self.path)
+        return self.key_info
+
+    async def save(self, token_json: str):
+        pass
+
+    async def delete(self):
+        return False
+
+    def credentials(self, key_info: dict):
+        from google.oauth2 import service_account
+
+        return service_account.Credentials.from_service_account_info(
+            key_info, scopes=SCOPES, subject=self.delegated_user
+        )
+
+
+def get_token_store(tenant: str = CALENDAR_TENANT):
+    if TOKEN_STORE == "service_account":
+        return ServiceAccountStore()
+    if TOKEN_STORE == "db":
+        return DatabaseTokenStore(tenant)
+    return FileTokenStore()
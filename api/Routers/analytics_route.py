@@ -0,0 +1,47 @@
+from datetime import date
+from typing import List
+
+from fastapi import APIRouter, status
+
+from api.db.db_manager import read_db_dependancy
+
+from ..schemas import TeacherLoadResponse, UtilizationResponse
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+async def _get_analytics(db, start_date, end_date, refresh):
+    """Imports analytics and numpy on first request instead of at startup"""
+    from .. import analytics
+
+    return await analytics.get_analytics(db, start_date, end_date, refresh)
+
+
+@router.get(
+    "/utilization", status_code=status.HTTP_200_OK, response_model=UtilizationResponse
+)
+async def get_utilization(
+    db: read_db_dependancy,
+    start_date: date = None,
+    end_date: date = None,
+    refresh: bool = False,
+):
+    """Returns class fill rates, fill rate histogram and weekly trend for classes starting in date range, cached per period"""
+    result = await _get_analytics(db, start_date, end_date, refresh)
+    return result["utilization"]
+
+
+@router.get(
+    "/teacher_load",
+    status_code=status.HTTP_200_OK,
+    response_model=List[TeacherLoadResponse],
+)
+async def get_teacher_load(
+    db: read_db_dependancy,
+    start_date: date = None,
+    end_date: date = None,
+    refresh: bool = False,
+):
+    """Returns classes, seats, reservations, work hours and invoiced amount per teacher in date range, cached per period"""
+    result = await _get_analytics(db, start_date, end_date, refresh)
+    return result["teacher_load"]
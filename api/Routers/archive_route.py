@@ -0,0 +1,30 @@
+from datetime import date
+from typing import List
+
+from fastapi import APIRouter, status
+
+from api.db.db_manager import db_dependancy
+
+from .. import archive
+from ..schemas import ArchiveRunResponse, ArchiveStatusResponse
+
+router = APIRouter(prefix="/archive", tags=["Archive"])
+
+
+@router.post("/run", status_code=status.HTTP_200_OK, response_model=ArchiveRunResponse)
+async def run_archival(db: db_dependancy, before: date = None):
+    """Move classes, reservations, paid invoices and paid work hours older than before
+    (default ARCHIVE_AFTER_DAYS ago) to archive tables"""
+    counts = await archive.archive_history(db, before)
+    await db.commit()
+    return counts
+
+
+@router.get(
+    "/status",
+    status_code=status.HTTP_200_OK,
+    response_model=List[ArchiveStatusResponse],
+)
+async def get_archive_status(db: db_dependancy):
+    """Returns hot and archived row counts per table"""
+    return await archive.get_archive_status(db)
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, status
+from fastapi.responses import RedirectResponse
 
 from api.Calendar_utils.calendar_service_manager import service_dependancy
 
@@ -7,11 +8,20 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 @router.get("/login", status_code=status.HTTP_200_OK)
 async def login(manager: service_dependancy):
-    """Redirects to google consent screen, builds calendar service"""
-    return manager.login()
+    """Redirects to google consent screen, Google then returns to /auth/callback"""
+    result = await manager.login()
+    if "authorization_url" in result:
+        return RedirectResponse(result["authorization_url"])
+    return result
+
+
+@router.get("/callback", status_code=status.HTTP_200_OK)
+async def callback(manager: service_dependancy, code: str, state: str):
+    """Google redirects here after consent, stores the token"""
+    return await manager.callback(code, state)
 
 
 @router.get("/logout", status_code=status.HTTP_200_OK)
 async def logout(manager: service_dependancy):
-    """Logout route, deletes token.json"""
-    return manager.logout()
+    """Logout route, deletes stored token"""
+    return await manager.logout()
@@ -0,0 +1,19 @@
+from datetime import date
+
+from fastapi import APIRouter, status
+
+from api.db.db_manager import db_dependancy
+
+from .. import billing
+from ..schemas import BillingRunResponse
+
+router = APIRouter(prefix="/billing", tags=["Billing"])
+
+
+@router.post("/run", status_code=status.HTTP_200_OK, response_model=BillingRunResponse)
+async def run_billing(db: db_dependancy, period: date = None):
+    """Create missing tuition invoices for every enrollment in recurring classes running in the
+    month of period (default this month), safe to repeat"""
+    counts = await billing.bill_period(db, period)
+    await db.commit()
+    return counts
@@ -0,0 +1,25 @@
+from typing import List
+
+from fastapi import APIRouter, Query, Request, status
+from fastapi.responses import StreamingResponse
+
+from .. import changefeed
+
+router = APIRouter(prefix="/changes", tags=["Changes"])
+
+
+@router.get("/stream", status_code=status.HTTP_200_OK)
+async def stream_changes(
+    request: Request,
+    class_id: List[int] = Query(default=None),
+    teacher_id: List[int] = Query(default=None),
+):
+    """Server sent events of class and reservation changes (class.created, class.updated,
+    class.deleted, reservation.added, reservation.removed) for given classes or teachers,
+    all changes without filters. Reservation events carry enrolled and class_size seats
+    """
+    return StreamingResponse(
+        changefeed.stream(request, class_id, teacher_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,12 +1,13 @@
-from typing import List
+from typing import Annotated, List
 
 from fastapi import APIRouter, Query, status
 
 from api.Calendar_utils.calendar_service_manager import service_dependancy
-from api.db.db_manager import db_dependancy
+from api.db.db_manager import db_dependancy, read_db_dependancy
 
 from .. import crud
-from ..schemas import ClassData, ClassResponse
+from ..filters import page_response
+from ..schemas import BulkDeleteResponse, ClassData, ClassFilters, ClassResponse
 
 router = APIRouter(prefix="/classes", tags=["Classes"])
 
@@ -24,17 +25,12 @@ async def add_new_class(
 
 @router.get("/all", status_code=status.HTTP_200_OK, response_model=List[ClassResponse])
 async def get_all_classes(
-    db: db_dependancy,
-    class_name: str = None,
-    target_date=None,
-    description: str = None,
-    page: int = Query(ge=1),
-    limit: int = Query(10, gt=0),
+    db: read_db_dependancy, filters: Annotated[ClassFilters, Query()]
 ):
-    """Returns a list of classes,filter by class name,target_date or description, pagination via page and limit parameters"""
-    return await crud.get_all_classes(
-        db, page, limit, class_name, target_date, description
-    )
+    """Returns a list of classes,filter by part of class name or description,target date,start range or teachers,
+    sort by sort field, pagination via page and limit parameters, include_archived adds classes of past terms
+    """
+    return page_response(await crud.get_all_classes(db, filters))
 
 
 @router.put("/update", status_code=status.HTTP_201_CREATED)
@@ -54,3 +50,14 @@ async def delete_class(
 ):
     """Delete class via ID"""
     return await crud.delete_class(db, id, manager)
+
+
+@router.delete(
+    "/delete_bulk", status_code=status.HTTP_200_OK, response_model=BulkDeleteResponse
+)
+async def delete_classes(
+    db: db_dependancy, manager: service_dependancy, ids: List[int] = Query(min_length=1)
+):
+    """Delete many classes in one statement with their reservations, invoices and calendar events"""
+    deleted = await crud.delete_classes(db, ids, manager)
+    return {"deleted_ids": [row.id for row in deleted]}
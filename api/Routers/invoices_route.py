@@ -1,12 +1,21 @@
-from typing import List
+from typing import Annotated, List
 
-from fastapi import APIRouter, Query, status
+from fastapi import APIRouter, Body, Query, Request, status
 
-from api.db.db_manager import db_dependancy
+from api.db.db_manager import db_dependancy, read_db_dependancy
 from api.db.models import Invoices
 
 from .. import crud
-from ..schemas import InvoiceData, InvoiceResponse, StudentResponse
+from ..filters import page_response
+from ..schemas import (
+    BulkDeleteResponse,
+    InvoiceData,
+    InvoiceFilters,
+    InvoiceResponse,
+    PaymentLine,
+    ReconciliationResponse,
+    StudentResponse,
+)
 
 router = APIRouter(prefix="/invoices", tags=["Invoices"])
 
@@ -16,21 +25,19 @@ router = APIRouter(prefix="/invoices", tags=["Invoices"])
 )
 async def add_new_invoice(db: db_dependancy, invoice: InvoiceData):
     """Add new invoice to db using InvoiceData schema, returns item"""
-    return await crud.add_item(db, invoice, Invoices)
+    return await crud.add_new_invoice(db, invoice)
 
 
 @router.get(
     "/all", status_code=status.HTTP_200_OK, response_model=List[InvoiceResponse]
 )
 async def get_all_invoices(
-    db: db_dependancy,
-    payment_status: bool = None,
-    invoice_date=None,
-    page: int = Query(ge=1),
-    limit: int = Query(10, gt=0),
+    db: read_db_dependancy, filters: Annotated[InvoiceFilters, Query()]
 ):
-    """Returns a list of invoices,filter by payment status, invoice date, pagination via page and limit parameters"""
-    return await crud.get_all_invoices(db, page, limit, payment_status, invoice_date)
+    """Returns a list of invoices,filter by payment status,invoice date or date range,students,classes or amount range,
+    sort by sort field, pagination via page and limit parameters, include_archived adds archived invoices
+    """
+    return page_response(await crud.get_all_invoices(db, filters))
 
 
 @router.put("/update", status_code=status.HTTP_201_CREATED)
@@ -38,17 +45,17 @@ async def update_invoice(
     db: db_dependancy, invoice: InvoiceData, id: int = Query(gt=0)
 ):
     """Update invoice model via ID, use InvoiceData schema"""
-    return await crud.update_item(db, invoice, id, Invoices)
+    return await crud.update_invoice(db, invoice, id)
 
 
 @router.delete("/delete", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_invoice(db: db_dependancy, id: int = Query(gt=0)):
     """Delete invoice via ID"""
-    return await crud.delete_item(db, id, Invoices)
+    return await crud.delete_invoice(db, id)
 
 
 @router.get("/student", status_code=status.HTTP_200_OK, response_model=StudentResponse)
-async def get_invoice_student(db: db_dependancy, id: int = Query(gt=0)):
+async def get_invoice_student(db: read_db_dependancy, id: int = Query(gt=0)):
     """Get student object linked to invoice via invoice ID"""
     return await crud.get_invoice_student(db, id)
 
@@ -59,3 +66,44 @@ async def get_invoice_student(db: db_dependancy, id: int = Query(gt=0)):
 async def pay_student_invoice(db: db_dependancy, id: int = Query(gt=0)):
     """Mark student invoice as payed"""
     return await crud.pay_invoice(db, id)
+
+
+@router.post(
+    "/reconcile",
+    status_code=status.HTTP_200_OK,
+    response_model=ReconciliationResponse,
+)
+async def reconcile_payments(
+    db: db_dependancy, payments: List[PaymentLine] = Body(min_length=1)
+):
+    """Apply bank statement payments to unpaid invoices in one transaction, match by invoice_id or
+    INV-<id> in reference, reports fully paid, partial, overpaid and unmatched payments
+    """
+    return await crud.reconcile_payments(db, payments)
+
+
+@router.post(
+    "/reconcile_csv",
+    status_code=status.HTTP_200_OK,
+    response_model=ReconciliationResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {"text/csv": {"example": "invoice_id,reference,amount,date\n"}}
+        }
+    },
+)
+async def reconcile_payments_csv(db: db_dependancy, request: Request):
+    """Same as /reconcile for a CSV bank statement sent as request body,
+    columns invoice_id or reference, amount and date"""
+    content = (await request.body()).decode("utf-8-sig")
+    payments = crud.read_payment_csv(content)
+    return await crud.reconcile_payments(db, payments)
+
+
+@router.delete(
+    "/delete_bulk", status_code=status.HTTP_200_OK, response_model=BulkDeleteResponse
+)
+async def delete_invoices(db: db_dependancy, ids: List[int] = Query(min_length=1)):
+    """Delete many invoices in one statement"""
+    deleted = await crud.delete_items(db, ids, Invoices)
+    return {"deleted_ids": [row.id for row in deleted]}
@@ -0,0 +1,51 @@
+from typing import List
+
+from fastapi import APIRouter, Query, status
+
+from api.db.db_manager import db_dependancy, read_db_dependancy
+
+from .. import scheduler
+from ..schemas import JobResponse, JobRunRequest, JobRunResponse
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+@router.get("/", status_code=status.HTTP_200_OK, response_model=List[JobResponse])
+async def get_jobs(db: read_db_dependancy):
+    """Returns background jobs with schedule, next run, worker running them and latest run"""
+    return await scheduler.get_jobs(db)
+
+
+@router.post(
+    "/{name}/run",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=JobRunResponse,
+)
+async def request_job_run(db: db_dependancy, name: str, run: JobRunRequest = None):
+    """Queues a run of job name, one worker runs it in the background, poll /jobs/runs/{id}"""
+    return await scheduler.request_run(db, name, run.params if run else {})
+
+
+@router.get(
+    "/{name}/runs",
+    status_code=status.HTTP_200_OK,
+    response_model=List[JobRunResponse],
+)
+async def get_job_runs(
+    db: read_db_dependancy,
+    name: str,
+    page: int = Query(ge=1),
+    limit: int = Query(default=10, ge=1, le=100),
+):
+    """Returns one page of runs of job name, newest first"""
+    return await scheduler.get_runs(db, name, page, limit)
+
+
+@router.get(
+    "/runs/{run_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=JobRunResponse,
+)
+async def get_job_run(db: read_db_dependancy, run_id: int):
+    """Returns status and result of one job run"""
+    return await scheduler.get_run(db, run_id)
@@ -0,0 +1,31 @@
+from typing import List
+
+from fastapi import APIRouter, status
+
+from .. import singleflight
+from ..db.db_manager import get_compile_cache_stats
+from ..schemas import CompileCacheStats, SingleFlightStats
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get(
+    "/single_flight",
+    status_code=status.HTTP_200_OK,
+    response_model=List[SingleFlightStats],
+)
+async def get_single_flight_stats():
+    """Returns per crud read how many calls ran a query and how many shared one already in flight,
+    counted since worker start"""
+    return singleflight.get_stats()
+
+
+@router.get(
+    "/compile_cache",
+    status_code=status.HTTP_200_OK,
+    response_model=List[CompileCacheStats],
+)
+async def get_compile_cache():
+    """Returns per engine how many statements reused a compiled form and how many were compiled,
+    counted since worker start"""
+    return get_compile_cache_stats()
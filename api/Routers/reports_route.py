@@ -0,0 +1,65 @@
+from datetime import date
+from typing import List, Literal
+
+from fastapi import APIRouter, Query, status
+
+from api.db.db_manager import db_dependancy, read_db_dependancy
+
+from .. import crud
+from ..schemas import (
+    OutstandingBalanceResponse,
+    PayrollReportResponse,
+    RevenueReportResponse,
+)
+
+router = APIRouter(prefix="/reports", tags=["Reports"])
+
+
+@router.get(
+    "/revenue",
+    status_code=status.HTTP_200_OK,
+    response_model=List[RevenueReportResponse],
+)
+async def get_revenue_report(
+    db: read_db_dependancy,
+    group_by: Literal["class", "teacher", "student", "month"] = "month",
+    start_date: date = None,
+    end_date: date = None,
+):
+    """Returns invoiced, payed and outstanding totals grouped by class, teacher, student or month, optionaly filtered by invoice date range"""
+    return await crud.get_revenue_report(db, group_by, start_date, end_date)
+
+
+@router.get(
+    "/outstanding",
+    status_code=status.HTTP_200_OK,
+    response_model=List[OutstandingBalanceResponse],
+)
+async def get_outstanding_balances(
+    db: read_db_dependancy,
+    page: int = Query(ge=1),
+    limit: int = Query(10, gt=0),
+):
+    """Returns students with not payed invoices, highest balance first, pagination via page and limit parameters"""
+    return await crud.get_outstanding_balances(db, page, limit)
+
+
+@router.get(
+    "/payroll",
+    status_code=status.HTTP_200_OK,
+    response_model=List[PayrollReportResponse],
+)
+async def get_payroll_report(
+    db: read_db_dependancy,
+    group_by: Literal["teacher", "month"] = "month",
+    start_date: date = None,
+    end_date: date = None,
+):
+    """Returns paycheck totals grouped by teacher or month, optionaly filtered by paycheck creation date range"""
+    return await crud.get_payroll_report(db, group_by, start_date, end_date)
+
+
+@router.post("/rebuild_rollups", status_code=status.HTTP_201_CREATED)
+async def rebuild_report_rollups(db: db_dependancy):
+    """Rebuilds daily report rollup tables from invoices and paychecks"""
+    return await crud.rebuild_report_rollups(db)
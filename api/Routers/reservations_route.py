@@ -1,12 +1,18 @@
+from decimal import Decimal
 from typing import List
 
 from fastapi import APIRouter, Query, status
 
 from api.Calendar_utils.calendar_service_manager import service_dependancy
-from api.db.db_manager import db_dependancy
+from api.db.db_manager import db_dependancy, read_db_dependancy
 
 from .. import crud
-from ..schemas import ClassResponse, ReservationResponse
+from ..schemas import (
+    ClassResponse,
+    ReservationRemoval,
+    ReservationRemovalResponse,
+    ReservationResponse,
+)
 
 router = APIRouter(prefix="/reservations", tags=["Reservations"])
 
@@ -19,7 +25,7 @@ async def add_reservation(
     manager: service_dependancy,
     class_id: int = Query(gt=0),
     student_id: int = Query(gt=0),
-    amount: float = Query(gt=0),
+    amount: Decimal = Query(gt=0, max_digits=12, decimal_places=2),
 ):
     """Add new class reservation, link student with classes, returns class with all students via
     ReservationResponse"""
@@ -29,7 +35,7 @@ async def add_reservation(
 @router.get(
     "/all_students", status_code=status.HTTP_200_OK, response_model=ReservationResponse
 )
-async def get_class_reservations(db: db_dependancy, class_id: int = Query(gt=0)):
+async def get_class_reservations(db: read_db_dependancy, class_id: int = Query(gt=0)):
     return await crud.get_class_reservations(db, class_id)
 
 
@@ -49,8 +55,24 @@ async def remove_student_from_reservations(
     )
 
 
+@router.put(
+    "/remove_bulk",
+    status_code=status.HTTP_200_OK,
+    response_model=ReservationRemovalResponse,
+)
+async def remove_reservations(
+    db: db_dependancy, manager: service_dependancy, removal: ReservationRemoval
+):
+    """Remove many reservations in one transaction, class IDs alone cancel whole rosters"""
+    return await crud.remove_reservations(
+        db, manager, removal.class_ids, removal.student_ids
+    )
+
+
 @router.get(
     "/student", status_code=status.HTTP_200_OK, response_model=List[ClassResponse]
 )
-async def get_student_reservations(db: db_dependancy, student_id: int = Query(gt=0)):
+async def get_student_reservations(
+    db: read_db_dependancy, student_id: int = Query(gt=0)
+):
     return await crud.get_student_classes(db, student_id)
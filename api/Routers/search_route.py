@@ -0,0 +1,22 @@
+from typing import List, Literal
+
+from fastapi import APIRouter, Query, status
+
+from api.db.db_manager import read_db_dependancy
+
+from .. import search
+from ..schemas import SearchResult
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+
+@router.get("", status_code=status.HTTP_200_OK, response_model=List[SearchResult])
+async def search_all(
+    db: read_db_dependancy,
+    q: str = Query(min_length=2, max_length=100),
+    types: List[Literal["students", "teachers", "classes"]] = Query(None),
+    limit: int = Query(10, gt=0, le=50),
+):
+    """Typeahead search over students, teachers and classes, word prefix matches first then fuzzy matches,
+    filter by types"""
+    return await search.search(db, q, types, limit)
@@ -1,12 +1,13 @@
-from typing import List
+from typing import Annotated, List
 
 from fastapi import APIRouter, Query, status
 
-from api.db.db_manager import db_dependancy
+from api.db.db_manager import db_dependancy, read_db_dependancy
 from api.db.models import Students
 
 from .. import crud
-from ..schemas import StudentData, StudentResponse
+from ..filters import page_response
+from ..schemas import BulkDeleteResponse, StudentData, StudentFilters, StudentResponse
 
 router = APIRouter(prefix="/students", tags=["Students"])
 
@@ -24,15 +25,11 @@ async def add_new_student(db: db_dependancy, student: StudentData):
     "/all", status_code=status.HTTP_200_OK, response_model=List[StudentResponse]
 )
 async def get_all_students(
-    db: db_dependancy,
-    last_name: str = None,
-    email: str = None,
-    phone_num: str = None,
-    page: int = Query(ge=1),
-    limit: int = Query(10, gt=0),
+    db: read_db_dependancy, filters: Annotated[StudentFilters, Query()]
 ):
-    """Returns a list of students,filter by last name,email or phone number, pagination via page and limit parameters"""
-    return await crud.get_all_students(db, page, limit, last_name, email, phone_num)
+    """Returns a list of students,filter by last name,email,phone number,birth year range or IDs, sort by sort field,
+    pagination via page and limit parameters"""
+    return page_response(await crud.get_all_students(db, filters))
 
 
 @router.put("/update", status_code=status.HTTP_201_CREATED)
@@ -47,3 +44,12 @@ async def update_student(
 async def delete_student(db: db_dependancy, id: int = Query(gt=0)):
     """Delete student via ID"""
     return await crud.delete_item(db, id, Students)
+
+
+@router.delete(
+    "/delete_bulk", status_code=status.HTTP_200_OK, response_model=BulkDeleteResponse
+)
+async def delete_students(db: db_dependancy, ids: List[int] = Query(min_length=1)):
+    """Delete many students in one statement, reservations and invoices are deleted with them"""
+    deleted = await crud.delete_items(db, ids, Students)
+    return {"deleted_ids": [row.id for row in deleted]}
@@ -1,13 +1,21 @@
 from datetime import date
-from typing import List
+from typing import Annotated, List
 
 from fastapi import APIRouter, Query, status
 
-from api.db.db_manager import db_dependancy
+from api.db.db_manager import db_dependancy, read_db_dependancy
 from api.db.models import Paychecks, TeacherHours
 
 from .. import crud
-from ..schemas import PaycheckResponse, TeacherHoursData, TeacherHoursResponse
+from ..filters import page_response
+from ..schemas import (
+    BulkDeleteResponse,
+    PaycheckFilters,
+    PaycheckResponse,
+    TeacherHoursData,
+    TeacherHoursResponse,
+    WorkHoursFilters,
+)
 
 router = APIRouter(prefix="/paycheck", tags=["Teacher paycheck"])
 
@@ -29,16 +37,12 @@ async def add_work_hours(db: db_dependancy, teacher_data: TeacherHoursData):
     response_model=List[TeacherHoursResponse],
 )
 async def get_work_hours(
-    db: db_dependancy,
-    start_date: date = None,
-    end_date: date = None,
-    teacher_id: int = None,
-    page: int = Query(gt=0),
-    limit: int = Query(gt=0, default=20),
+    db: read_db_dependancy, filters: Annotated[WorkHoursFilters, Query()]
 ):
-    """Returns a list of teacher work hours filter by teacher id , and combination of start and end times, paginated via page and limit query params"""
+    """Returns a list of teacher work hours filter by teachers and start and end date, sort by sort field,
+    paginated via page and limit query params, include_archived adds archived hours"""
 
-    return await crud.get_work_hours(db, page, limit, teacher_id, start_date, end_date)
+    return page_response(await crud.get_work_hours(db, filters))
 
 
 @router.delete("/delete_hours", status_code=status.HTTP_204_NO_CONTENT)
@@ -66,25 +70,18 @@ async def generate_paycheck(
     response_model=List[PaycheckResponse],
 )
 async def get_all_paychecks_for_teacher(
-    db: db_dependancy,
-    is_payed: bool = None,
-    start_date: date = None,
-    end_date: date = None,
-    teacher_id: int = None,
-    page: int = Query(gt=0),
-    limit: int = Query(gt=0, default=20),
+    db: read_db_dependancy, filters: Annotated[PaycheckFilters, Query()]
 ):
-    """Returns list of all paychecks, optionaly filtered by teacher id, payment status, and combination of start and end date, paginated via page and limit query params"""
+    """Returns list of all paychecks, optionaly filtered by teachers, payment status, start and end date, sort by sort field,
+    paginated via page and limit query params"""
 
-    return await crud.get_all_paychecks(
-        db, page, limit, teacher_id, is_payed, start_date, end_date
-    )
+    return page_response(await crud.get_all_paychecks(db, filters))
 
 
 @router.delete("/delete_paycheck", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_paycheck(db: db_dependancy, paycheck_id: int = Query(gt=0)):
     """Deletes paycheck based on paycheck ID"""
-    return await crud.delete_item(db, paycheck_id, Paychecks)
+    return await crud.delete_paycheck(db, paycheck_id)
 
 
 @router.put(
@@ -93,3 +90,27 @@ async def delete_paycheck(db: db_dependancy, paycheck_id: int = Query(gt=0)):
 async def pay_paycheck(db: db_dependancy, paycheck_id: int = Query(gt=0)):
     """Pay paycheck, change payment status to true"""
     return await crud.pay_paycheck(db, paycheck_id)
+
+
+@router.delete(
+    "/delete_hours_bulk",
+    status_code=status.HTTP_200_OK,
+    response_model=BulkDeleteResponse,
+)
+async def delete_work_hours_bulk(
+    db: db_dependancy, ids: List[int] = Query(min_length=1)
+):
+    """Delete many work hour entries in one statement"""
+    deleted = await crud.delete_items(db, ids, TeacherHours)
+    return {"deleted_ids": [row.id for row in deleted]}
+
+
+@router.delete(
+    "/delete_paycheck_bulk",
+    status_code=status.HTTP_200_OK,
+    response_model=BulkDeleteResponse,
+)
+async def delete_paychecks(db: db_dependancy, ids: List[int] = Query(min_length=1)):
+    """Delete many paychecks in one statement"""
+    deleted = await crud.delete_items(db, ids, Paychecks)
+    return {"deleted_ids": [row.id for row in deleted]}
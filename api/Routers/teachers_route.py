@@ -1,12 +1,19 @@
-from typing import List
+from typing import Annotated, List
 
 from fastapi import APIRouter, Query, status
 
-from api.db.db_manager import db_dependancy
+from api.db.db_manager import db_dependancy, read_db_dependancy
 from api.db.models import Teachers
 
 from .. import crud
-from ..schemas import ClassResponse, TeacherData, TeacherResponse
+from ..filters import page_response
+from ..schemas import (
+    BulkDeleteResponse,
+    ClassResponse,
+    TeacherData,
+    TeacherFilters,
+    TeacherResponse,
+)
 
 router = APIRouter(prefix="/teachers", tags=["Teachers"])
 
@@ -24,15 +31,11 @@ async def add_new_class(db: db_dependancy, teacher: TeacherData):
     "/all", status_code=status.HTTP_200_OK, response_model=List[TeacherResponse]
 )
 async def get_all_teachers(
-    db: db_dependancy,
-    last_name: str = None,
-    email: str = None,
-    phone_num: str = None,
-    page: int = Query(ge=1),
-    limit: int = Query(10, gt=0),
+    db: read_db_dependancy, filters: Annotated[TeacherFilters, Query()]
 ):
-    """Returns a list of teachers,filter by last name,email or phone number, pagination via page and limit parameters"""
-    return await crud.get_all_teachers(db, page, limit, last_name, email, phone_num)
+    """Returns a list of teachers,filter by last name,email,phone number,hire date range or IDs, sort by sort field,
+    pagination via page and limit parameters"""
+    return page_response(await crud.get_all_teachers(db, filters))
 
 
 @router.put("/update", status_code=status.HTTP_201_CREATED)
@@ -52,6 +55,15 @@ async def delete_student(db: db_dependancy, id: int = Query(gt=0)):
 @router.get(
     "/classes", status_code=status.HTTP_200_OK, response_model=List[ClassResponse]
 )
-async def get_teacher_classes(db: db_dependancy, teacher_id: int = Query(gt=0)):
+async def get_teacher_classes(db: read_db_dependancy, teacher_id: int = Query(gt=0)):
     """Returns teacher model with loaded classes using ClassResponse schema"""
     return await crud.get_all_teacher_classes(db, teacher_id)
+
+
+@router.delete(
+    "/delete_bulk", status_code=status.HTTP_200_OK, response_model=BulkDeleteResponse
+)
+async def delete_teachers(db: db_dependancy, ids: List[int] = Query(min_length=1)):
+    """Delete many teachers in one statement with their hours and paychecks, 409 while teachers still lead classes"""
+    deleted = await crud.delete_items(db, ids, Teachers)
+    return {"deleted_ids": [row.id for row in deleted]}
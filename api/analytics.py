@@ -0,0 +1,234 @@
+import os
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import BigInteger, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.cache import get_cache
+from api.db.models import Classes, Invoices, StudentsClasses, TeacherHours
+
+# computed analytics are cached per period for ANALYTICS_CACHE_TTL seconds
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", 300))
+
+# rows fetched per partition when streaming extracts
+STREAM_CHUNK_SIZE = 50_000
+
+# fill rate histogram buckets, 0-10%, 10-20% ... 90-100%
+FILL_RATE_BINS = np.linspace(0, 1, 11)
+
+
+async def _stream_columns(db: AsyncSession, query, dtypes):
+    """Streams query in partitions, returns one numpy array per selected column"""
+    result = await db.stream(query.execution_options(yield_per=STREAM_CHUNK_SIZE))
+    chunks = [[] for _ in dtypes]
+    async for partition in result.partitions():
+        for i, column in enumerate(zip(*partition)):
+            chunks[i].append(np.asarray(column, dtype=dtypes[i]))
+    return [
+        np.concatenate(chunk) if chunk else np.empty(0, dtype=dtype)
+        for chunk, dtype in zip(chunks, dtypes)
+    ]
+
+
+def _period_filter(query, column, start_date: date = None, end_date: date = None):
+    """Adds optional date range filter to query"""
+    if start_date:
+        query = query.filter(column >= start_date)
+    if end_date:
+        query = query.filter(column < end_date + timedelta(days=1))
+    return query
+
+
+async def load_extracts(
+    db: AsyncSession, start_date: date = None, end_date: date = None
+):
+    """Loads columnar extracts of classes starting in period with their reservations, invoices and teacher hours"""
+    class_query = _period_filter(
+        select(Classes.id, Classes.teacher_id, Classes.class_size, Classes.class_start),
+        Classes.class_start,
+        start_date,
+        end_date,
+    )
+    reservation_query = _period_filter(
+        select(StudentsClasses.class_id).join(
+            Classes, StudentsClasses.class_id == Classes.id
+        ),
+        Classes.class_start,
+        start_date,
+        end_date,
+    )
+    invoice_query = _period_filter(
+        select(
+            Invoices.class_id,
+            # whole cents, sums of integers stay exact
+            cast(func.round(Invoices.amount * 100), BigInteger),
+            cast(func.round(Invoices.paid_amount * 100), BigInteger),
+        ).join(Classes, Invoices.class_id == Classes.id),
+        Classes.class_start,
+        start_date,
+        end_date,
+    )
+    hours_query = _period_filter(
+        select(TeacherHours.teacher_id, TeacherHours.hours),
+        TeacherHours.date,
+        start_date,
+        end_date,
+    )
+
+    class_ids, teacher_ids, class_sizes, class_starts = await _stream_columns(
+        db, class_query, ("int64", "int64", "int64", "datetime64[D]")
+    )
+    (reservation_class_ids,) = await _stream_columns(db, reservation_query, ("int64",))
+    invoice_class_ids, invoice_cents, invoice_paid_cents = await _stream_columns(
+        db, invoice_query, ("int64", "int64", "int64")
+    )
+    hour_teacher_ids, hours = await _stream_columns(
+        db, hours_query, ("int64", "float64")
+    )
+    return {
+        "class_ids": class_ids,
+        "teacher_ids": teacher_ids,
+        "class_sizes": class_sizes,
+        "class_starts": class_starts,
+        "reservation_class_ids": reservation_class_ids,
+        "invoice_class_ids": invoice_class_ids,
+        "invoice_cents": invoice_cents,
+        "invoice_paid_cents": invoice_paid_cents,
+        "hour_teacher_ids": hour_teacher_ids,
+        "hours": hours,
+    }
+
+
+def _ratio(numerator, denominator):
+    """Elementwise division, zero where denominator is zero"""
+    numerator = np.asarray(numerator, dtype="float64")
+    return np.divide(
+        numerator,
+        denominator,
+        out=np.zeros_like(numerator),
+        where=np.asarray(denominator) > 0,
+    )
+
+
+def compute_analytics(extracts):
+    """Computes class utilization, fill rate histogram, weekly trend and teacher load from extracts"""
+    class_ids = extracts["class_ids"]
+    class_sizes = extracts["class_sizes"]
+
+    # position of every reservation/invoice class ID inside class_ids, extracts are read
+    # by separate queries so rows of classes created or deleted in between are dropped
+    order = np.argsort(class_ids)
+    sorted_ids = class_ids[order]
+
+    def class_index(ids):
+        if not len(sorted_ids):
+            return np.empty(0, dtype="int64"), np.zeros(len(ids), dtype=bool)
+        positions = np.searchsorted(sorted_ids, ids)
+        positions[positions == len(sorted_ids)] = 0
+        found = sorted_ids[positions] == ids
+        return order[positions[found]], found
+
+    reservation_index, _ = class_index(extracts["reservation_class_ids"])
+    invoice_index, invoice_found = class_index(extracts["invoice_class_ids"])
+
+    enrolled = np.bincount(reservation_index, minlength=len(class_ids))
+    fill_rate = _ratio(enrolled, class_sizes)
+    histogram, _ = np.histogram(np.clip(fill_rate, 0, 1), bins=FILL_RATE_BINS)
+
+    # monday of class start week, 1970-01-01 was a thursday
+    days = extracts["class_starts"].astype("int64")
+    weeks, week_index = np.unique(days - (days + 3) % 7, return_inverse=True)
+    week_classes = np.bincount(week_index, minlength=len(weeks))
+    week_enrolled = np.bincount(week_index, weights=enrolled, minlength=len(weeks))
+    week_capacity = np.bincount(week_index, weights=class_sizes, minlength=len(weeks))
+    week_utilization = _ratio(week_enrolled, week_capacity)
+
+    # teacher load over teachers with classes or logged hours in period
+    teachers = np.union1d(extracts["teacher_ids"], extracts["hour_teacher_ids"])
+    class_teacher = np.searchsorted(teachers, extracts["teacher_ids"])
+    hour_teacher = np.searchsorted(teachers, extracts["hour_teacher_ids"])
+    invoice_teacher = class_teacher[invoice_index]
+    cents = extracts["invoice_cents"][invoice_found]
+    paid_cents = extracts["invoice_paid_cents"][invoice_found]
+
+    def per_teacher(index, weights=None):
+        return np.bincount(index, weights=weights, minlength=len(teachers))
+
+    teacher_classes = per_teacher(class_teacher)
+    teacher_capacity = per_teacher(class_teacher, class_sizes)
+    teacher_enrolled = per_teacher(class_teacher, enrolled)
+    teacher_utilization = _ratio(teacher_enrolled, teacher_capacity)
+    teacher_hours = per_teacher(hour_teacher, extracts["hours"])
+    # float64 bincount of whole cents is exact below 2**53 cents
+    teacher_invoiced = per_teacher(invoice_teacher, cents) / 100
+    teacher_paid = per_teacher(invoice_teacher, paid_cents) / 100
+
+    total_capacity = int(class_sizes.sum())
+    total_enrolled = int(enrolled.sum())
+    utilization = {
+        "classes": len(class_ids),
+        "capacity": total_capacity,
+        "enrolled": total_enrolled,
+        "utilization": (
+            round(total_enrolled / total_capacity, 4) if total_capacity else 0
+        ),
+        "full_classes": int((enrolled >= class_sizes).sum()),
+        "fill_rate_histogram": [
+            {
+                "lower": round(float(lower), 2),
+                "upper": round(float(upper), 2),
+                "classes": int(count),
+            }
+            for lower, upper, count in zip(
+                FILL_RATE_BINS[:-1], FILL_RATE_BINS[1:], histogram
+            )
+        ],
+        "weekly_trend": [
+            {
+                "week_start": str(np.datetime64(int(week), "D")),
+                "classes": int(classes),
+                "enrolled": int(week_enrolled_count),
+                "capacity": int(capacity),
+                "utilization": round(float(rate), 4),
+            }
+            for week, classes, week_enrolled_count, capacity, rate in zip(
+                weeks, week_classes, week_enrolled, week_capacity, week_utilization
+            )
+        ],
+    }
+    teacher_load = [
+        {
+            "teacher_id": int(teachers[i]),
+            "classes": int(teacher_classes[i]),
+            "enrolled": int(teacher_enrolled[i]),
+            "capacity": int(teacher_capacity[i]),
+            "utilization": round(float(teacher_utilization[i]), 4),
+            "work_hours": round(float(teacher_hours[i]), 2),
+            "invoiced": round(float(teacher_invoiced[i]), 2),
+            "paid": round(float(teacher_paid[i]), 2),
+        }
+        for i in range(len(teachers))
+    ]
+    return {"utilization": utilization, "teacher_load": teacher_load}
+
+
+async def get_analytics(
+    db: AsyncSession,
+    start_date: date = None,
+    end_date: date = None,
+    refresh: bool = False,
+):
+    """Returns analytics for period from cache, computes and caches them if missing, expired or refresh is set"""
+    cache = get_cache()
+    key = f"analytics:{start_date}:{end_date}"
+    if not refresh:
+        cached = await cache.get(key)
+        if cached is not None:
+            return cached
+
+    extracts = await load_extracts(db, start_date, end_date)
+    analytics = compute_analytics(extracts)
+    analytics["utilization"].update(start_date=start_date, end_date=end_date)
+    await cache.set(key, analytics, ANALYTICS_CACHE_TTL)
+    return analytics
@@ -0,0 +1,182 @@
+"""Moves past terms out of the hot tables into *_archive tables.
+
+    python -m api.archive [--before YYYY-MM-DD]
+
+Runs from cron, from POST /archive/run, or as the archive job of api.scheduler.
+Classes are archived once their last occurrence ended before the cutoff and all their
+invoices are paid, together with their reservations and invoices. Other paid invoices
+and work hours already covered by a paid paycheck are archived by date. Unpaid invoices stay hot.
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+
+from sqlalchemy import and_, delete, exists, func, insert, or_, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.db.db_manager import AsyncSessionLocal
+from api.db.models import (
+    Classes,
+    ClassesArchive,
+    Invoices,
+    InvoicesArchive,
+    Paychecks,
+    StudentsClasses,
+    StudentsClassesArchive,
+    TeacherHours,
+    TeacherHoursArchive,
+)
+from api.logger import api_logger
+
+# rows older than this many days are archived
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+
+# archive job interval when ARCHIVE_SCHEDULE is not set, 0 runs it only on request
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", 0))
+
+# hot table with its archive table
+ARCHIVES = {
+    Classes: ClassesArchive,
+    StudentsClasses: StudentsClassesArchive,
+    Invoices: InvoicesArchive,
+    TeacherHours: TeacherHoursArchive,
+}
+
+
+def with_archive(Model, include_archived: bool = False):
+    """Returns selectable with Model columns, hot and archived rows when include_archived"""
+    if not include_archived:
+        return Model.__table__
+    archive = ARCHIVES[Model].__table__
+    archived = select(*[archive.c[column.name] for column in Model.__table__.columns])
+    return union_all(select(Model.__table__), archived).subquery(
+        f"{Model.__tablename__}_all"
+    )
+
+
+def last_class_end(class_end, frequency):
+    """End of the last occurrence, recurring classes run for frequency weeks"""
+    if frequency and frequency.get("weeks"):
+        return class_end + datetime.timedelta(weeks=frequency["weeks"] - 1, days=4)
+    return class_end
+
+
+async def _move(db: AsyncSession, Model, condition):
+    """Deletes rows matching condition and inserts the deleted rows into the archive table,
+    one statement on Postgres so no row is lost or archived twice, returns row count"""
+    columns = Model.__table__.columns
+    deleted = delete(Model).where(condition).returning(*columns)
+    if db.bind.dialect.name == "postgresql":
+        moved = deleted.cte("moved")
+        query = insert(ARCHIVES[Model]).from_select(
+            [column.name for column in columns], select(moved)
+        )
+        return (await db.execute(query)).rowcount
+    rows = (await db.execute(deleted)).mappings().all()
+    if rows:
+        await db.execute(insert(ARCHIVES[Model]), [dict(row) for row in rows])
+    return len(rows)
+
+
+async def archive_history(db: AsyncSession, before: datetime.date = None):
+    """Archives rows older than before (default ARCHIVE_AFTER_DAYS ago) in one transaction,
+    on Postgres only one worker archives at a time, others return without changes"""
+    if before is None:
+        before = datetime.date.today() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+    if db.bind.dialect.name == "postgresql":
+        lock = text("SELECT pg_try_advisory_xact_lock(724312)")
+        if not (await db.execute(lock)).scalar():
+            return {"before": before, "running": True}
+
+    cutoff = datetime.datetime.combine(before, datetime.time.min)
+    unpaid = exists().where(
+        Invoices.class_id == Classes.id, Invoices.payment_status.isnot(True)
+    )
+    # locked like add_new_reservation locks them, so no reservation is added while they move
+    candidates = await db.execute(
+        select(Classes.id, Classes.class_end, Classes.frequency)
+        .where(Classes.class_end < cutoff, ~unpaid)
+        .with_for_update(of=Classes)
+    )
+    class_ids = [
+        row.id
+        for row in candidates
+        if last_class_end(row.class_end, row.frequency) < cutoff
+    ]
+    if class_ids:
+        # invoices of reservations commited while waiting for the locks
+        unpaid_now = await db.execute(
+            select(Invoices.class_id).where(
+                Invoices.class_id.in_(class_ids), Invoices.payment_status.isnot(True)
+            )
+        )
+        class_ids = sorted(set(class_ids) - set(unpaid_now.scalars()))
+
+    invoice_condition = and_(
+        Invoices.payment_status.is_(True), Invoices.invoice_date < before
+    )
+    if class_ids:
+        invoice_condition = or_(invoice_condition, Invoices.class_id.in_(class_ids))
+    # hours stay hot until the paycheck covering them is paid
+    covered = exists().where(
+        Paychecks.payment_status.is_(True),
+        Paychecks.teacher_id == TeacherHours.teacher_id,
+        Paychecks.start_date <= TeacherHours.date,
+        Paychecks.end_date >= TeacherHours.date,
+    )
+
+    # reservations and invoices first, classes then have nothing left to cascade
+    counts = {"before": before, "running": False}
+    counts["reservations"] = (
+        await _move(db, StudentsClasses, StudentsClasses.class_id.in_(class_ids))
+        if class_ids
+        else 0
+    )
+    counts["invoices"] = await _move(db, Invoices, invoice_condition)
+    counts["classes"] = (
+        await _move(db, Classes, Classes.id.in_(class_ids)) if class_ids else 0
+    )
+    counts["work_hours"] = await _move(
+        db, TeacherHours, and_(TeacherHours.date < before, covered)
+    )
+    api_logger.info("Archived %s", counts)
+    return counts
+
+
+async def get_archive_status(db: AsyncSession):
+    """Returns hot and archived row counts per table"""
+    status = []
+    for Model, Archive in ARCHIVES.items():
+        hot = (await db.execute(select(func.count()).select_from(Model))).scalar()
+        archived = (
+            await db.execute(select(func.count()).select_from(Archive))
+        ).scalar()
+        status.append(
+            {"table": Model.__tablename__, "hot_rows": hot, "archived_rows": archived}
+        )
+    return status
+
+
+async def run_archival(before: datetime.date = None):
+    """Archives in its own session, used by the archive job and the command line"""
+    async with AsyncSessionLocal() as db:
+        counts = await archive_history(db, before)
+        await db.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--before",
+        type=datetime.date.fromisoformat,
+        help="archive rows older than this date, default ARCHIVE_AFTER_DAYS ago",
+    )
+    args = parser.parse_args()
+    print(asyncio.run(run_archival(args.before)))
+
+
+if __name__ == "__main__":
+    main()
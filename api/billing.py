@@ -0,0 +1,136 @@
+"""Monthly tuition invoices for recurring classes.
+
+    python -m api.billing [--period YYYY-MM-DD]
+
+Runs from cron, from POST /billing/run, or as the billing job of api.scheduler.
+Every student enrolled in a recurring class with tuition that runs during the month gets
+one invoice for it. Invoices are written with set based INSERT ... SELECT statements and
+are unique per student, class and billing period, so repeated runs only fill the gaps.
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+
+from sqlalchemy import Boolean, Date, exists, insert, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.archive import last_class_end
+from api.crud import INVOICE_ROLLUP_COLUMNS, apply_invoice_rollups
+from api.db.db_manager import AsyncSessionLocal
+from api.db.models import Classes, Invoices, StudentsClasses
+from api.logger import api_logger
+
+# billing job interval when BILLING_SCHEDULE is not set, 0 runs it only on request
+BILLING_INTERVAL_HOURS = float(os.getenv("BILLING_INTERVAL_HOURS", 0))
+
+# classes billed per INSERT ... SELECT, keeps bound parameters under driver limits
+BILLING_CHUNK = 5000
+
+
+def period_bounds(period: datetime.date):
+    """First day of the month containing period and of the month after it"""
+    start = period.replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+async def _active_classes(db: AsyncSession, start: datetime.date, end: datetime.date):
+    """IDs of recurring classes with tuition that have an occurrence in [start, end)"""
+    query = select(Classes.id, Classes.class_end, Classes.frequency).where(
+        Classes.tuition.is_not(None),
+        Classes.class_start < datetime.datetime.combine(end, datetime.time.min),
+    )
+    period_start = datetime.datetime.combine(start, datetime.time.min)
+    return [
+        row.id
+        for row in await db.execute(query)
+        if row.frequency
+        and last_class_end(row.class_end, row.frequency) >= period_start
+    ]
+
+
+async def bill_period(db: AsyncSession, period: datetime.date = None):
+    """Creates missing tuition invoices for the month of period (default this month) in one
+    transaction, on Postgres only one worker bills at a time, others return without changes
+    """
+    start, end = period_bounds(period or datetime.date.today())
+    if db.bind.dialect.name == "postgresql":
+        lock = text("SELECT pg_try_advisory_xact_lock(724313)")
+        if not (await db.execute(lock)).scalar():
+            return {"period": start, "running": True}
+
+    class_ids = await _active_classes(db, start, end)
+    billed = exists().where(
+        Invoices.student_id == StudentsClasses.student_id,
+        Invoices.class_id == StudentsClasses.class_id,
+        Invoices.billing_period == start,
+    )
+    invoices = 0
+    for i in range(0, len(class_ids), BILLING_CHUNK):
+        enrollments = (
+            select(
+                StudentsClasses.student_id,
+                StudentsClasses.class_id,
+                literal(start, Date),
+                literal(f"Tuition {start:%Y-%m} for: ") + Classes.class_name,
+                literal(False, Boolean),
+                Classes.tuition,
+                literal(start, Date),
+            )
+            .join(Classes, Classes.id == StudentsClasses.class_id)
+            .where(StudentsClasses.class_id.in_(class_ids[i : i + BILLING_CHUNK]))
+            .where(~billed)
+        )
+        result = await db.execute(
+            insert(Invoices)
+            .from_select(
+                [
+                    "student_id",
+                    "class_id",
+                    "invoice_date",
+                    "description",
+                    "payment_status",
+                    "amount",
+                    "billing_period",
+                ],
+                enrollments,
+            )
+            .returning(*INVOICE_ROLLUP_COLUMNS)
+        )
+        billed_rows = result.all()
+        await apply_invoice_rollups(db, added=billed_rows)
+        invoices += len(billed_rows)
+
+    counts = {
+        "period": start,
+        "running": False,
+        "classes": len(class_ids),
+        "invoices": invoices,
+    }
+    api_logger.info("Billed %s", counts)
+    return counts
+
+
+async def run_billing(period: datetime.date = None):
+    """Bills in its own session, used by the billing job and the command line"""
+    async with AsyncSessionLocal() as db:
+        counts = await bill_period(db, period)
+        await db.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--period",
+        type=datetime.date.fromisoformat,
+        help="any day of the billed month, default today",
+    )
+    args = parser.parse_args()
+    print(asyncio.run(run_billing(args.period)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+# redis://host:6379/0 shares cached results between workers, unset keeps them in process memory
+CACHE_URL = os.getenv("CACHE_URL")
+
+# max items in process memory cache
+MEMORY_CACHE_SIZE = 1024
+
+
+class MemoryCache:
+    """Per process LRU cache with TTL, values are stored as is"""
+
+    def __init__(self, max_items: int = MEMORY_CACHE_SIZE):
+        self.max_items = max_items
+        self.items = OrderedDict()
+
+    async def get(self, key: str):
+        item = self.items.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            self.items.pop(key, None)
+            return None
+        self.items.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: int):
+        self.items[key] = (time.monotonic() + ttl, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    async def delete(self, key: str):
+        self.items.pop(key, None)
+
+
+class RedisCache:
+    """Cache shared between workers and nodes, values are stored as JSON"""
+
+    def __init__(self, url: str):
+        from redis import asyncio as redis
+
+        self.client = redis.from_url(url)
+
+    async def get(self, key: str):
+        value = await self.client.get(key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value, ttl: int):
+        await self.client.set(key, json.dumps(value, default=str), ex=ttl)
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+
+_cache = None
+
+
+def get_cache():
+    """Returns process wide cache, redis if CACHE_URL is set"""
+    global _cache
+    if _cache is None:
+        _cache = RedisCache(CACHE_URL) if CACHE_URL else MemoryCache()
+    return _cache
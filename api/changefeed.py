@@ -0,0 +1,188 @@
+"""Change feed of class and reservation writes, streamed to dashboards over SSE.
+
+Crud functions publish an event after their transaction commits, the in process
+broker fans it out to subscriptions of the event's class or teacher. With
+CHANGE_FEED_NOTIFY=True on Postgres every worker listens on a LISTEN/NOTIFY
+channel and events are published through it, so subscribers of any worker get
+writes of all workers. Events are not stored, clients reload state after reconnecting.
+"""
+
+import asyncio
+import datetime
+import itertools
+import json
+import os
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+
+from api.db.db_manager import async_engine
+from api.logger import api_logger
+
+CHANGE_FEED_NOTIFY = os.getenv("CHANGE_FEED_NOTIFY", "False") == "True"
+
+CHANGE_FEED_CHANNEL = "change_feed"
+
+# events buffered per subscriber, a subscriber falling further behind is disconnected
+CHANGE_FEED_QUEUE_SIZE = int(os.getenv("CHANGE_FEED_QUEUE_SIZE", 256))
+
+# seconds between keepalive comments on idle streams
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", 15))
+
+# seconds before reconnecting a lost LISTEN connection
+LISTEN_RETRY_SECONDS = 5
+
+
+class Subscription:
+    """Queue of events for one stream, all events when no class or teacher IDs are given"""
+
+    def __init__(self, class_ids=None, teacher_ids=None):
+        self.class_ids = set(class_ids or ())
+        self.teacher_ids = set(teacher_ids or ())
+        self.queue = asyncio.Queue(maxsize=CHANGE_FEED_QUEUE_SIZE)
+
+    def matches(self, event: dict):
+        if not self.class_ids and not self.teacher_ids:
+            return True
+        return (
+            event.get("class_id") in self.class_ids
+            or event.get("teacher_id") in self.teacher_ids
+        )
+
+
+class Broker:
+    """Fans events out to the subscriptions of this worker"""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.sequence = itertools.count(1)
+
+    def subscribe(self, class_ids=None, teacher_ids=None):
+        subscription = Subscription(class_ids, teacher_ids)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+
+    def dispatch(self, event: dict):
+        event = dict(event, id=next(self.sequence))
+        for subscription in list(self.subscriptions):
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # drop buffered events, None ends the stream and the client reloads
+                self.unsubscribe(subscription)
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(None)
+
+
+broker = Broker()
+
+# asyncpg connection listening on the channel, also used to send notifications
+_listener = None
+_notify_lock = asyncio.Lock()
+
+
+def event(event_type: str, class_id: int, teacher_id: int, **fields):
+    """Builds a change event of a class, type is class.* or reservation.*"""
+    return jsonable_encoder(
+        dict(
+            type=event_type,
+            class_id=class_id,
+            teacher_id=teacher_id,
+            at=datetime.datetime.now(),
+            **fields,
+        )
+    )
+
+
+async def publish(*events):
+    """Publishes committed changes, through NOTIFY when the bridge is listening"""
+    for change in events:
+        if _listener is not None:
+            try:
+                async with _notify_lock:
+                    await _listener.execute(
+                        "SELECT pg_notify($1, $2)",
+                        CHANGE_FEED_CHANNEL,
+                        json.dumps(change),
+                    )
+                continue
+            except Exception as e:
+                api_logger.warning(
+                    "Change feed NOTIFY failed, publishing locally: %s", e
+                )
+        broker.dispatch(change)
+
+
+def _on_notification(connection, pid, channel, payload):
+    broker.dispatch(json.loads(payload))
+
+
+async def listen():
+    """Bridges NOTIFY on CHANGE_FEED_CHANNEL into the broker until cancelled,
+    started from server lifespan, Postgres (asyncpg) only"""
+    global _listener
+    if async_engine.dialect.name != "postgresql":
+        api_logger.warning(
+            "Change feed NOTIFY bridge needs Postgres, events stay local"
+        )
+        return
+    while True:
+        try:
+            async with async_engine.connect() as conn:
+                raw = await conn.get_raw_connection()
+                connection = raw.driver_connection
+                await connection.add_listener(CHANGE_FEED_CHANNEL, _on_notification)
+                lost = asyncio.get_running_loop().create_future()
+                connection.add_termination_listener(
+                    lambda _: lost.done() or lost.set_result(None)
+                )
+                _listener = connection
+                api_logger.info("Change feed listening on %s", CHANGE_FEED_CHANNEL)
+                try:
+                    await lost
+                finally:
+                    _listener = None
+                    if not connection.is_closed():
+                        await connection.remove_listener(
+                            CHANGE_FEED_CHANNEL, _on_notification
+                        )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            api_logger.error("Change feed listener failed: %s", e)
+        await asyncio.sleep(LISTEN_RETRY_SECONDS)
+
+
+def _sse(change: dict):
+    return (
+        f"id: {change['id']}\nevent: {change['type']}\ndata: {json.dumps(change)}\n\n"
+    )
+
+
+async def stream(request: Request, class_ids=None, teacher_ids=None):
+    """Yields server sent events for a new subscription until the client disconnects"""
+    subscription = broker.subscribe(class_ids, teacher_ids)
+    try:
+        yield ": subscribed\n\n"
+        while True:
+            try:
+                change = await asyncio.wait_for(
+                    subscription.queue.get(), CHANGE_FEED_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            if change is None:
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            yield _sse(change)
+    finally:
+        broker.unsubscribe(subscription)
@@ -1,37 +1,160 @@
+import csv
+import functools
+import io
+import os
+import re
 from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
 
 from fastapi import HTTPException, status
-from sqlalchemy import delete, func, select, table, update
+from pydantic import ValidationError
+from sqlalchemy import (Date, Integer, bindparam, case, column, delete, func,
+                        insert, literal, select, table, text, true, tuple_,
+                        union_all, update, values)
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
-
-from api.Calendar_utils.calendar_func import (add_event_to_calendar,
-                                              add_reservation_to_calendar,
-                                              delete_class_from_calendar,
-                                              delete_reservation_from_calendar,
-                                              update_event_calendar)
+from sqlalchemy.orm import joinedload, load_only, selectinload
+from sqlalchemy.sql.selectable import CTE
+
+from api import changefeed, search
+from api.archive import with_archive
+from api.Calendar_utils.calendar_dispatch import calendar_call, fan_out
+from api.Calendar_utils.calendar_func import (
+    add_event_to_calendar, add_reservation_to_calendar, calendar_or_default,
+    delete_class_from_calendar, delete_reservation_from_calendar,
+    delete_reservations_from_calendar, move_event_to_calendar,
+    update_event_calendar)
 from api.Calendar_utils.calendar_service_manager import service_dependancy
 from api.db.models import *
+from api.filters import (CLASS_FILTERS, INVOICE_FILTERS, PAYCHECK_FILTERS,
+                         STUDENT_FILTERS, TEACHER_FILTERS, WORK_HOURS_FILTERS,
+                         list_page)
+from api.schemas import (ClassResponse, PaymentLine, ReservationResponse,
+                         StudentResponse)
+from api.singleflight import single_flight
 
 from .logger import *
 
+# money is rounded to cents, half up
+CENT = Decimal("0.01")
+
+# students of class rosters are loaded with just the fields ReservationResponse returns
+STUDENT_FIELDS = tuple(StudentResponse.model_fields)
+
+# hot lookups are built once with bound parameters, SQLAlchemy memoizes their cache keys
+# and reuses the compiled form, asyncpg the prepared statement, see /metrics/compile_cache
+_STUDENT_COLUMNS = [getattr(Students, name) for name in STUDENT_FIELDS]
+
+# roster through the students_classes index plus the target student by primary key,
+# an enrolled target student comes in both parts
+_ROSTER_STUDENTS = union_all(
+    select(*_STUDENT_COLUMNS, literal(True).label("enrolled"))
+    .join(StudentsClasses, StudentsClasses.student_id == Students.id)
+    .where(StudentsClasses.class_id == bindparam("class_id")),
+    select(*_STUDENT_COLUMNS, literal(False).label("enrolled")).where(
+        Students.id == bindparam("student_id")
+    ),
+).subquery()
+
+# class, its roster and the target student, one row per student, :class_id and :student_id
+CLASS_ROSTER_QUERY = (
+    select(Classes, *_ROSTER_STUDENTS.c)
+    .outerjoin(_ROSTER_STUDENTS, true())
+    .where(Classes.id == bindparam("class_id"))
+)
+
+# same, locking the class row so reservations of one class are counted and added one at a time
+CLASS_ROSTER_LOCK_QUERY = CLASS_ROSTER_QUERY.with_for_update(of=Classes)
+
+CLASS_STUDENTS_QUERY = (
+    select(Classes)
+    .options(selectinload(Classes.students).options(load_only(*_STUDENT_COLUMNS)))
+    .where(Classes.id == bindparam("id"))
+)
+
+STUDENT_CLASSES_QUERY = (
+    select(Students)
+    .options(selectinload(Students.classes))
+    .where(Students.id == bindparam("id"))
+)
+
+TEACHER_CLASSES_QUERY = (
+    select(Teachers)
+    .options(selectinload(Teachers.classes))
+    .where(Teachers.id == bindparam("id"))
+)
+
+TEACHER_CALENDAR_QUERY = select(Teachers.calendar_id).where(
+    Teachers.id == bindparam("id")
+)
+
+INVOICE_STUDENT_QUERY = (
+    select(Invoices)
+    .options(joinedload(Invoices.student))
+    .where(Invoices.id == bindparam("id"))
+)
+
+
+@functools.cache
+def _by_id_query(Table):
+    """SELECT of a Table row by :id"""
+    return select(Table).where(Table.id == bindparam("id"))
+
+
+# keep daily rollup tables in sync on invoice and paycheck writes, reports read from them
+USE_REPORT_ROLLUPS = os.getenv("USE_REPORT_ROLLUPS") == "True"
+
 
 async def delete_item(db: AsyncSession, id: int, Table: table):
     """Deletes item by item ID, raised 404 if item ID not found"""
-    query = delete(Table).where(Table.id == id)
-    result = await db.execute(query)
-    if result.rowcount == 0:
+    await delete_items(db, [id], Table)
+
+
+def _deleted_rollups(Table):
+    """Rollup columns and apply function of deleted invoices or paychecks, students, classes
+    and teachers that still have them are kept by ON DELETE RESTRICT"""
+    return {
+        Invoices: (INVOICE_ROLLUP_COLUMNS, apply_invoice_rollups),
+        Paychecks: (PAYCHECK_ROLLUP_COLUMNS, apply_paycheck_rollups),
+    }.get(Table)
+
+
+async def delete_items(db: AsyncSession, ids: list[int], Table: table, *returning):
+    """Deletes all items by IDs in one statement, reservations and unbilled work hours are removed
+    by the database through ON DELETE CASCADE, report rollups are updated in the same transaction.
+    Returns deleted rows (id plus returning columns), 404 if no ID found, 409 if item is still
+    referenced, such as students or classes with invoices and teachers with classes or paychecks
+    """
+    rollup = _deleted_rollups(Table) if USE_REPORT_ROLLUPS else None
+    if rollup:
+        columns, apply_rollups = rollup
+        removed = await _locked_rollup_rows(db, columns, Table.id.in_(ids))
+
+    query = delete(Table).where(Table.id.in_(ids)).returning(Table.id, *returning)
+    try:
+        deleted = (await db.execute(query)).all()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Item still referenced, delete linked records first",
+        )
+    if not deleted:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Deletion ID not found"
         )
+    if rollup:
+        await apply_rollups(db, removed=removed)
     await db.commit()
+    search.invalidate(Table)
+    api_logger.info("Deleted %s rows from %s", len(deleted), Table.__tablename__)
+    return deleted
 
 
 async def update_item(db: AsyncSession, payload, id: int, Table: table):
     """Filter item by ID, update by unpacking item object,return a 404 if ID not found"""
-    querry = select(Table).filter(Table.id == id)
-    result = await db.execute(querry)
+    result = await db.execute(_by_id_query(Table), {"id": id})
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Item ID not found"
@@ -42,6 +165,7 @@ async def update_item(db: AsyncSession, payload, id: int, Table: table):
     )
     await db.execute(update_query)
     await db.commit()
+    search.invalidate(Table)
     return {"message": "updated"}
 
 
@@ -51,6 +175,7 @@ async def add_item(db: AsyncSession, payload, Table: table):
     try:
         db.add(new_item)
         await db.commit()
+        search.invalidate(Table)
         await db.refresh(new_item)
         return new_item
     except IntegrityError as e:
@@ -70,61 +195,25 @@ async def add_item(db: AsyncSession, payload, Table: table):
 # student router
 
 
-async def get_all_students(
-    db: AsyncSession,
-    page: int,
-    limit: int,
-    last_name: str = None,
-    email: str = None,
-    phone_num: str = None,
-):
-    """Skip is the amount of pages to skip, limit is the amount of entries per page, filter by last name, email or phone number"""
-    skip = (page - 1) * limit
-    base_query = select(Students)
-    if last_name:
-        base_query = base_query.filter(Students.last_name == last_name)
-    if email:
-        base_query = base_query.filter(Students.email == email)
-    if phone_num:
-        base_query = base_query.filter(Students.phone_num == phone_num)
-    query = base_query.offset(skip).limit(limit)
-    result = await db.execute(query)
-    return result.scalars().all()
+@single_flight
+async def get_all_students(db: AsyncSession, filters):
+    """Returns one page of students using StudentFilters, filter by last name, email, phone number,
+    birth year range or IDs, sorted by sort field"""
+    return await list_page(db, STUDENT_FILTERS, filters)
 
 
 # teachers router
-async def get_all_teachers(
-    db: AsyncSession,
-    page: int,
-    limit: int,
-    last_name: str = None,
-    email: str = None,
-    phone_num: str = None,
-):
-    """Skip is the amount of pages to skip, limit is the amount of entries per page, filter by last name, email or phone number"""
-    skip = (page - 1) * limit
-
-    base_query = select(Teachers)
-    if last_name:
-        base_query = base_query.filter(Teachers.last_name == last_name)
-    if email:
-        base_query = base_query.filter(Teachers.email == email)
-    if phone_num:
-        base_query = base_query.filter(Teachers.phone_num == phone_num)
-
-    query = base_query.offset(skip).limit(limit)
-    result = await db.execute(query)
-    return result.scalars().all()
+@single_flight
+async def get_all_teachers(db: AsyncSession, filters):
+    """Returns one page of teachers using TeacherFilters, filter by last name, email, phone number,
+    hire date range or IDs, sorted by sort field"""
+    return await list_page(db, TEACHER_FILTERS, filters)
 
 
+@single_flight(response_model=list[ClassResponse])
 async def get_all_teacher_classes(db: AsyncSession, teacher_id: int):
     """Retruns teacher model with all classes, rises 404 if teacher ID not found"""
-    query = (
-        select(Teachers)
-        .options(joinedload(Teachers.classes))
-        .filter(Teachers.id == teacher_id)
-    )
-    teacher_result = await db.execute(query)
+    teacher_result = await db.execute(TEACHER_CLASSES_QUERY, {"id": teacher_id})
     teacher = teacher_result.scalars().first()
     if teacher is None:
         raise HTTPException(
@@ -134,27 +223,11 @@ async def get_all_teacher_classes(db: AsyncSession, teacher_id: int):
 
 
 # classes router
-async def get_all_classes(
-    db: AsyncSession,
-    page: int,
-    limit: int,
-    class_name: str = None,
-    target_date=None,
-    description: str = None,
-):
-    """Skip is the amount of pages to skip, limit is the amount of entries per page, filter by class name,target date or description"""
-    skip = (page - 1) * limit
-    base_query = select(Classes)
-    if class_name:
-        base_query = base_query.filter(Classes.class_name.ilike(f"%{class_name}%"))
-    if target_date:
-        base_query = base_query.where(func.date(Classes.class_start) == target_date)
-    if description:
-        base_query = base_query.filter(Classes.description.ilike(f"%{description}%"))
-
-    query = base_query.offset(skip).limit(limit)
-    result = await db.execute(query)
-    return result.scalars().all()
+@single_flight
+async def get_all_classes(db: AsyncSession, filters):
+    """Returns one page of classes using ClassFilters, filter by part of name or description, start date,
+    start range or teachers, archived classes are listed only with include_archived"""
+    return await list_page(db, CLASS_FILTERS, filters)
 
 
 async def add_new_class(db: AsyncSession, class_data, manager: service_dependancy):
@@ -183,9 +256,20 @@ async def add_new_class(db: AsyncSession, class_data, manager: service_dependanc
             status_code=status.HTTP_409_CONFLICT,
             detail="Conflict with date/time, class already exists",
         )
-    # add event to calendar
-    calendar_event = add_event_to_calendar(
+    teacher = (
+        await db.execute(TEACHER_CALENDAR_QUERY, {"id": class_data.teacher_id})
+    ).first()
+    if teacher is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Teacher ID not found"
+        )
+    calendar_id = calendar_or_default(teacher.calendar_id)
+
+    # add event to the teacher's calendar
+    calendar_event = await calendar_call(
+        add_event_to_calendar,
         service,
+        calendar_id,
         target_name,
         target_start,
         target_end,
@@ -197,51 +281,58 @@ async def add_new_class(db: AsyncSession, class_data, manager: service_dependanc
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create calendar event",
         )
-    calendar_id = calendar_event.get("id").strip()
-    api_logger.info("Calendar ID, %s", calendar_id)
+    event_id = calendar_event.get("id").strip()
+    api_logger.info("Calendar %s event ID, %s", calendar_id, event_id)
 
     # add to database
-    new_class = Classes(**class_data.dict(), event_id=calendar_id)
+    new_class = Classes(**class_data.dict(), event_id=event_id, calendar_id=calendar_id)
     db.add(new_class)
     await db.commit()
+    search.invalidate()
     await db.refresh(new_class)
+    await changefeed.publish(
+        changefeed.event(
+            "class.created",
+            new_class.id,
+            new_class.teacher_id,
+            fields=class_data.dict(),
+        )
+    )
     return new_class
 
 
 async def delete_class(db: AsyncSession, id: int, manager: service_dependancy):
     """Deletes class by class ID, auto deletes calendar event, rises 404 if class ID not found, deletes linked invoices"""
+    await delete_classes(db, [id], manager)
+
+
+async def delete_classes(db: AsyncSession, ids: list[int], manager: service_dependancy):
+    """Deletes classes by IDs in one statement, reservations go with ON DELETE CASCADE, classes with
+    invoices return 409, calendar events are deleted once the transaction is commited"""
     service = manager.get_calendar_service()
     if service is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required"
         )
-    select_query = select(Classes).filter(Classes.id == id)
-    result = await db.execute(select_query)
-    event = result.scalars().first()
-
-    if event is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Class ID not found"
-        )
-
-    # delete event from calendar
-    delete_class_from_calendar(service, event.event_id)
-
-    # remove the class from db
-    delete_query = delete(Classes).where(Classes.id == id)
-    await db.execute(delete_query)
-
-    # invoice deletion
-    invoice_querry = delete(Invoices).filter(Invoices.class_id == event.id)
-    result = await db.execute(invoice_querry)
-
-    # studentclass deletion
-    reservation_deletion_querry = delete(StudentsClasses).filter(
-        StudentsClasses.class_id == event.id
+    deleted = await delete_items(
+        db, ids, Classes, Classes.event_id, Classes.teacher_id, Classes.calendar_id
     )
-    result = await db.execute(reservation_deletion_querry)
-
-    await db.commit()
+    await changefeed.publish(
+        *[changefeed.event("class.deleted", row.id, row.teacher_id) for row in deleted]
+    )
+    # events of different calendars are deleted concurrently
+    await fan_out(
+        [
+            (
+                delete_class_from_calendar,
+                service,
+                calendar_or_default(row.calendar_id),
+                row.event_id,
+            )
+            for row in deleted
+        ]
+    )
+    return deleted
 
 
 async def update_class(db: AsyncSession, payload, id: int, manager: service_dependancy):
@@ -251,24 +342,13 @@ async def update_class(db: AsyncSession, payload, id: int, manager: service_depe
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required"
         )
-    querry = select(Classes).filter(Classes.id == id)
-    result = await db.execute(querry)
-    if not result:
+    select_result = await db.execute(_by_id_query(Classes), {"id": id})
+    select_result = select_result.scalars().first()
+    if select_result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Class ID not found"
         )
 
-    update_query = (
-        update(Classes)
-        .where(Classes.id == id)
-        .values(**payload.dict(exclude_unset=True))
-    )
-
-    select_querry = select(Classes).where(Classes.id == id)
-
-    select_result = await db.execute(select_querry)
-    select_result = select_result.scalars().first()
-
     target_start = payload.class_start
     target_end = payload.class_end
     target_name = payload.class_name
@@ -276,8 +356,42 @@ async def update_class(db: AsyncSession, payload, id: int, manager: service_depe
     target_event_id = select_result.event_id
     target_frequency = select_result.frequency
 
-    update_event_calendar(
+    # a new teacher with another calendar takes the event over to their calendar
+    calendar_id = calendar_or_default(select_result.calendar_id)
+    if payload.teacher_id != select_result.teacher_id:
+        teacher = (
+            await db.execute(TEACHER_CALENDAR_QUERY, {"id": payload.teacher_id})
+        ).first()
+        if teacher is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Teacher ID not found"
+            )
+        destination = calendar_or_default(teacher.calendar_id)
+        if destination != calendar_id:
+            moved = await calendar_call(
+                move_event_to_calendar,
+                service,
+                calendar_id,
+                target_event_id,
+                destination,
+            )
+            if moved is None:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to move calendar event",
+                )
+            calendar_id = destination
+
+    update_query = (
+        update(Classes)
+        .where(Classes.id == id)
+        .values(**payload.dict(exclude_unset=True), calendar_id=calendar_id)
+    )
+
+    await calendar_call(
+        update_event_calendar,
         service,
+        calendar_id,
         target_event_id,
         target_name,
         target_description,
@@ -288,90 +402,154 @@ async def update_class(db: AsyncSession, payload, id: int, manager: service_depe
 
     await db.execute(update_query)
     await db.commit()
+    search.invalidate()
+    changes = payload.dict(exclude_unset=True)
+    await changefeed.publish(
+        changefeed.event(
+            "class.updated",
+            id,
+            changes.get("teacher_id", select_result.teacher_id),
+            fields=changes,
+        )
+    )
     return {"message": "updated"}
 
 
+async def _load_class_roster(
+    db: AsyncSession, class_id: int, student_id: int, lock: bool = False
+):
+    """Loads class, its current roster and the target student in one round trip,
+    students as dicts of the StudentResponse fields, returns 404 if class or student ID not found.
+    With lock the class row stays locked until the transaction ends
+    """
+    query = CLASS_ROSTER_LOCK_QUERY if lock else CLASS_ROSTER_QUERY
+    rows = (
+        await db.execute(query, {"class_id": class_id, "student_id": student_id})
+    ).all()
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Class ID not found"
+        )
+    class_object = rows[0].Classes
+    students, student = [], None
+    for row in rows:
+        fields = dict(zip(STUDENT_FIELDS, row[1:-1]))
+        if row.enrolled:
+            students.append(fields)
+        if fields["id"] == student_id:
+            student = fields
+    if student is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Student ID not found"
+        )
+    return class_object, students, student
+
+
+def _reservation_response(class_object, students):
+    """Builds ReservationResponse dict from a class row and its roster"""
+    response = {
+        column.key: getattr(class_object, column.key)
+        for column in Classes.__table__.columns
+    }
+    response["students"] = students
+    return response
+
+
 # reservations route
 async def add_new_reservation(
     db: AsyncSession,
     class_id: int,
     student_id: int,
-    amount: float,
+    amount: Decimal,
     manager: service_dependancy,
 ):
     """Function to add new reservation to db.Takes class_id and student_id, checks class capacity, wont allow reservation if class is full,
-    returns a class with all students, registers student email to atendees to google calendar event, auto creates invoice
+    returns a class with all students, registers student email to atendees to google calendar event, auto creates invoice.
+    Reservation and invoice are written in one transaction, one SELECT loads class, roster and student
+    and locks the class row so concurrent reservations cant overbook it
     """
     service = manager.get_calendar_service()
     if service is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required"
         )
-    query = (
-        select(Classes)
-        .options(joinedload(Classes.students))
-        .filter(Classes.id == class_id)
+    class_object, students, student = await _load_class_roster(
+        db, class_id, student_id, lock=True
     )
-    result = await db.execute(query)
-    class_object = result.scalars().first()
-
-    if class_object is None:
+    if any(enrolled["id"] == student_id for enrolled in students):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Class ID not found"
+            status_code=status.HTTP_409_CONFLICT, detail="Student already in class"
         )
-
-    if len(class_object.students) >= class_object.class_size:
+    if len(students) >= class_object.class_size:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Class is full"
         )
 
-    student_query = select(Students).filter(Students.id == student_id)
-    student_result = await db.execute(student_query)
-    student = student_result.scalars().first()
-    if student is None:
+    try:
+        reservation_id = (
+            await db.execute(
+                insert(StudentsClasses)
+                .values(student_id=student_id, class_id=class_id)
+                .returning(StudentsClasses.id)
+            )
+        ).scalar_one()
+    except IntegrityError:
+        # unique (student_id, class_id), a concurrent request reserved first
+        await db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Student ID not found"
+            status_code=status.HTTP_409_CONFLICT, detail="Student already in class"
         )
 
-    # update calendar event
-    student_email = student.email
-    event_id = class_object.event_id
-    new_reservation = add_reservation_to_calendar(service, event_id, student_email)
-    api_logger.info("New reservation")
-
-    class_object.students.append(student)
-    await db.commit()
-    await db.refresh(class_object)
-
     # new invoice creation
-
     description = (
         f"Reservation for: {class_object.class_name}, at {class_object.class_start},"
         f" Class description: {class_object.description}"
     )
-
-    new_invoice = Invoices(
-        student_id=student.id,
-        invoice_date=datetime.datetime.now(),
-        description=description,
-        amount=amount,
-        class_id=class_object.id,
+    invoice_date = datetime.date.today()
+    invoice_query = (
+        insert(Invoices)
+        .values(
+            student_id=student_id,
+            invoice_date=invoice_date,
+            description=description,
+            amount=amount,
+            class_id=class_object.id,
+        )
+        .returning(Invoices.id, *INVOICE_ROLLUP_COLUMNS)
     )
-
-    db.add(new_invoice)
+    invoice_id, *invoice_row = (await db.execute(invoice_query)).one()
+    await apply_invoice_rollups(db, added=[invoice_row])
     await db.commit()
+    api_logger.info("New reservation %s, invoice %s", reservation_id, invoice_id)
+
+    await changefeed.publish(
+        changefeed.event(
+            "reservation.added",
+            class_id,
+            class_object.teacher_id,
+            student_ids=[student_id],
+            enrolled=len(students) + 1,
+            class_size=class_object.class_size,
+        )
+    )
+
+    # update calendar event once reservation is stored
+    await calendar_call(
+        add_reservation_to_calendar,
+        service,
+        calendar_or_default(class_object.calendar_id),
+        class_object.event_id,
+        student["email"],
+    )
 
-    return class_object
+    return _reservation_response(class_object, students + [student])
 
 
+@single_flight(response_model=ReservationResponse)
 async def get_class_reservations(db: AsyncSession, class_id: int):
-    """Returns joinedload class object with all students atteding class"""
-    query = (
-        select(Classes)
-        .options(joinedload(Classes.students))
-        .filter(Classes.id == class_id)
-    )
-    result = await db.execute(query)
+    """Returns class object with all students atteding class, students are selectin loaded
+    with the StudentResponse fields only"""
+    result = await db.execute(CLASS_STUDENTS_QUERY, {"id": class_id})
     result_object = result.scalars().first()
     if result_object is None:
         raise HTTPException(
@@ -383,68 +561,183 @@ async def get_class_reservations(db: AsyncSession, class_id: int):
 async def remove_student_from_reservations(
     db: AsyncSession, student_id: int, class_id: int, manager: service_dependancy
 ):
-    """Remove student from linked class, returns 404 if student not in class or if student/class ID not found,auto deletes linked invoice"""
+    """Remove student from linked class, returns 404 if student not in class or if student/class ID not found,
+    auto deletes reservation invoice linked to that class only, tuition invoices are kept
+    """
     service = manager.get_calendar_service()
     if service is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required"
         )
-    query = (
-        select(Classes)
-        .options(joinedload(Classes.students))
-        .filter(Classes.id == class_id)
+    class_object, students, student = await _load_class_roster(db, class_id, student_id)
+
+    # studentclass deletion, RETURNING doubles as the membership check
+    reservation_deletion_querry = (
+        delete(StudentsClasses)
+        .where(StudentsClasses.student_id == student_id)
+        .where(StudentsClasses.class_id == class_id)
+        .returning(StudentsClasses.id)
     )
-    result = await db.execute(query)
-    class_object = result.scalars().first()
-    if class_object is None:
+    result = await db.execute(reservation_deletion_querry)
+    if result.scalar() is None:
+        await db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Class ID not found"
+            status_code=status.HTTP_404_NOT_FOUND, detail="Student not in the class"
         )
-    student_query = select(Students).filter(Students.id == student_id)
-    student_result = await db.execute(student_query)
-    student = student_result.scalars().first()
 
-    if student is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Student ID not found"
-        )
-    if student not in class_object.students:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Student not in the class"
+    # reservation invoice deletion, billed tuition stays owed
+    invoice_querry = (
+        delete(Invoices)
+        .where(Invoices.student_id == student_id)
+        .where(Invoices.class_id == class_id)
+        .where(Invoices.billing_period.is_(None))
+        .returning(*INVOICE_ROLLUP_COLUMNS)
+    )
+    result = await db.execute(invoice_querry)
+    await apply_invoice_rollups(db, removed=result.all())
+    await db.commit()
+    await changefeed.publish(
+        changefeed.event(
+            "reservation.removed",
+            class_id,
+            class_object.teacher_id,
+            student_ids=[student_id],
+            enrolled=len(students) - 1,
+            class_size=class_object.class_size,
         )
-    class_object.students.remove(student)
+    )
 
-    student_email = student.email
-    updated_class = delete_reservation_from_calendar(
-        service, event_id=class_object.event_id, target_student_mail=student_email
+    await calendar_call(
+        delete_reservation_from_calendar,
+        service,
+        calendar_or_default(class_object.calendar_id),
+        class_object.event_id,
+        student["email"],
+    )
+    return _reservation_response(
+        class_object,
+        [enrolled for enrolled in students if enrolled["id"] != student_id],
     )
 
-    # invoice deletion
-    invoice_querry = delete(Invoices).filter(Invoices.student_id == student.id)
-    result = await db.execute(invoice_querry)
 
-    # studentclass deletion
+async def remove_reservations(
+    db: AsyncSession,
+    manager: service_dependancy,
+    class_ids: list[int] | None = None,
+    student_ids: list[int] | None = None,
+):
+    """Bulk removal of reservations in one transaction. Class IDs alone cancel whole rosters,
+    student IDs alone remove students from all classes, both remove every matching pair.
+    Deletes only reservation invoices linked to removed reservations, tuition invoices are kept
+    """
+    if not class_ids and not student_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide class_ids, student_ids or both",
+        )
+    service = manager.get_calendar_service()
+    if service is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Login required"
+        )
+    conditions = []
+    if class_ids:
+        conditions.append(StudentsClasses.class_id.in_(class_ids))
+    if student_ids:
+        conditions.append(StudentsClasses.student_id.in_(student_ids))
+
     reservation_deletion_querry = (
         delete(StudentsClasses)
-        .filter(StudentsClasses.student_id == student.id)
-        .filter(StudentsClasses.class_id == class_object.id)
+        .where(*conditions)
+        .returning(StudentsClasses.student_id, StudentsClasses.class_id)
     )
-    result = await db.execute(reservation_deletion_querry)
+    removed = (await db.execute(reservation_deletion_querry)).all()
+    if not removed:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="No matching reservations"
+        )
 
+    invoice_querry = (
+        delete(Invoices)
+        .where(tuple_(Invoices.student_id, Invoices.class_id).in_(removed))
+        .where(Invoices.billing_period.is_(None))
+        .returning(*INVOICE_ROLLUP_COLUMNS)
+    )
+    removed_invoices = (await db.execute(invoice_querry)).all()
+    await apply_invoice_rollups(db, removed=removed_invoices)
+
+    # calendar attendees to drop, grouped per class event
+    removed_class_ids = {row.class_id for row in removed}
+    removed_student_ids = {row.student_id for row in removed}
+    enrolled = (
+        select(func.count(StudentsClasses.id))
+        .where(StudentsClasses.class_id == Classes.id)
+        .scalar_subquery()
+    )
+    event_query = select(
+        Classes.id,
+        Classes.event_id,
+        Classes.calendar_id,
+        Classes.teacher_id,
+        Classes.class_size,
+        enrolled.label("enrolled"),
+    ).where(Classes.id.in_(removed_class_ids))
+    email_query = select(Students.id, Students.email).where(
+        Students.id.in_(removed_student_ids)
+    )
+    classes = {row.id: row for row in await db.execute(event_query)}
+    emails = dict((await db.execute(email_query)).all())
     await db.commit()
-    await db.refresh(class_object)
+    api_logger.info(
+        "Removed %s reservations, %s invoices", len(removed), len(removed_invoices)
+    )
 
-    return class_object
+    removed_students = {}
+    for row in removed:
+        removed_students.setdefault(row.class_id, []).append(row.student_id)
+    await changefeed.publish(
+        *[
+            changefeed.event(
+                "reservation.removed",
+                removed_class_id,
+                classes[removed_class_id].teacher_id,
+                student_ids=student_ids,
+                enrolled=classes[removed_class_id].enrolled,
+                class_size=classes[removed_class_id].class_size,
+            )
+            for removed_class_id, student_ids in removed_students.items()
+        ]
+    )
 
+    attendees = {}
+    for row in removed:
+        attendees.setdefault(row.class_id, []).append(emails[row.student_id])
+    # events of different calendars are updated concurrently
+    await fan_out(
+        [
+            (
+                delete_reservations_from_calendar,
+                service,
+                calendar_or_default(classes[removed_class_id].calendar_id),
+                classes[removed_class_id].event_id,
+                student_emails,
+            )
+            for removed_class_id, student_emails in attendees.items()
+        ]
+    )
 
+    return {
+        "removed_reservations": len(removed),
+        "deleted_invoices": len(removed_invoices),
+        "class_ids": sorted(removed_class_ids),
+    }
+
+
+@single_flight(response_model=list[ClassResponse])
 async def get_student_classes(db: AsyncSession, student_id: int):
     """Return all student classes"""
-    query = (
-        select(Students)
-        .options(joinedload(Students.classes))
-        .filter(Students.id == student_id)
-    )
-    student_result = await db.execute(query)
+    student_result = await db.execute(STUDENT_CLASSES_QUERY, {"id": student_id})
     student = student_result.scalars().first()
 
     if student is None:
@@ -458,33 +751,70 @@ async def get_student_classes(db: AsyncSession, student_id: int):
 # invoices route
 
 
-async def get_all_invoices(
-    db: AsyncSession,
-    page: int,
-    limit: int,
-    payment_status: bool = None,
-    invoice_date=None,
-):
-    """Return all invoices,pagination via page and limit params, filter by payment status or invoice date"""
-    skip = (page - 1) * limit
+async def add_new_invoice(db: AsyncSession, payload):
+    """Add new invoice using InvoiceData schema, paid invoices are paid in full, adds it to report rollups"""
+    new_invoice = Invoices(**payload.dict())
+    if new_invoice.payment_status:
+        new_invoice.paid_amount = new_invoice.amount
+    try:
+        db.add(new_invoice)
+        await db.flush()
+        await apply_invoice_rollups(
+            db, added=[_rollup_row(new_invoice, INVOICE_ROLLUP_COLUMNS)]
+        )
+        await db.commit()
+        await db.refresh(new_invoice)
+        return new_invoice
+    except IntegrityError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Item already exists: {e.orig}",
+        )
 
-    base_query = select(Invoices)
-    if payment_status:
-        base_query = base_query.filter(Invoices.payment_status == payment_status)
-    if invoice_date:
-        base_query = base_query.filter(Invoices.invoice_date == invoice_date)
 
-    query = base_query.offset(skip).limit(limit)
-    result = await db.execute(query)
-    return result.scalars().all()
+async def update_invoice(db: AsyncSession, payload, id: int):
+    """Update invoice by ID, invoices set paid are paid in full, moves it from its old to its
+    new report rollup, rises 404 if ID not found"""
+    old_rows = await _locked_rollup_rows(db, INVOICE_ROLLUP_COLUMNS, Invoices.id == id)
+    changes = payload.dict(exclude_unset=True)
+    if changes.get("payment_status"):
+        changes["paid_amount"] = changes.get("amount", Invoices.amount)
+    update_query = (
+        update(Invoices)
+        .where(Invoices.id == id)
+        .values(**changes)
+        .returning(*INVOICE_ROLLUP_COLUMNS)
+    )
+    new_rows = (await db.execute(update_query)).all()
+    if not new_rows:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Invoice ID not found"
+        )
+    await apply_invoice_rollups(db, added=new_rows, removed=old_rows)
+    await db.commit()
+    return {"message": "updated"}
+
 
+async def delete_invoice(db: AsyncSession, id: int):
+    """Deletes invoice by ID, refreshes report rollups for invoice date, rises 404 if ID not found"""
+    await delete_items(db, [id], Invoices)
 
+
+@single_flight
+async def get_all_invoices(db: AsyncSession, filters):
+    """Return one page of invoices using InvoiceFilters, filter by payment status, invoice date or date range,
+    students, classes or amount range, archived invoices are listed only with include_archived
+    """
+    return await list_page(db, INVOICE_FILTERS, filters)
+
+
+@single_flight(response_model=StudentResponse)
 async def get_invoice_student(db: AsyncSession, id: int):
-    """Preform joinedload and return student attribute of invoices"""
-    query = (
-        select(Invoices).options(joinedload(Invoices.student)).filter(Invoices.id == id)
-    )
-    result = await db.execute(query)
+    """Preform joinedload and return student attribute of invoices,
+    many to one so the join adds no rows"""
+    result = await db.execute(INVOICE_STUDENT_QUERY, {"id": id})
     invoice_rusult = result.scalars().first()
     if invoice_rusult is None:
         raise HTTPException(
@@ -495,19 +825,197 @@ async def get_invoice_student(db: AsyncSession, id: int):
 
 async def pay_invoice(db: AsyncSession, id: int):
     """Pay student invoice"""
-    query = select(Invoices).filter(Invoices.id == id)
-    result = await db.execute(query)
-    target_invoice = result.scalars().first()
+    query = _by_id_query(Invoices).with_for_update()
+    target_invoice = (await db.execute(query, {"id": id})).scalars().first()
     if not target_invoice:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Invoice ID not found"
         )
+    old_row = _rollup_row(target_invoice, INVOICE_ROLLUP_COLUMNS)
     target_invoice.payment_status = True
+    target_invoice.paid_amount = target_invoice.amount
+    target_invoice.payment_date = datetime.date.today()
+    await db.flush()
+    await apply_invoice_rollups(
+        db,
+        added=[_rollup_row(target_invoice, INVOICE_ROLLUP_COLUMNS)],
+        removed=[old_row],
+    )
     await db.commit()
     await db.refresh(target_invoice)
     return target_invoice
 
 
+# invoice ID in free text payment references, e.g. "June tuition INV-123"
+INVOICE_REFERENCE = re.compile(r"INV-?(\d+)", re.IGNORECASE)
+
+# invoices per UPDATE ... FROM VALUES statement, keeps bound parameters under driver limits
+RECONCILE_CHUNK = 5000
+
+
+def read_payment_csv(content: str):
+    """Parses bank statement CSV with invoice_id or reference, amount and date columns,
+    raises 422 naming the first invalid line"""
+    payments = []
+    for line, row in enumerate(csv.DictReader(io.StringIO(content)), start=1):
+        fields = {
+            key.strip(): value.strip()
+            for key, value in row.items()
+            if key and isinstance(value, str) and value.strip()
+        }
+        try:
+            payments.append(PaymentLine(**fields))
+        except ValidationError as e:
+            error = e.errors()[0]
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Line {line}, {'.'.join(map(str, error['loc']))}: {error['msg']}",
+            )
+    if not payments:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="No payments"
+        )
+    return payments
+
+
+async def _apply_payments(db: AsyncSession, rows):
+    """Adds (invoice_id, amount, payment_date) rows to unpaid invoices with one
+    UPDATE ... FROM VALUES, returns updated invoices"""
+    payments = values(
+        column("invoice_id", Integer),
+        column("amount", MONEY),
+        column("payment_date", Date),
+        name="payments",
+    ).data(rows)
+    if db.bind.dialect.name == "sqlite":
+        # SQLite cant name the columns of VALUES in FROM, a CTE can
+        payments = payments.cte("payments")
+    paid_amount = func.round(Invoices.paid_amount + payments.c.amount, 2)
+    query = (
+        update(Invoices)
+        .where(Invoices.id == payments.c.invoice_id)
+        .where(Invoices.payment_status.is_not(True))
+        .values(
+            paid_amount=paid_amount,
+            payment_status=paid_amount >= Invoices.amount,
+            payment_date=payments.c.payment_date,
+        )
+        .returning(
+            Invoices.id,
+            Invoices.amount,
+            Invoices.paid_amount,
+            Invoices.invoice_date,
+            Invoices.class_id,
+        )
+    )
+    if isinstance(payments, CTE):
+        query = query.add_cte(payments)
+    return (await db.execute(query)).all()
+
+
+def _unmatched(line: int, payment, invoice_id, reason: str):
+    return {
+        "line": line,
+        "invoice_id": invoice_id,
+        "reference": payment.reference,
+        "amount": payment.amount,
+        "reason": reason,
+    }
+
+
+async def reconcile_payments(db: AsyncSession, payments):
+    """Applies bank statement payments (PaymentLine list) to unpaid invoices in one transaction,
+    payments for the same invoice are summed, returns fully paid, partial, overpaid and unmatched payments
+    """
+    unmatched = []
+    # invoice ID -> [summed amount, latest payment date, [(line, payment)]]
+    totals = {}
+    for line, payment in enumerate(payments, start=1):
+        invoice_id = payment.invoice_id
+        if invoice_id is None and payment.reference:
+            found = INVOICE_REFERENCE.search(payment.reference)
+            invoice_id = int(found.group(1)) if found else None
+        if invoice_id is None:
+            unmatched.append(
+                _unmatched(line, payment, None, "No invoice ID or INV-<id> reference")
+            )
+            continue
+        total = totals.setdefault(invoice_id, [0, payment.date, []])
+        total[0] += payment.amount
+        total[1] = max(total[1], payment.date)
+        total[2].append((line, payment))
+
+    invoice_ids = list(totals)
+    updated = []
+    for i in range(0, len(invoice_ids), RECONCILE_CHUNK):
+        rows = [
+            (invoice_id, totals[invoice_id][0], totals[invoice_id][1])
+            for invoice_id in invoice_ids[i : i + RECONCILE_CHUNK]
+        ]
+        old_rows = await _locked_rollup_rows(
+            db,
+            INVOICE_ROLLUP_COLUMNS,
+            Invoices.id.in_([row[0] for row in rows]),
+            Invoices.payment_status.is_not(True),
+        )
+        chunk = await _apply_payments(db, rows)
+        await apply_invoice_rollups(
+            db,
+            added=[_rollup_row(row, INVOICE_ROLLUP_COLUMNS) for row in chunk],
+            removed=old_rows,
+        )
+        updated += chunk
+
+    applied = {row.id for row in updated}
+    missing = [invoice_id for invoice_id in invoice_ids if invoice_id not in applied]
+    already_paid = set()
+    if missing:
+        query = select(Invoices.id).where(Invoices.id.in_(missing))
+        already_paid = set((await db.execute(query)).scalars())
+    for invoice_id in missing:
+        reason = (
+            "Invoice already paid"
+            if invoice_id in already_paid
+            else "Invoice ID not found"
+        )
+        unmatched.extend(
+            _unmatched(line, payment, invoice_id, reason)
+            for line, payment in totals[invoice_id][2]
+        )
+
+    await db.commit()
+
+    report = {
+        "payments": len(payments),
+        "applied_amount": round(sum(totals[row.id][0] for row in updated), 2),
+        "paid": [],
+        "partial": [],
+        "overpaid": [],
+        "unmatched": sorted(unmatched, key=lambda item: item["line"]),
+    }
+    for row in updated:
+        balance = {
+            "invoice_id": row.id,
+            "amount": row.amount,
+            "paid_amount": row.paid_amount,
+            "remaining": round(row.amount - row.paid_amount, 2),
+        }
+        if balance["remaining"] > 0:
+            report["partial"].append(balance)
+            continue
+        report["paid"].append(row.id)
+        if balance["remaining"] < 0:
+            report["overpaid"].append(balance)
+    api_logger.info(
+        "Reconciled %s payments, %s invoices paid, %s partial, %s unmatched",
+        len(payments),
+        len(report["paid"]),
+        len(report["partial"]),
+        len(unmatched),
+    )
+    return report
+
+
 # teachers pay route
 
 
@@ -542,27 +1050,11 @@ async def add_work_hours(db: AsyncSession, teacher_data):
         )
 
 
-async def get_work_hours(
-    db: AsyncSession,
-    page: int,
-    limit: int,
-    teacher_id: int = None,
-    start_date: date = None,
-    end_date: date = None,
-):
-    """Returns a list of teacher work hours filter by teacher id , and combination of start and end times, paginated via page and limit query params"""
-
-    skip = (page - 1) * limit
-
-    base_query = select(TeacherHours)
-    if teacher_id:
-        base_query = base_query.filter(TeacherHours.teacher_id == teacher_id)
-    if start_date and end_date:
-        base_query = base_query.filter(TeacherHours.date.between(start_date, end_date))
-    query = base_query.offset(skip).limit(limit)
-
-    result = await db.execute(query)
-    hours_list = result.scalars().all()
+@single_flight
+async def get_work_hours(db: AsyncSession, filters):
+    """Returns one page of teacher work hours using WorkHoursFilters, filter by teachers and date range,
+    archived hours are listed only with include_archived, 404 if nothing found"""
+    hours_list = await list_page(db, WORK_HOURS_FILTERS, filters)
     if not hours_list:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -571,37 +1063,42 @@ async def get_work_hours(
     return hours_list
 
 
+def _paycheck_amount(work_hours: float, hourly: Decimal):
+    """School hours (45 mins) and their pay rounded half up to cents"""
+    school_hours = round(work_hours * 60 / 45, 2)
+    amount = (Decimal(str(school_hours)) * hourly).quantize(
+        CENT, rounding=ROUND_HALF_UP
+    )
+    return school_hours, amount
+
+
 async def generate_paycheck(
     db: AsyncSession, start_date: date, end_date: date, teacher_id: int
 ):
     """Generates paycheck for teacher for given date range and saves it to table paychecks, counts school hours(45 mins)"""
 
-    teacher_query = select(Teachers).filter(Teachers.id == teacher_id)
-    teacher_result = await db.execute(teacher_query)
-
-    target_teacher = teacher_result.scalars().first()
-
+    # hours are summed by the database, money is computed with exact decimals
     query = (
-        select(TeacherHours)
-        .filter(TeacherHours.teacher_id == teacher_id)
+        select(
+            Teachers.hourly,
+            func.count(TeacherHours.id).label("entries"),
+            func.sum(TeacherHours.hours).label("work_hours"),
+        )
+        .join(TeacherHours, TeacherHours.teacher_id == Teachers.id)
+        .filter(Teachers.id == teacher_id)
         .filter(TeacherHours.date.between(start_date, end_date))
+        .group_by(Teachers.hourly)
     )
-    result = await db.execute(query)
-    hours_list = result.scalars().all()
-    if not hours_list:
+    totals = (await db.execute(query)).first()
+    if totals is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Target hours for date range and teacher id not found",
         )
 
-    hourly = target_teacher.hourly
-
-    work_hours = 0
-    for hour in hours_list:
-        work_hours += hour.hours
-
-    school_hours = round(work_hours * 60 / 45, 2)
-    payment_amount = round(school_hours * hourly, 2)
+    hourly = totals.hourly
+    work_hours = totals.work_hours
+    school_hours, payment_amount = _paycheck_amount(work_hours, hourly)
 
     check_exist_paycheck_query = (
         select(Paychecks)
@@ -627,35 +1124,75 @@ async def generate_paycheck(
         end_date=end_date,
     )
     db.add(new_paycheck)
+    await db.flush()
+    await apply_paycheck_rollups(
+        db, added=[_rollup_row(new_paycheck, PAYCHECK_ROLLUP_COLUMNS)]
+    )
     await db.commit()
     await db.refresh(new_paycheck)
     return new_paycheck
 
 
-async def get_all_paychecks(
-    db: AsyncSession,
-    page: int,
-    limit: int,
-    teacher_id: int = None,
-    is_payed: bool = None,
-    start_date: date = None,
-    end_date: date = None,
-):
-    """Returns all paychecks for, paginated via page and limit query params, filter by teacher id , payment status, and combination of start and end date"""
-    skip = (page - 1) * limit
-    base_query = select(Paychecks)
-    if teacher_id:
-        base_query = base_query.filter(Paychecks.teacher_id == teacher_id)
-    if is_payed is not None:
-        base_query = base_query.filter(Paychecks.payment_status == is_payed)
-    if start_date and end_date:
-        base_query = base_query.filter(Paychecks.start_date >= start_date).filter(
-            Paychecks.end_date <= end_date
-        )
-    query = base_query.offset(skip).limit(limit)
-
-    results = await db.execute(query)
-    all_paychecks = results.scalars().all()
+async def generate_paychecks(db: AsyncSession, start_date: date, end_date: date):
+    """Generates paychecks for every teacher with work hours in date range that has no paycheck
+    for it yet, in one transaction, returns number of paychecks created"""
+    generated = (
+        select(Paychecks.id)
+        .where(Paychecks.teacher_id == Teachers.id)
+        .where(Paychecks.start_date == start_date)
+        .where(Paychecks.end_date == end_date)
+        .exists()
+    )
+    query = (
+        select(
+            Teachers.id,
+            Teachers.hourly,
+            func.sum(TeacherHours.hours).label("work_hours"),
+        )
+        .join(TeacherHours, TeacherHours.teacher_id == Teachers.id)
+        .filter(TeacherHours.date.between(start_date, end_date))
+        .filter(~generated)
+        .group_by(Teachers.id, Teachers.hourly)
+    )
+    paychecks = []
+    for row in await db.execute(query):
+        school_hours, amount = _paycheck_amount(row.work_hours, row.hourly)
+        paychecks.append(
+            dict(
+                teacher_id=row.id,
+                amount=amount,
+                school_hours=school_hours,
+                work_hours=row.work_hours,
+                hourly=row.hourly,
+                start_date=start_date,
+                end_date=end_date,
+                creation_date=date.today(),
+            )
+        )
+    if paychecks:
+        await db.execute(insert(Paychecks), paychecks)
+        await apply_paycheck_rollups(
+            db,
+            added=[
+                (
+                    paycheck["creation_date"],
+                    paycheck["teacher_id"],
+                    paycheck["work_hours"],
+                    paycheck["amount"],
+                    False,
+                )
+                for paycheck in paychecks
+            ],
+        )
+    await db.commit()
+    return len(paychecks)
+
+
+@single_flight
+async def get_all_paychecks(db: AsyncSession, filters):
+    """Returns one page of paychecks using PaycheckFilters, filter by teachers, payment status,
+    start and end date, 404 if nothing found"""
+    all_paychecks = await list_page(db, PAYCHECK_FILTERS, filters)
     if not all_paychecks:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Paychecks not found"
@@ -665,15 +1202,366 @@ async def get_all_paychecks(
 
 async def pay_paycheck(db: AsyncSession, paycheck_id: int):
     """Pay paycheck, change payment status of Paycheck model to true"""
-    query = select(Paychecks).filter(Paychecks.id == paycheck_id)
-    result = await db.execute(query)
-    target_paycheck = result.scalars().first()
+    query = _by_id_query(Paychecks).with_for_update()
+    target_paycheck = (await db.execute(query, {"id": paycheck_id})).scalars().first()
     if not target_paycheck:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Paycheck ID not found"
         )
+    old_row = _rollup_row(target_paycheck, PAYCHECK_ROLLUP_COLUMNS)
     target_paycheck.payment_status = True
     target_paycheck.payment_date = datetime.datetime.today().date()
+    await db.flush()
+    await apply_paycheck_rollups(
+        db,
+        added=[_rollup_row(target_paycheck, PAYCHECK_ROLLUP_COLUMNS)],
+        removed=[old_row],
+    )
     await db.commit()
     await db.refresh(target_paycheck)
     return target_paycheck
+
+
+async def delete_paycheck(db: AsyncSession, paycheck_id: int):
+    """Deletes paycheck by ID, refreshes report rollups for creation date, rises 404 if ID not found"""
+    await delete_items(db, [paycheck_id], Paychecks)
+
+
+# reports route
+
+
+def _month_expression(db: AsyncSession, column):
+    """Returns YYYY-MM expression of date column, sqlite and postgres use different functions"""
+    if db.bind.dialect.name == "sqlite":
+        return func.strftime("%Y-%m", column)
+    return func.to_char(column, "YYYY-MM")
+
+
+def _paid_amount(amount_column, status_column):
+    """Sum expression of amount for rows with payment status true, paychecks are paid in full"""
+    return func.coalesce(
+        func.sum(case((status_column.is_(True), amount_column), else_=0)), 0
+    )
+
+
+# columns of an invoice or paycheck feeding its daily rollup row, invoices count their paid
+# amount, paychecks their amount once paid
+INVOICE_ROLLUP_COLUMNS = (
+    Invoices.invoice_date,
+    Invoices.class_id,
+    Invoices.amount,
+    Invoices.paid_amount,
+)
+PAYCHECK_ROLLUP_COLUMNS = (
+    Paychecks.creation_date,
+    Paychecks.teacher_id,
+    Paychecks.work_hours,
+    Paychecks.amount,
+    Paychecks.payment_status,
+)
+
+
+def _rollup_row(item, columns):
+    """Rollup columns of an ORM object as a row, like RETURNING of the columns"""
+    return tuple(getattr(item, column.key) for column in columns)
+
+
+async def _locked_rollup_rows(db: AsyncSession, columns, *conditions):
+    """Rollup columns of rows about to change, locked until commit so the values
+    stay the ones taken out of the rollups, empty when rollups are disabled"""
+    if not USE_REPORT_ROLLUPS:
+        return []
+    query = select(*columns).where(*conditions).with_for_update()
+    return (await db.execute(query)).all()
+
+
+def _money(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+async def _upsert_rollup_deltas(db: AsyncSession, Rollup, keys, deltas, removed):
+    """Adds deltas ({key tuple: {total column: delta}}) to Rollup rows with one upsert,
+    writers of the same key serialize on its row and both deltas count. Rows left without
+    items by removals are deleted"""
+    if not deltas:
+        return
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    totals = list(next(iter(deltas.values())))
+    query = upsert(Rollup)
+    query = query.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(Rollup, name) + query.excluded[name] for name in totals},
+    )
+    await db.execute(
+        query, [dict(zip(keys, key), **values) for key, values in deltas.items()]
+    )
+    if removed:
+        key_columns = tuple_(*[getattr(Rollup, key) for key in keys])
+        await db.execute(
+            delete(Rollup)
+            .where(key_columns.in_(list(deltas)))
+            .where(getattr(Rollup, totals[0]) <= 0)
+        )
+
+
+async def apply_invoice_rollups(db: AsyncSession, added=(), removed=()):
+    """Adds invoice rows (INVOICE_ROLLUP_COLUMNS) to their daily rollups and takes removed
+    rows out inside current transaction, updates pass the row before as removed and after as added
+    """
+    if not USE_REPORT_ROLLUPS:
+        return
+    deltas = {}
+    for sign, rows in ((1, added), (-1, removed)):
+        for day, class_id, amount, paid_amount in rows:
+            totals = deltas.setdefault(
+                (day, class_id or 0),
+                {"invoice_count": 0, "invoiced_amount": 0, "paid_amount": 0},
+            )
+            totals["invoice_count"] += sign
+            totals["invoiced_amount"] += sign * _money(amount)
+            totals["paid_amount"] += sign * _money(paid_amount or 0)
+    await _upsert_rollup_deltas(
+        db, InvoiceDailyRollup, ["day", "class_id"], deltas, removed
+    )
+
+
+async def apply_paycheck_rollups(db: AsyncSession, added=(), removed=()):
+    """Adds paycheck rows (PAYCHECK_ROLLUP_COLUMNS) to their daily rollups and takes removed
+    rows out inside current transaction"""
+    if not USE_REPORT_ROLLUPS:
+        return
+    deltas = {}
+    for sign, rows in ((1, added), (-1, removed)):
+        for day, teacher_id, work_hours, amount, payment_status in rows:
+            totals = deltas.setdefault(
+                (day, teacher_id),
+                {"paycheck_count": 0, "work_hours": 0, "amount": 0, "paid_amount": 0},
+            )
+            totals["paycheck_count"] += sign
+            totals["work_hours"] += sign * (work_hours or 0)
+            totals["amount"] += sign * _money(amount)
+            if payment_status:
+                totals["paid_amount"] += sign * _money(amount)
+    await _upsert_rollup_deltas(
+        db, PaycheckDailyRollup, ["day", "teacher_id"], deltas, removed
+    )
+
+
+async def refresh_invoice_rollups(db):
+    """Rebuilds all invoice rollup rows inside current transaction (session or connection),
+    archived invoices are included so archival keeps report totals"""
+    invoices = with_archive(Invoices, include_archived=True)
+    class_id = func.coalesce(invoices.c.class_id, 0)
+    aggregate_query = select(
+        invoices.c.invoice_date,
+        class_id,
+        func.count(invoices.c.id),
+        func.sum(invoices.c.amount),
+        func.coalesce(func.sum(invoices.c.paid_amount), 0),
+    ).group_by(invoices.c.invoice_date, class_id)
+    await db.execute(delete(InvoiceDailyRollup))
+    await db.execute(
+        insert(InvoiceDailyRollup).from_select(
+            ["day", "class_id", "invoice_count", "invoiced_amount", "paid_amount"],
+            aggregate_query,
+        )
+    )
+
+
+async def refresh_paycheck_rollups(db):
+    """Rebuilds all paycheck rollup rows inside current transaction (session or connection)"""
+    aggregate_query = select(
+        Paychecks.creation_date,
+        Paychecks.teacher_id,
+        func.count(Paychecks.id),
+        func.sum(Paychecks.work_hours),
+        func.sum(Paychecks.amount),
+        _paid_amount(Paychecks.amount, Paychecks.payment_status),
+    ).group_by(Paychecks.creation_date, Paychecks.teacher_id)
+    await db.execute(delete(PaycheckDailyRollup))
+    await db.execute(
+        insert(PaycheckDailyRollup).from_select(
+            [
+                "day",
+                "teacher_id",
+                "paycheck_count",
+                "work_hours",
+                "amount",
+                "paid_amount",
+            ],
+            aggregate_query,
+        )
+    )
+
+
+async def rebuild_report_rollups(db: AsyncSession):
+    """Rebuilds all rollup tables from invoices and paychecks, use after enabling rollups on existing data"""
+    if not USE_REPORT_ROLLUPS:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Report rollups are disabled"
+        )
+    if db.bind.dialect.name == "postgresql":
+        # writers add their deltas after the rebuilt rows are committed
+        await db.execute(
+            text(
+                "LOCK TABLE invoice_daily_rollups, paycheck_daily_rollups IN EXCLUSIVE MODE"
+            )
+        )
+    await refresh_invoice_rollups(db)
+    await refresh_paycheck_rollups(db)
+    await db.commit()
+    return {"message": "rollups rebuilt"}
+
+
+@single_flight
+async def get_revenue_report(
+    db: AsyncSession,
+    group_by: str,
+    start_date: date = None,
+    end_date: date = None,
+):
+    """Returns invoiced, paid and outstanding totals grouped by class, teacher, student or month,
+    reads daily rollups when enabled, student grouping always aggregates invoices. Includes archived invoices
+    """
+    invoices = with_archive(Invoices, include_archived=True)
+    classes = with_archive(Classes, include_archived=True)
+    if USE_REPORT_ROLLUPS and group_by != "student":
+        source = InvoiceDailyRollup
+        day_column = InvoiceDailyRollup.day
+        class_column = func.nullif(InvoiceDailyRollup.class_id, 0)
+        invoice_count = func.sum(InvoiceDailyRollup.invoice_count)
+        invoiced = func.sum(InvoiceDailyRollup.invoiced_amount)
+        paid = func.sum(InvoiceDailyRollup.paid_amount)
+    else:
+        source = invoices
+        day_column = invoices.c.invoice_date
+        class_column = invoices.c.class_id
+        invoice_count = func.count(invoices.c.id)
+        invoiced = func.sum(invoices.c.amount)
+        paid = func.sum(invoices.c.paid_amount)
+
+    if group_by == "class":
+        key = class_column
+    elif group_by == "teacher":
+        key = classes.c.teacher_id
+    elif group_by == "student":
+        key = invoices.c.student_id
+    else:
+        key = _month_expression(db, day_column)
+
+    query = (
+        select(
+            key.label("key"),
+            invoice_count.label("invoice_count"),
+            invoiced.label("invoiced"),
+            paid.label("paid"),
+        )
+        .select_from(source)
+        .group_by(key)
+        .order_by(key)
+    )
+    if group_by == "teacher":
+        query = query.join(classes, class_column == classes.c.id)
+    if start_date:
+        query = query.filter(day_column >= start_date)
+    if end_date:
+        query = query.filter(day_column <= end_date)
+
+    result = await db.execute(query)
+    return [
+        {
+            "key": None if row.key is None else str(row.key),
+            "invoice_count": row.invoice_count,
+            "invoiced": round(row.invoiced or 0, 2),
+            "paid": round(row.paid or 0, 2),
+            "outstanding": round((row.invoiced or 0) - (row.paid or 0), 2),
+        }
+        for row in result
+    ]
+
+
+@single_flight
+async def get_outstanding_balances(db: AsyncSession, page: int, limit: int):
+    """Returns students with unpaid invoices ordered by outstanding amount (amount less paid amount),
+    pagination via page and limit params"""
+    skip = (page - 1) * limit
+    outstanding = func.sum(Invoices.amount - Invoices.paid_amount)
+    query = (
+        select(
+            Students.id.label("student_id"),
+            Students.first_name,
+            Students.last_name,
+            Students.email,
+            func.count(Invoices.id).label("unpaid_invoices"),
+            outstanding.label("outstanding"),
+        )
+        .join(Invoices, Invoices.student_id == Students.id)
+        .filter(Invoices.payment_status.is_not(True))
+        .group_by(Students.id, Students.first_name, Students.last_name, Students.email)
+        .order_by(outstanding.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return result.mappings().all()
+
+
+@single_flight
+async def get_payroll_report(
+    db: AsyncSession,
+    group_by: str,
+    start_date: date = None,
+    end_date: date = None,
+):
+    """Returns paycheck totals grouped by teacher or month of paycheck creation, reads daily rollups when enabled"""
+    if USE_REPORT_ROLLUPS:
+        day_column = PaycheckDailyRollup.day
+        teacher_column = PaycheckDailyRollup.teacher_id
+        paycheck_count = func.sum(PaycheckDailyRollup.paycheck_count)
+        work_hours = func.sum(PaycheckDailyRollup.work_hours)
+        amount = func.sum(PaycheckDailyRollup.amount)
+        paid = func.sum(PaycheckDailyRollup.paid_amount)
+    else:
+        day_column = Paychecks.creation_date
+        teacher_column = Paychecks.teacher_id
+        paycheck_count = func.count(Paychecks.id)
+        work_hours = func.sum(Paychecks.work_hours)
+        amount = func.sum(Paychecks.amount)
+        paid = _paid_amount(Paychecks.amount, Paychecks.payment_status)
+
+    if group_by == "teacher":
+        key = teacher_column
+    else:
+        key = _month_expression(db, day_column)
+
+    query = (
+        select(
+            key.label("key"),
+            paycheck_count.label("paycheck_count"),
+            work_hours.label("work_hours"),
+            amount.label("amount"),
+            paid.label("paid"),
+        )
+        .group_by(key)
+        .order_by(key)
+    )
+    if start_date:
+        query = query.filter(day_column >= start_date)
+    if end_date:
+        query = query.filter(day_column <= end_date)
+
+    result = await db.execute(query)
+    return [
+        {
+            "key": str(row.key),
+            "paycheck_count": row.paycheck_count,
+            "work_hours": round(row.work_hours or 0, 2),
+            "amount": round(row.amount or 0, 2),
+            "paid": round(row.paid or 0, 2),
+            "unpaid": round((row.amount or 0) - (row.paid or 0), 2),
+        }
+        for row in result
+    ]
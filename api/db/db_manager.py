@@ -1,8 +1,13 @@
+import itertools
 import os
+import time
+from collections import Counter
 from typing import Annotated
 
 import dotenv
-from fastapi import Depends, HTTPException
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.engine.default import CacheStats
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 
@@ -13,20 +18,145 @@ if os.getenv("USE_LOCAL_DB") == True:
 else:
     DATABASE_URL = os.getenv("POSTGRESQL_URL")
 
+# comma separated read replica urls for list and report endpoints, unset reads from the primary
+READ_REPLICA_URLS = [
+    url.strip() for url in os.getenv("READ_REPLICA_URLS", "").split(",") if url.strip()
+]
+
+# seconds a client keeps reading from the primary after a write, covers replication lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+
+# cookie holding the time of the client's last write
+LAST_WRITE_COOKIE = "last_write"
+
+# key of read session info holding that time, api.singleflight reads it
+LAST_WRITE_INFO = "last_write"
+
+# log every SQL statement, turn off for benchmarks and production load
+DB_ECHO = os.getenv("DB_ECHO", "True") == "True"
+
+# compiled forms kept per engine, list filter combinations alone take a few hundred
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", 1200))
+
+# statements asyncpg keeps prepared per connection, 0 prepares on every execution
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(
+    os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", 500)
+)
 
 Base = declarative_base()
 
+# engine name -> Counter of statements by compiled cache outcome
+_compile_cache_stats = {}
+
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores foreign keys and ON DELETE rules unless enabled per connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def _count_compile_cache(stats: Counter):
+    """Counts how statements of an engine got their compiled form"""
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        if context is not None:
+            stats[context.cache_hit] += 1
+
+    return before_cursor_execute
+
+
+def _create_engine(url: str, name: str):
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args["prepared_statement_cache_size"] = DB_PREPARED_STATEMENT_CACHE_SIZE
+    engine = create_async_engine(
+        url,
+        echo=DB_ECHO,
+        query_cache_size=DB_QUERY_CACHE_SIZE,
+        connect_args=connect_args,
+    )
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", _enable_sqlite_foreign_keys)
+    stats = _compile_cache_stats[name] = Counter()
+    event.listen(
+        engine.sync_engine, "before_cursor_execute", _count_compile_cache(stats)
+    )
+    return engine
 
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+
+def get_compile_cache_stats():
+    """Returns per engine counts of statements compiled, reused from the compiled cache
+    and run without caching (text and DDL), counted since worker start"""
+    return [
+        {
+            "engine": name,
+            "hits": stats[CacheStats.CACHE_HIT],
+            "misses": stats[CacheStats.CACHE_MISS],
+            "uncached": sum(stats.values())
+            - stats[CacheStats.CACHE_HIT]
+            - stats[CacheStats.CACHE_MISS],
+        }
+        for name, stats in _compile_cache_stats.items()
+    ]
+
+
+# writer, every mutation and read your writes traffic
+async_engine = _create_engine(DATABASE_URL, "primary")
 AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
 
+# readers, picked round robin per request
+read_engines = [
+    _create_engine(url, f"replica_{number}")
+    for number, url in enumerate(READ_REPLICA_URLS, 1)
+]
+_read_sessions = itertools.cycle(
+    [async_sessionmaker(bind=engine, expire_on_commit=False) for engine in read_engines]
+    or [AsyncSessionLocal]
+)
 
-async def get_db():
+
+def last_write_time(request: Request):
+    """Time of the client's last write, 0 without a valid cookie"""
     try:
-        async with AsyncSessionLocal() as session:
-            yield session
-    except Exception as e:
-        raise HTTPException(status_code=404, detail=f"{e}")
+        return float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return 0.0
+
+
+def wrote_recently(request: Request):
+    """True when the client wrote within READ_YOUR_WRITES_SECONDS"""
+    return time.time() - last_write_time(request) < READ_YOUR_WRITES_SECONDS
+
+
+async def get_db():
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+async def get_read_db(request: Request):
+    """Session on a read replica, on the primary right after the client wrote"""
+    session_maker = next(_read_sessions)
+    if wrote_recently(request):
+        session_maker = AsyncSessionLocal
+    async with session_maker() as session:
+        session.info[LAST_WRITE_INFO] = last_write_time(request)
+        yield session
+
+
+async def read_your_writes_middleware(request: Request, call_next):
+    """Marks clients that changed data so their next reads go to the primary and
+    dont join coalesced reads that started before the write"""
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            str(time.time()),
+            max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+            httponly=True,
+        )
+    return response
 
 
 db_dependancy = Annotated[async_sessionmaker, Depends(get_db)]
+read_db_dependancy = Annotated[async_sessionmaker, Depends(get_read_db)]
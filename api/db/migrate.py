@@ -0,0 +1,270 @@
+"""One time database setup, run once per deploy before starting the API workers.
+
+    python -m api.db.migrate
+
+Creates missing tables, applies versioned steps from MIGRATIONS that
+create_all cannot express, such as altering existing columns, then creates
+missing indexes.
+"""
+
+import asyncio
+
+from sqlalchemy import Numeric, insert, inspect, select, text
+from sqlalchemy.schema import CreateTable
+
+from api.db.db_manager import Base, async_engine
+from api.db.models import SchemaMigrations
+from api.logger import api_logger
+
+
+async def _foreign_key_delete_rules(conn):
+    """Recreates foreign keys with the ON DELETE rules declared in models. SQLite cant alter
+    constraints, its tables whose rules differ are rebuilt"""
+    if conn.dialect.name == "sqlite":
+        await _rebuild_sqlite_delete_rules(conn)
+        return
+    if conn.dialect.name != "postgresql":
+        return
+    for table in Base.metadata.sorted_tables:
+        for foreign_key in table.foreign_keys:
+            if foreign_key.ondelete is None:
+                continue
+            column = foreign_key.parent.name
+            name = f"{table.name}_{column}_fkey"
+            await conn.execute(
+                text(
+                    f"ALTER TABLE {table.name} DROP CONSTRAINT IF EXISTS {name}, "
+                    f"ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+                    f"REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name}) "
+                    f"ON DELETE {foreign_key.ondelete}"
+                )
+            )
+
+
+def _stale_sqlite_tables(sync_conn):
+    """Tables whose foreign keys have other ON DELETE rules than declared in models"""
+    inspector = inspect(sync_conn)
+    existing = set(inspector.get_table_names())
+    stale = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing or not table.foreign_keys:
+            continue
+        declared = {
+            (key.parent.name, (key.ondelete or "NO ACTION").upper())
+            for key in table.foreign_keys
+        }
+        actual = {
+            (
+                key["constrained_columns"][0],
+                key["options"].get("ondelete", "NO ACTION").upper(),
+            )
+            for key in inspector.get_foreign_keys(table.name)
+        }
+        if declared != actual:
+            stale.append(table)
+    return stale
+
+
+async def _rebuild_sqlite_delete_rules(conn):
+    """Copies stale tables into new ones created from models. The old table is renamed
+    first with legacy_alter_table so references of other tables keep pointing at the
+    new one and dropping it triggers no ON DELETE actions. Foreign keys are checked on
+    commit, rows left orphaned by old deletes fail the migration"""
+    stale = await conn.run_sync(_stale_sqlite_tables)
+    if not stale:
+        return
+    await conn.execute(text("PRAGMA defer_foreign_keys=ON"))
+    await conn.execute(text("PRAGMA legacy_alter_table=ON"))
+    for table in stale:
+        api_logger.info("Rebuilding %s with declared ON DELETE rules", table.name)
+        columns = ", ".join(column.name for column in table.columns)
+        await conn.execute(
+            text(f"ALTER TABLE {table.name} RENAME TO _{table.name}_old")
+        )
+        await conn.execute(CreateTable(table))
+        await conn.execute(
+            text(
+                f"INSERT INTO {table.name} ({columns}) "
+                f"SELECT {columns} FROM _{table.name}_old"
+            )
+        )
+        await conn.execute(text(f"DROP TABLE _{table.name}_old"))
+    await conn.execute(text("PRAGMA legacy_alter_table=OFF"))
+
+
+async def _add_missing_columns(conn, columns):
+    """Adds (table, column) pairs declared in models that the database lacks, nullable
+    unless the column has a server default, tables created by create_all already have them
+    """
+    existing = await conn.run_sync(
+        lambda sync_conn: {
+            table: {column["name"] for column in inspect(sync_conn).get_columns(table)}
+            for table, _ in columns
+        }
+    )
+    for table, column in columns:
+        if column in existing[table]:
+            continue
+        declared = Base.metadata.tables[table].c[column]
+        definition = declared.type.compile(conn.dialect)
+        if declared.server_default is not None:
+            definition += f" DEFAULT {declared.server_default.arg} NOT NULL"
+        await conn.execute(
+            text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        )
+
+
+async def _billing_columns(conn):
+    """Class tuition and invoice billing period, also on the archive tables"""
+    await _add_missing_columns(
+        conn,
+        [
+            ("classes", "tuition"),
+            ("classes_archive", "tuition"),
+            ("invoices", "billing_period"),
+            ("invoices_archive", "billing_period"),
+        ],
+    )
+
+
+async def _invoice_payment_columns(conn):
+    """Paid amount and payment date of invoices, paid invoices count as paid in full"""
+    await _add_missing_columns(
+        conn,
+        [
+            ("invoices", "paid_amount"),
+            ("invoices", "payment_date"),
+            ("invoices_archive", "paid_amount"),
+            ("invoices_archive", "payment_date"),
+        ],
+    )
+    for table in ("invoices", "invoices_archive"):
+        await conn.execute(
+            text(
+                f"UPDATE {table} SET paid_amount = amount "
+                f"WHERE payment_status AND (paid_amount IS NULL OR paid_amount = 0)"
+            )
+        )
+
+
+async def _money_columns(conn):
+    """Converts money columns from double precision to NUMERIC(12, 2), rounding to cents.
+    Postgres only, SQLite keeps its column affinity and values are rounded when read"""
+    if conn.dialect.name != "postgresql":
+        return
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            if type(column.type) is not Numeric:
+                continue
+            column_type = column.type.compile(conn.dialect)
+            await conn.execute(
+                text(
+                    f"ALTER TABLE {table.name} ALTER COLUMN {column.name} "
+                    f"TYPE {column_type} USING round({column.name}::numeric, 2)"
+                )
+            )
+
+
+async def _calendar_columns(conn):
+    """Teacher calendars and the calendar of each class event, existing rows keep
+    CALENDAR_ID through the unset default"""
+    await _add_missing_columns(
+        conn,
+        [
+            ("teachers", "calendar_id"),
+            ("classes", "calendar_id"),
+            ("classes_archive", "calendar_id"),
+        ],
+    )
+
+
+async def _rollup_keys(conn):
+    """Rebuilds report rollups keyed by day and class (0 without class) or teacher, so rows
+    duplicated by concurrent writers are merged before the unique indexes are created"""
+    from api.crud import refresh_invoice_rollups, refresh_paycheck_rollups
+
+    await refresh_invoice_rollups(conn)
+    await refresh_paycheck_rollups(conn)
+
+
+async def _rollup_paid_amounts(conn):
+    """Rebuilds invoice rollups counting the paid amount of invoices, partial payments included"""
+    from api.crud import refresh_invoice_rollups
+
+    await refresh_invoice_rollups(conn)
+
+
+async def _unique_reservations(conn):
+    """Removes duplicate reservations, keeping the first, so the unique
+    (student_id, class_id) index can be created"""
+    await conn.execute(
+        text(
+            "DELETE FROM students_classes WHERE id NOT IN "
+            "(SELECT min(id) FROM students_classes GROUP BY student_id, class_id)"
+        )
+    )
+
+
+async def _idempotency_headers(conn):
+    """Response headers of stored idempotent responses"""
+    await _add_missing_columns(conn, [("idempotency_keys", "headers")])
+
+
+# (version, description, async step taking a connection), applied in order, once
+MIGRATIONS = [
+    ("0001", "ON DELETE rules for foreign keys", _foreign_key_delete_rules),
+    ("0002", "Class tuition and invoice billing period", _billing_columns),
+    ("0003", "Invoice paid amount and payment date", _invoice_payment_columns),
+    ("0004", "Money columns as NUMERIC(12, 2)", _money_columns),
+    ("0005", "Teacher and class calendar IDs", _calendar_columns),
+    ("0006", "Unique day keys of report rollups", _rollup_keys),
+    ("0007", "Invoice rollups from paid amounts", _rollup_paid_amounts),
+    ("0008", "Unique reservations of students and classes", _unique_reservations),
+    (
+        "0009",
+        "ON DELETE RESTRICT for invoices and paychecks",
+        _foreign_key_delete_rules,
+    ),
+    ("0010", "Headers of idempotent responses", _idempotency_headers),
+]
+
+
+def _create_missing_indexes(sync_conn):
+    """create_all skips indexes declared later on tables that already exist"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+async def run_migrations(engine=async_engine):
+    """Creates schema and applies pending migrations in one transaction,
+    on Postgres an advisory lock keeps concurrent runs from racing"""
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(724311)"))
+        await conn.run_sync(Base.metadata.create_all)
+
+        applied = set(
+            (await conn.execute(select(SchemaMigrations.version))).scalars().all()
+        )
+        for version, description, step in MIGRATIONS:
+            if version in applied:
+                continue
+            api_logger.info("Applying migration %s: %s", version, description)
+            await step(conn)
+            await conn.execute(
+                insert(SchemaMigrations).values(
+                    version=version, description=description
+                )
+            )
+        # after the steps, indexes may cover columns added by them
+        await conn.run_sync(_create_missing_indexes)
+
+
+async def main():
+    await run_migrations()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
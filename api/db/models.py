@@ -1,11 +1,18 @@
 import datetime
 
-from sqlalchemy import (JSON, Boolean, Column, Date, DateTime, Float,
-                        ForeignKey, Integer, String, Text)
+from sqlalchemy import (DDL, JSON, Boolean, Column, Date, DateTime, Float,
+                        ForeignKey, Index, Integer, Numeric, String, Table,
+                        Text, event, func, literal_column)
 from sqlalchemy.orm import relationship
 
 from api.db.db_manager import Base
 
+# money columns, exact with cents, up to 9 999 999 999.99
+MONEY = Numeric(12, 2)
+
+# relationships are lazy="raise", async sessions cant lazy load so every query names its
+# loader, selectinload for collections and joinedload for many to one
+
 
 class Students(Base):
     """Keeps track of school students"""
@@ -20,9 +27,15 @@ class Students(Base):
     birth_year = Column(Integer, nullable=False)
 
     classes = relationship(
-        "Classes", secondary="students_classes", back_populates="students", lazy=True
+        "Classes",
+        secondary="students_classes",
+        back_populates="students",
+        lazy="raise",
+        passive_deletes=True,
+    )
+    invoices = relationship(
+        "Invoices", back_populates="student", lazy="raise", passive_deletes=True
     )
-    invoices = relationship("Invoices", back_populates="student")
 
 
 class Teachers(Base):
@@ -34,12 +47,18 @@ class Teachers(Base):
     last_name = Column(String(150), nullable=False)
     email = Column(String(250), unique=True, nullable=False)
     phone_num = Column(String(100), nullable=False)
-    hourly = Column(Float, nullable=False)
+    hourly = Column(MONEY, nullable=False)
     hire_date = Column(Date, nullable=False, default=datetime.datetime.now().date())
+    # Google calendar of the teacher's classes, unset uses CALENDAR_ID
+    calendar_id = Column(String(250))
 
-    classes = relationship("Classes", back_populates="teacher")
-    work_hours = relationship("TeacherHours", back_populates="teacher")
-    paychecks = relationship("Paychecks", back_populates="teacher")
+    classes = relationship("Classes", back_populates="teacher", lazy="raise")
+    work_hours = relationship(
+        "TeacherHours", back_populates="teacher", lazy="raise", passive_deletes=True
+    )
+    paychecks = relationship(
+        "Paychecks", back_populates="teacher", lazy="raise", passive_deletes=True
+    )
 
 
 class Classes(Base):
@@ -48,17 +67,30 @@ class Classes(Base):
     __tablename__ = "classes"
     id = Column(Integer, primary_key=True)
     class_name = Column(String(100), nullable=False)
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
+    # teachers with classes cant be deleted, classes own calendar events
+    teacher_id = Column(
+        Integer, ForeignKey("teachers.id", ondelete="RESTRICT"), nullable=False
+    )
     class_size = Column(Integer, nullable=False)
     class_start = Column(DateTime, nullable=False)
     class_end = Column(DateTime, nullable=False)
     event_id = Column(String(150))
+    # calendar holding event_id, the teacher's calendar when the event was created or moved
+    calendar_id = Column(String(250))
     description = Column(Text)
     frequency = Column(JSON)
+    # amount billed per student and month for recurring classes, unset classes are not billed
+    tuition = Column(MONEY)
 
-    teacher = relationship("Teachers", back_populates="classes", uselist=False)
+    teacher = relationship(
+        "Teachers", back_populates="classes", uselist=False, lazy="raise"
+    )
     students = relationship(
-        "Students", secondary="students_classes", back_populates="classes", lazy=True
+        "Students",
+        secondary="students_classes",
+        back_populates="classes",
+        lazy="raise",
+        passive_deletes=True,
     )
 
 
@@ -68,8 +100,24 @@ class StudentsClasses(Base):
     __tablename__ = "students_classes"
 
     id = Column(Integer, primary_key=True)
-    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
-    class_id = Column(Integer, ForeignKey("classes.id"), nullable=False)
+    # lookups by student use the unique index below
+    student_id = Column(
+        Integer,
+        ForeignKey("students.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    class_id = Column(
+        Integer,
+        ForeignKey("classes.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    __table_args__ = (
+        Index(
+            "uq_students_classes_student_class", "student_id", "class_id", unique=True
+        ),
+    )
 
 
 class Invoices(Base):
@@ -77,14 +125,39 @@ class Invoices(Base):
 
     __tablename__ = "invoices"
     id = Column(Integer, primary_key=True)
-    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
-    invoice_date = Column(Date, nullable=False)
+    # invoices are financial records, students and classes with invoices cant be deleted
+    student_id = Column(
+        Integer,
+        ForeignKey("students.id", ondelete="RESTRICT"),
+        nullable=False,
+        index=True,
+    )
+    invoice_date = Column(Date, nullable=False, index=True)
     description = Column(Text)
     payment_status = Column(Boolean, default=False)
-    amount = Column(Float, nullable=False)
-    class_id = Column(Integer, ForeignKey("classes.id"))
+    amount = Column(MONEY, nullable=False)
+    class_id = Column(
+        Integer, ForeignKey("classes.id", ondelete="RESTRICT"), index=True
+    )
+    # first day of the billed month for tuition invoices, one per student, class and month
+    billing_period = Column(Date)
+    # sum of payments, partial payments keep payment_status False
+    paid_amount = Column(MONEY, nullable=False, default=0, server_default="0")
+    payment_date = Column(Date)
 
-    student = relationship("Students", back_populates="invoices", uselist=False)
+    student = relationship(
+        "Students", back_populates="invoices", uselist=False, lazy="raise"
+    )
+
+    __table_args__ = (
+        Index(
+            "uq_invoices_billing_period",
+            "student_id",
+            "class_id",
+            "billing_period",
+            unique=True,
+        ),
+    )
 
 
 class TeacherHours(Base):
@@ -92,11 +165,18 @@ class TeacherHours(Base):
 
     __tablename__ = "teacher_hours"
     id = Column(Integer, primary_key=True)
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
+    teacher_id = Column(
+        Integer,
+        ForeignKey("teachers.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
     hours = Column(Float, nullable=False)
     date = Column(Date, default=datetime.datetime.today().date(), nullable=False)
 
-    teacher = relationship("Teachers", back_populates="work_hours", uselist=False)
+    teacher = relationship(
+        "Teachers", back_populates="work_hours", uselist=False, lazy="raise"
+    )
 
 
 class Paychecks(Base):
@@ -104,17 +184,265 @@ class Paychecks(Base):
 
     __tablename__ = "paychecks"
     id = Column(Integer, primary_key=True)
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
-    amount = Column(Float, nullable=False)
+    # teachers with paychecks cant be deleted, so only their unbilled work hours cascade
+    teacher_id = Column(
+        Integer,
+        ForeignKey("teachers.id", ondelete="RESTRICT"),
+        nullable=False,
+        index=True,
+    )
+    amount = Column(MONEY, nullable=False)
     work_hours = Column(Float, nullable=False)
     school_hours = Column(Float, nullable=False)
-    hourly = Column(Float, nullable=False)
+    hourly = Column(MONEY, nullable=False)
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=False)
     creation_date = Column(
-        Date, default=datetime.datetime.today().date(), nullable=False
+        Date, default=datetime.datetime.today().date(), nullable=False, index=True
     )
     payment_status = Column(Boolean, default=False, nullable=False)
     payment_date = Column(Date)
 
-    teacher = relationship("Teachers", back_populates="paychecks", uselist=False)
+    teacher = relationship(
+        "Teachers", back_populates="paychecks", uselist=False, lazy="raise"
+    )
+
+
+class InvoiceDailyRollup(Base):
+    """Daily invoice totals per class, kept in sync on invoice writes for reporting"""
+
+    __tablename__ = "invoice_daily_rollups"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False, index=True)
+    # 0 for invoices without class, the unique key cant match NULL
+    class_id = Column(Integer, nullable=False, default=0, index=True)
+    invoice_count = Column(Integer, nullable=False, default=0)
+    invoiced_amount = Column(MONEY, nullable=False, default=0)
+    paid_amount = Column(MONEY, nullable=False, default=0)
+
+    # writes upsert their deltas into the row of the day and class
+    __table_args__ = (
+        Index("uq_invoice_daily_rollups_day", "day", "class_id", unique=True),
+    )
+
+
+class PaycheckDailyRollup(Base):
+    """Daily paycheck totals per teacher, kept in sync on paycheck writes for reporting"""
+
+    __tablename__ = "paycheck_daily_rollups"
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False, index=True)
+    teacher_id = Column(Integer, nullable=False, index=True)
+    paycheck_count = Column(Integer, nullable=False, default=0)
+    work_hours = Column(Float, nullable=False, default=0)
+    amount = Column(MONEY, nullable=False, default=0)
+    paid_amount = Column(MONEY, nullable=False, default=0)
+
+    # writes upsert their deltas into the row of the day and teacher
+    __table_args__ = (
+        Index("uq_paycheck_daily_rollups_day", "day", "teacher_id", unique=True),
+    )
+
+
+class SchemaMigrations(Base):
+    """Applied schema migration versions, written by api.db.migrate"""
+
+    __tablename__ = "schema_migrations"
+    version = Column(String(50), primary_key=True)
+    description = Column(Text)
+    applied_at = Column(DateTime, default=datetime.datetime.now, nullable=False)
+
+
+class CalendarTokens(Base):
+    """Google OAuth tokens shared by all workers when TOKEN_STORE=db"""
+
+    __tablename__ = "calendar_tokens"
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False)
+    token = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.now, nullable=False)
+
+
+class OAuthLogins(Base):
+    """Started OAuth logins, any worker can finish them through the callback"""
+
+    __tablename__ = "oauth_logins"
+    state = Column(String(255), primary_key=True)
+    code_verifier = Column(String(255))
+    created_at = Column(
+        DateTime, default=datetime.datetime.now, nullable=False, index=True
+    )
+
+
+class IdempotencyKeys(Base):
+    """Stored responses of mutations sent with an Idempotency-Key header, replayed for retries"""
+
+    __tablename__ = "idempotency_keys"
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    # null while the first request is still running
+    status_code = Column(Integer)
+    content_type = Column(String(100))
+    response = Column(Text)
+    # JSON list of [name, value] response headers, repeated ones included
+    headers = Column(Text)
+    created_at = Column(
+        DateTime, default=datetime.datetime.now, nullable=False, index=True
+    )
+
+
+class ScheduledJobs(Base):
+    """Background jobs of api.scheduler, the lease elects the one worker running a job"""
+
+    __tablename__ = "scheduled_jobs"
+    name = Column(String(100), primary_key=True)
+    # cron expression or @every interval, null runs only on request
+    schedule = Column(String(100))
+    next_run_at = Column(DateTime, index=True)
+    # worker running the job and until when its lease holds, null when idle
+    locked_by = Column(String(100))
+    locked_until = Column(DateTime)
+    updated_at = Column(
+        DateTime,
+        default=datetime.datetime.now,
+        onupdate=datetime.datetime.now,
+        nullable=False,
+    )
+
+    runs = relationship(
+        "JobRuns", back_populates="job", lazy="raise", passive_deletes=True
+    )
+
+
+class JobRuns(Base):
+    """One queued, running or finished run of a scheduled job"""
+
+    __tablename__ = "job_runs"
+    id = Column(Integer, primary_key=True)
+    job_name = Column(
+        String(100),
+        ForeignKey("scheduled_jobs.name", ondelete="CASCADE"),
+        nullable=False,
+    )
+    # schedule or request
+    trigger = Column(String(20), nullable=False)
+    # queued, running, succeeded or failed
+    status = Column(String(20), nullable=False, default="queued")
+    params = Column(JSON, nullable=False, default=dict)
+    result = Column(JSON)
+    error = Column(Text)
+    worker = Column(String(100))
+    created_at = Column(
+        DateTime, default=datetime.datetime.now, nullable=False, index=True
+    )
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    job = relationship("ScheduledJobs", back_populates="runs", lazy="raise")
+
+    __table_args__ = (Index("ix_job_runs_job_status", "job_name", "status", "id"),)
+
+
+def _archive_table(source, *indexed):
+    """Archive copy of source table, same columns without foreign keys or defaults,
+    plus archived_at. Archived rows keep their IDs"""
+    columns = [
+        Column(
+            column.name,
+            column.type,
+            primary_key=column.primary_key,
+            nullable=column.nullable,
+            autoincrement=False,
+        )
+        for column in source.columns
+    ]
+    name = f"{source.name}_archive"
+    indexes = [Index(f"ix_{name}_{column}", column) for column in indexed]
+    return Table(
+        name,
+        Base.metadata,
+        *columns,
+        Column("archived_at", DateTime, server_default=func.now(), nullable=False),
+        *indexes,
+    )
+
+
+class ClassesArchive(Base):
+    """Classes of past terms, moved here by api.archive"""
+
+    __table__ = _archive_table(Classes.__table__, "class_start", "teacher_id")
+
+
+class StudentsClassesArchive(Base):
+    """Reservations of archived classes"""
+
+    __table__ = _archive_table(StudentsClasses.__table__, "class_id", "student_id")
+
+
+class InvoicesArchive(Base):
+    """Paid invoices of past terms and all invoices of archived classes"""
+
+    __table__ = _archive_table(Invoices.__table__, "invoice_date", "student_id")
+
+
+class TeacherHoursArchive(Base):
+    """Past work hours already covered by a paycheck"""
+
+    __table__ = _archive_table(TeacherHours.__table__, "date", "teacher_id")
+
+
+# search, Postgres builds GIN indexes on the same expressions api.search queries
+SEARCH_CONFIG = literal_column("'simple'")
+
+
+def search_document(*columns):
+    """Lowercased columns joined by spaces, constants are inlined so queries match the index expression"""
+    space = literal_column("' '", String)
+    empty = literal_column("''", String)
+    document = func.coalesce(columns[0], empty)
+    for column in columns[1:]:
+        document = document + space + func.coalesce(column, empty)
+    return func.lower(document, type_=String)
+
+
+_students = Students.__table__.c
+_teachers = Teachers.__table__.c
+SEARCH_DOCUMENTS = {
+    "students": search_document(
+        _students.first_name,
+        _students.last_name,
+        _students.email,
+        _students.phone_num,
+        _students.parent_phone,
+    ),
+    "teachers": search_document(
+        _teachers.first_name, _teachers.last_name, _teachers.email, _teachers.phone_num
+    ),
+    "classes": search_document(
+        Classes.__table__.c.class_name, Classes.__table__.c.description
+    ),
+}
+
+for _kind, _document in SEARCH_DOCUMENTS.items():
+    _table = Base.metadata.tables[_kind]
+    _table.append_constraint(
+        Index(
+            f"ix_{_kind}_search_trgm",
+            _document.label("document"),
+            postgresql_using="gin",
+            postgresql_ops={"document": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql")
+    )
+    _table.append_constraint(
+        Index(
+            f"ix_{_kind}_search_tsv",
+            func.to_tsvector(SEARCH_CONFIG, _document),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql")
+    )
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
@@ -0,0 +1,233 @@
+"""Declarative filter and sort specs for list endpoints.
+
+Each spec maps typed query params (pydantic models in schemas) to column
+conditions. A statement is built once per combination of active filters, sort
+and archive flag, with bind parameters for every value including limit and
+offset, so requests only bind values and reuse SQLAlchemy's compiled cache.
+
+Pages select only the columns of the resource's response model as plain row
+tuples and are rendered to JSON directly, skipping ORM objects and response
+model validation of rows that come from the database.
+"""
+
+import datetime
+
+from fastapi.responses import Response
+from pydantic_core import to_json
+from sqlalchemy import Float, Numeric, bindparam, cast, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.archive import with_archive
+from api.db.models import Classes, Invoices, Paychecks, Students, TeacherHours, Teachers
+from api.schemas import (
+    ClassResponse,
+    InvoiceResponse,
+    PaycheckResponse,
+    StudentResponse,
+    TeacherHoursResponse,
+    TeacherResponse,
+)
+
+
+class FilterSpec:
+    """Filters of one resource, param name -> (column name, operator).
+    Operators: eq, ilike (substring), ge, le, in (list), on_date (datetime column on a date)
+    """
+
+    def __init__(self, Model, filters: dict, sort_fields: tuple, Response):
+        self.Model = Model
+        self.filters = filters
+        self.sort_fields = sort_fields
+        # response model fields in their order, pages select just these columns
+        self.columns = tuple(Response.model_fields)
+        self._statements = {}
+
+    def _condition(self, source, name: str):
+        column_name, operator = self.filters[name]
+        column = source.c[column_name]
+        if operator == "eq":
+            return column == bindparam(name, type_=column.type)
+        if operator == "ilike":
+            return column.ilike(bindparam(name))
+        if operator == "ge":
+            return column >= bindparam(name, type_=column.type)
+        if operator == "le":
+            return column <= bindparam(name, type_=column.type)
+        if operator == "in":
+            return column.in_(bindparam(name, expanding=True))
+        if operator == "on_date":
+            return (column >= bindparam(f"{name}_start", type_=column.type)) & (
+                column < bindparam(f"{name}_end", type_=column.type)
+            )
+        raise ValueError(f"Unknown filter operator {operator}")
+
+    @staticmethod
+    def _column(source, name: str):
+        """Selected column, NUMERIC read as float like the response models send money"""
+        column = source.c[name]
+        if isinstance(column.type, Numeric) and column.type.asdecimal:
+            return cast(column, Float).label(name)
+        return column
+
+    def statement(self, names: frozenset, sort: str, include_archived: bool = False):
+        """Returns cached statement for active filter names and sort field"""
+        key = (names, sort, include_archived)
+        statement = self._statements.get(key)
+        if statement is None:
+            source = with_archive(self.Model, include_archived)
+            field = sort.lstrip("-")
+            if field not in self.sort_fields:
+                raise ValueError(f"Unknown sort field {field}")
+            order = source.c[field].desc() if sort.startswith("-") else source.c[field]
+            statement = select(
+                *[self._column(source, name) for name in self.columns]
+            ).where(*[self._condition(source, name) for name in sorted(names)])
+            statement = statement.order_by(
+                *([order] if field == "id" else [order, source.c.id])
+            )
+            statement = statement.limit(bindparam("limit")).offset(bindparam("offset"))
+            self._statements[key] = statement
+        return statement
+
+    def parameters(self, values: dict):
+        """Bind parameter values for active filters"""
+        params = {}
+        for name, value in values.items():
+            operator = self.filters[name][1]
+            if operator == "ilike":
+                params[name] = f"%{value}%"
+            elif operator == "on_date":
+                start = datetime.datetime.combine(value, datetime.time.min)
+                params[f"{name}_start"] = start
+                params[f"{name}_end"] = start + datetime.timedelta(days=1)
+            else:
+                params[name] = value
+        return params
+
+
+class Page:
+    """Rows of one list page as tuples in response model field order"""
+
+    __slots__ = ("columns", "rows", "_json")
+
+    def __init__(self, columns: tuple, rows: list):
+        self.columns = columns
+        self.rows = rows
+        self._json = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        """Rows as dicts, for callers that need them as objects"""
+        for row in self.rows:
+            yield dict(zip(self.columns, row))
+
+    def json(self):
+        """JSON array of the rows, rendered once and shared by coalesced requests"""
+        if self._json is None:
+            columns = self.columns
+            self._json = to_json([dict(zip(columns, row)) for row in self.rows])
+        return self._json
+
+
+def page_response(page: Page):
+    """Response of a list route, rows are sent as read without response model validation"""
+    return Response(content=page.json(), media_type="application/json")
+
+
+async def list_page(db: AsyncSession, spec: FilterSpec, query_params):
+    """Returns one Page of rows for a list params model
+    (page, limit, sort, optional include_archived and filters)"""
+    values = query_params.model_dump(exclude_none=True)
+    page = values.pop("page")
+    limit = values.pop("limit")
+    sort = values.pop("sort", "id")
+    include_archived = values.pop("include_archived", False)
+    statement = spec.statement(frozenset(values), sort, include_archived)
+    params = spec.parameters(values)
+    params.update(limit=limit, offset=(page - 1) * limit)
+    result = await db.execute(statement, params)
+    return Page(spec.columns, result.tuples().all())
+
+
+STUDENT_FILTERS = FilterSpec(
+    Students,
+    {
+        "last_name": ("last_name", "eq"),
+        "email": ("email", "eq"),
+        "phone_num": ("phone_num", "eq"),
+        "birth_year_from": ("birth_year", "ge"),
+        "birth_year_to": ("birth_year", "le"),
+        "ids": ("id", "in"),
+    },
+    ("id", "last_name", "birth_year"),
+    StudentResponse,
+)
+
+TEACHER_FILTERS = FilterSpec(
+    Teachers,
+    {
+        "last_name": ("last_name", "eq"),
+        "email": ("email", "eq"),
+        "phone_num": ("phone_num", "eq"),
+        "hired_from": ("hire_date", "ge"),
+        "hired_to": ("hire_date", "le"),
+        "ids": ("id", "in"),
+    },
+    ("id", "last_name", "hire_date", "hourly"),
+    TeacherResponse,
+)
+
+CLASS_FILTERS = FilterSpec(
+    Classes,
+    {
+        "class_name": ("class_name", "ilike"),
+        "description": ("description", "ilike"),
+        "target_date": ("class_start", "on_date"),
+        "start_from": ("class_start", "ge"),
+        "start_to": ("class_start", "le"),
+        "teacher_id": ("teacher_id", "in"),
+    },
+    ("id", "class_start", "class_name"),
+    ClassResponse,
+)
+
+INVOICE_FILTERS = FilterSpec(
+    Invoices,
+    {
+        "payment_status": ("payment_status", "eq"),
+        "invoice_date": ("invoice_date", "eq"),
+        "date_from": ("invoice_date", "ge"),
+        "date_to": ("invoice_date", "le"),
+        "student_id": ("student_id", "in"),
+        "class_id": ("class_id", "in"),
+        "amount_from": ("amount", "ge"),
+        "amount_to": ("amount", "le"),
+    },
+    ("id", "invoice_date", "amount"),
+    InvoiceResponse,
+)
+
+WORK_HOURS_FILTERS = FilterSpec(
+    TeacherHours,
+    {
+        "teacher_id": ("teacher_id", "in"),
+        "start_date": ("date", "ge"),
+        "end_date": ("date", "le"),
+    },
+    ("id", "date", "hours"),
+    TeacherHoursResponse,
+)
+
+PAYCHECK_FILTERS = FilterSpec(
+    Paychecks,
+    {
+        "teacher_id": ("teacher_id", "in"),
+        "is_payed": ("payment_status", "eq"),
+        "start_date": ("start_date", "ge"),
+        "end_date": ("end_date", "le"),
+    },
+    ("id", "creation_date", "amount"),
+    PaycheckResponse,
+)
@@ -0,0 +1,211 @@
+"""Idempotency-Key support for mutation endpoints.
+
+A POST, PUT, PATCH or DELETE sent with an Idempotency-Key header runs once, its
+response, all headers included, is stored in idempotency_keys for IDEMPOTENCY_TTL
+seconds and replayed for retries with the same key. Concurrent duplicates in the same worker wait for
+the first request and share its response, in other workers they get 409 until
+the first request finished. 5xx responses are not stored, so they can be retried.
+"""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+
+from api.db.db_manager import AsyncSessionLocal
+from api.db.models import IdempotencyKeys
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# seconds a stored response is replayed for the same key
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+
+# seconds between deletes of expired keys, per process
+PRUNE_INTERVAL = 600
+
+MAX_KEY_LENGTH = 255
+
+MUTATION_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+StoredResponse = namedtuple(
+    "StoredResponse",
+    ["fingerprint", "status_code", "content_type", "response", "headers"],
+)
+
+# key -> future of the running request in this worker, resolves to StoredResponse or None
+_inflight = {}
+_last_prune = 0.0
+
+
+def _fingerprint(request: Request, body: bytes):
+    """Hash of method, path, query and body, a key reused for another request is rejected"""
+    digest = hashlib.sha256()
+    for part in (request.method, request.url.path, request.url.query):
+        digest.update(part.encode() + b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _replay(stored: StoredResponse, fingerprint: str):
+    if stored.fingerprint != fingerprint:
+        return JSONResponse(
+            status_code=422,
+            content={"detail": "Idempotency-Key was already used for another request"},
+        )
+    if stored.status_code is None:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Request with this Idempotency-Key is still running"},
+            headers={"Retry-After": "1"},
+        )
+    if stored.headers is None:
+        # stored before response headers were kept
+        return Response(
+            content=stored.response,
+            status_code=stored.status_code,
+            media_type=stored.content_type,
+            headers={"Idempotent-Replayed": "true"},
+        )
+    replay = Response(content=stored.response, status_code=stored.status_code)
+    replay.raw_headers = [
+        *_decode_headers(stored.headers),
+        *replay.raw_headers,
+        (b"idempotent-replayed", b"true"),
+    ]
+    return replay
+
+
+def _encode_headers(raw_headers):
+    """JSON list of [name, value] pairs, repeated headers such as Set-Cookie are kept,
+    content-length is set again for the replayed body"""
+    return json.dumps(
+        [
+            [name.decode("latin-1"), value.decode("latin-1")]
+            for name, value in raw_headers
+            if name != b"content-length"
+        ]
+    )
+
+
+def _decode_headers(headers: str):
+    return [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in json.loads(headers)
+    ]
+
+
+async def _claim(key: str, fingerprint: str):
+    """Returns stored response for key, or None when this request claimed the key"""
+    global _last_prune
+    cutoff = datetime.datetime.now() - datetime.timedelta(seconds=IDEMPOTENCY_TTL)
+    async with AsyncSessionLocal() as session:
+        if time.monotonic() - _last_prune > PRUNE_INTERVAL:
+            _last_prune = time.monotonic()
+            await session.execute(
+                delete(IdempotencyKeys).where(IdempotencyKeys.created_at < cutoff)
+            )
+        stored = await session.get(IdempotencyKeys, key)
+        if stored is not None and stored.created_at >= cutoff:
+            await session.commit()
+            return StoredResponse(
+                stored.fingerprint,
+                stored.status_code,
+                stored.content_type,
+                stored.response,
+                stored.headers,
+            )
+        if stored is not None:
+            await session.delete(stored)
+            await session.flush()
+        session.add(IdempotencyKeys(key=key, fingerprint=fingerprint))
+        try:
+            await session.commit()
+        except IntegrityError:
+            # claimed by another worker in the meantime
+            await session.rollback()
+            return StoredResponse(fingerprint, None, None, None, None)
+    return None
+
+
+async def _store(key: str, stored: StoredResponse):
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(IdempotencyKeys)
+            .where(IdempotencyKeys.key == key)
+            .values(
+                status_code=stored.status_code,
+                content_type=stored.content_type,
+                response=stored.response,
+                headers=stored.headers,
+            )
+        )
+        await session.commit()
+
+
+async def _release(key: str):
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(IdempotencyKeys).where(IdempotencyKeys.key == key))
+        await session.commit()
+
+
+async def idempotency_middleware(request: Request, call_next):
+    """Runs a mutation once per Idempotency-Key and replays its response for retries"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None or request.method not in MUTATION_METHODS:
+        return await call_next(request)
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "detail": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"
+            },
+        )
+    fingerprint = _fingerprint(request, await request.body())
+
+    # duplicates in this worker share the running request's result
+    while (inflight := _inflight.get(key)) is not None:
+        stored = await asyncio.shield(inflight)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    claimed = False
+    try:
+        stored = await _claim(key, fingerprint)
+        if stored is not None:
+            future.set_result(stored)
+            return _replay(stored, fingerprint)
+        claimed = True
+
+        response = await call_next(request)
+        content = b"".join([chunk async for chunk in response.body_iterator])
+        if response.status_code < 500:
+            stored = StoredResponse(
+                fingerprint,
+                response.status_code,
+                response.headers.get("content-type"),
+                content.decode(),
+                _encode_headers(response.raw_headers),
+            )
+            await _store(key, stored)
+            claimed = False
+            future.set_result(stored)
+        # raw headers, a dict would keep one of repeated headers such as Set-Cookie
+        passed = Response(content=content, status_code=response.status_code)
+        passed.raw_headers = list(response.raw_headers)
+        return passed
+    finally:
+        if claimed:
+            await asyncio.shield(_release(key))
+        _inflight.pop(key, None)
+        if not future.done():
+            future.set_result(None)
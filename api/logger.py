@@ -12,9 +12,11 @@ LOG_NAME = "api.log"
 MAX_BACKUPS = 5
 MAX_LOG_SIZE_MB = 50
 
-# sqlalchemy logger
+# sqlalchemy logger, statements are logged only with DB_ECHO=True
 db_logger = logging.getLogger("sqlalchemy.engine")
-db_logger.setLevel(logging.INFO)
+db_logger.setLevel(
+    logging.INFO if os.getenv("DB_ECHO", "True") == "True" else logging.WARNING
+)
 
 # uvicorn logger
 uvicorn_logger = logging.getLogger("uvicorn.error")
@@ -0,0 +1,490 @@
+"""In process scheduler for background jobs.
+
+Every worker runs the scheduler loop from the server lifespan. Job state lives in
+scheduled_jobs and job_runs, a job runs on its schedule or when requested through
+POST /jobs/{name}/run. The worker that takes a job's lease with a conditional UPDATE
+runs it and renews the lease while the job is running, so in a multi worker deployment
+one worker runs a job at a time and a crashed worker's jobs are picked up once its
+lease expires. SCHEDULER_MAX_CONCURRENT_JOBS caps the jobs running in one worker.
+
+Schedules are five field cron expressions (minute hour day month weekday), the
+@hourly, @daily, @weekly, @monthly aliases, or @every intervals such as @every 6h.
+"""
+
+import asyncio
+import datetime
+import inspect
+import os
+import re
+import socket
+import uuid
+from collections import namedtuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api import archive, billing, crud
+from api.db.db_manager import AsyncSessionLocal
+from api.db.models import JobRuns, ScheduledJobs
+from api.logger import api_logger
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "True") == "True"
+
+# seconds between checks for due jobs, requests made in this worker wake it up early
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", 15))
+
+# jobs running at once in one worker
+SCHEDULER_MAX_CONCURRENT_JOBS = int(os.getenv("SCHEDULER_MAX_CONCURRENT_JOBS", 2))
+
+# seconds a lease holds without renewal, renewed every third of it while running
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", 60))
+
+# days finished runs are kept
+JOB_RUNS_KEEP_DAYS = int(os.getenv("JOB_RUNS_KEEP_DAYS", 30))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+
+_EVERY = re.compile(r"@every\s+(\d+(?:\.\d+)?)\s*([smhd])")
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class CronSchedule:
+    """Five field cron expression, fields accept *, lists, ranges and /steps"""
+
+    # (lowest, highest) value of minute, hour, day, month and weekday, sunday is 0 or 7
+    BOUNDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(field, low, high)
+            for field, (low, high) in zip(fields, self.BOUNDS)
+        ]
+        self.weekdays = {day % 7 for day in weekdays}
+        # cron matches either day field when both are restricted
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int):
+        values = set()
+        for part in field.split(","):
+            body, _, step = part.partition("/")
+            if body == "*":
+                start, end = low, high
+            elif "-" in body:
+                start, end = map(int, body.split("-"))
+            else:
+                start = end = int(body)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f"Cron field {field} out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime.datetime):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime.datetime):
+        """First matching minute after moment"""
+        moment = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=5 * 366)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + datetime.timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError("Cron expression never matches")
+
+
+class IntervalSchedule:
+    """Runs every fixed number of seconds"""
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError("Interval must be positive")
+        self.interval = datetime.timedelta(seconds=seconds)
+
+    def next_after(self, moment: datetime.datetime):
+        return moment + self.interval
+
+
+def parse_schedule(expression: str):
+    """Returns schedule with next_after(moment) for a cron expression, alias or @every interval"""
+    expression = expression.strip()
+    every = _EVERY.fullmatch(expression)
+    if every:
+        return IntervalSchedule(float(every.group(1)) * _UNITS[every.group(2)])
+    return CronSchedule(CRON_ALIASES.get(expression, expression))
+
+
+def _interval(hours: float):
+    """Schedule of the older *_INTERVAL_HOURS settings, None when 0"""
+    return f"@every {hours}h" if hours > 0 else None
+
+
+async def run_payroll(start_date: datetime.date = None, end_date: datetime.date = None):
+    """Paychecks for every teacher with work hours in date range, default the previous month"""
+    if start_date is None or end_date is None:
+        end_date = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+        start_date = end_date.replace(day=1)
+    async with AsyncSessionLocal() as db:
+        paychecks = await crud.generate_paychecks(db, start_date, end_date)
+    return {"start_date": start_date, "end_date": end_date, "paychecks": paychecks}
+
+
+Job = namedtuple("Job", ["function", "schedule", "description"])
+
+# name -> job, a job function takes optional keyword params and returns a JSON-able result
+JOBS = {
+    "archive": Job(
+        archive.run_archival,
+        os.getenv("ARCHIVE_SCHEDULE", _interval(archive.ARCHIVE_INTERVAL_HOURS)),
+        "Move past terms to archive tables, params: before",
+    ),
+    "billing": Job(
+        billing.run_billing,
+        os.getenv("BILLING_SCHEDULE", _interval(billing.BILLING_INTERVAL_HOURS)),
+        "Monthly tuition invoices for recurring classes, params: period",
+    ),
+    "payroll": Job(
+        run_payroll,
+        os.getenv("PAYROLL_SCHEDULE"),
+        "Paychecks for all teachers, params: start_date, end_date",
+    ),
+}
+
+# job name -> task running it in this worker
+_running = {}
+_wakeup = asyncio.Event()
+_synced = False
+_last_prune = 0.0
+
+
+def _bind(function, params: dict):
+    """Validates params against the job function signature, returns them converted"""
+    signature = inspect.signature(function)
+    try:
+        bound = signature.bind(**params)
+    except TypeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+    values = {}
+    for name, value in bound.arguments.items():
+        annotation = signature.parameters[name].annotation
+        try:
+            values[name] = TypeAdapter(annotation).validate_python(value)
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid {name}: {e.errors()[0]['msg']}",
+            )
+    return values
+
+
+async def sync_jobs():
+    """Creates rows for registered jobs and applies changed schedules"""
+    global _synced
+    now = datetime.datetime.now()
+    async with AsyncSessionLocal() as session:
+        stored = {
+            job.name: job
+            for job in (await session.execute(select(ScheduledJobs))).scalars()
+        }
+        for name, job in JOBS.items():
+            row = stored.get(name)
+            if row is None:
+                row = ScheduledJobs(name=name)
+                session.add(row)
+            elif row.schedule == job.schedule:
+                continue
+            row.schedule = job.schedule
+            row.next_run_at = (
+                parse_schedule(job.schedule).next_after(now) if job.schedule else None
+            )
+        await session.commit()
+    _synced = True
+
+
+def _db_clock(session: AsyncSession, seconds: float = 0):
+    """Database time plus seconds, leases are taken and checked on this one clock
+    so workers with skewed clocks cant take a lease that still holds"""
+    if session.bind.dialect.name == "sqlite":
+        return func.datetime("now", "localtime", f"+{seconds} seconds")
+    return func.localtimestamp() + datetime.timedelta(seconds=seconds)
+
+
+def _lease_free(session: AsyncSession):
+    return or_(
+        ScheduledJobs.locked_until.is_(None),
+        ScheduledJobs.locked_until < _db_clock(session),
+    )
+
+
+async def _claim(name: str, now: datetime.datetime):
+    """Takes the job lease and starts its oldest queued run or a due scheduled run,
+    returns (run id, params) or None when another worker holds the lease or nothing is due
+    """
+    async with AsyncSessionLocal() as session:
+        claimed = await session.execute(
+            update(ScheduledJobs)
+            .where(ScheduledJobs.name == name, _lease_free(session))
+            .values(
+                locked_by=WORKER_ID,
+                locked_until=_db_clock(session, SCHEDULER_LEASE_SECONDS),
+            )
+        )
+        if claimed.rowcount != 1:
+            await session.rollback()
+            return None
+        # runs of a worker that stopped without releasing the lease
+        await session.execute(
+            update(JobRuns)
+            .where(JobRuns.job_name == name, JobRuns.status == "running")
+            .values(
+                status="failed",
+                error="Worker stopped before the run finished",
+                finished_at=now,
+            )
+        )
+        job = await session.get(ScheduledJobs, name)
+        due = job.next_run_at is not None and job.next_run_at <= now
+        if due:
+            # missed runs are skipped, a queued run also stands in for a due one
+            job.next_run_at = parse_schedule(job.schedule).next_after(now)
+        run = (
+            await session.execute(
+                select(JobRuns)
+                .where(JobRuns.job_name == name, JobRuns.status == "queued")
+                .order_by(JobRuns.id)
+                .limit(1)
+            )
+        ).scalar()
+        if run is None and due:
+            run = JobRuns(job_name=name, trigger="schedule", params={})
+            session.add(run)
+        if run is None:
+            job.locked_by = job.locked_until = None
+            await session.commit()
+            return None
+        run.status = "running"
+        run.worker = WORKER_ID
+        run.started_at = datetime.datetime.now()
+        await session.commit()
+        return run.id, run.params
+
+
+async def _renew_lease(name: str):
+    while True:
+        await asyncio.sleep(SCHEDULER_LEASE_SECONDS / 3)
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(ScheduledJobs)
+                .where(ScheduledJobs.name == name, ScheduledJobs.locked_by == WORKER_ID)
+                .values(locked_until=_db_clock(session, SCHEDULER_LEASE_SECONDS))
+            )
+            await session.commit()
+
+
+async def _finish(name: str, run_id: int, run_status: str, result, error):
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(JobRuns)
+            .where(JobRuns.id == run_id)
+            .values(
+                status=run_status,
+                result=result,
+                error=error,
+                finished_at=datetime.datetime.now(),
+            )
+        )
+        await session.execute(
+            update(ScheduledJobs)
+            .where(ScheduledJobs.name == name, ScheduledJobs.locked_by == WORKER_ID)
+            .values(locked_by=None, locked_until=None)
+        )
+        await session.commit()
+
+
+async def _execute(name: str, run_id: int, params: dict):
+    """Runs a claimed job, records its result and releases the lease"""
+    job = JOBS[name]
+    renewal = asyncio.create_task(_renew_lease(name))
+    run_status, result, error = "failed", None, None
+    try:
+        result = jsonable_encoder(await job.function(**_bind(job.function, params)))
+        run_status = "succeeded"
+        api_logger.info("Job %s run %s finished: %s", name, run_id, result)
+    except asyncio.CancelledError:
+        error = "Cancelled at shutdown"
+        raise
+    except Exception as e:
+        error = str(getattr(e, "detail", e)) or type(e).__name__
+        api_logger.error("Job %s run %s failed: %s", name, run_id, error)
+    finally:
+        renewal.cancel()
+        _running.pop(name, None)
+        await asyncio.shield(_finish(name, run_id, run_status, result, error))
+        _wakeup.set()
+
+
+async def _prune(now: datetime.datetime):
+    global _last_prune
+    if now.timestamp() - _last_prune < 3600:
+        return
+    _last_prune = now.timestamp()
+    cutoff = now - datetime.timedelta(days=JOB_RUNS_KEEP_DAYS)
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(JobRuns).where(JobRuns.finished_at < cutoff))
+        await session.commit()
+
+
+async def _tick():
+    """Starts due and requested jobs this worker can take"""
+    if not _synced:
+        await sync_jobs()
+    now = datetime.datetime.now()
+    await _prune(now)
+    capacity = SCHEDULER_MAX_CONCURRENT_JOBS - len(_running)
+    if capacity <= 0:
+        return
+    queued = (
+        select(JobRuns.id)
+        .where(JobRuns.job_name == ScheduledJobs.name, JobRuns.status == "queued")
+        .exists()
+    )
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(ScheduledJobs.name)
+            .where(ScheduledJobs.name.in_(list(JOBS)))
+            .where(ScheduledJobs.name.not_in(list(_running)))
+            .where(_lease_free(session))
+            .where(or_(ScheduledJobs.next_run_at <= now, queued))
+            .order_by(ScheduledJobs.next_run_at)
+        )
+        names = result.scalars().all()
+    for name in names:
+        if len(_running) >= SCHEDULER_MAX_CONCURRENT_JOBS:
+            break
+        claimed = await _claim(name, now)
+        if claimed is not None:
+            _running[name] = asyncio.create_task(_execute(name, *claimed))
+
+
+async def run_scheduler(poll_seconds: float = SCHEDULER_POLL_SECONDS):
+    """Starts jobs when due or requested until cancelled, started from server lifespan"""
+    try:
+        while True:
+            _wakeup.clear()
+            try:
+                await _tick()
+            except Exception as e:
+                api_logger.error("Job scheduler failed: %s", e)
+            try:
+                await asyncio.wait_for(_wakeup.wait(), poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        tasks = list(_running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def request_run(db: AsyncSession, name: str, params: dict):
+    """Queues a run of job name with params, a running scheduler picks it up"""
+    job = JOBS.get(name)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    _bind(job.function, params)
+    if await db.get(ScheduledJobs, name) is None:
+        db.add(ScheduledJobs(name=name, schedule=job.schedule))
+        await db.flush()
+    run = JobRuns(job_name=name, trigger="request", status="queued", params=params)
+    db.add(run)
+    await db.commit()
+    await db.refresh(run)
+    _wakeup.set()
+    return run
+
+
+async def get_jobs(db: AsyncSession):
+    """Returns registered jobs with schedule, lease and latest run"""
+    latest = (
+        select(JobRuns.job_name, func.max(JobRuns.id).label("run_id"))
+        .group_by(JobRuns.job_name)
+        .subquery()
+    )
+    leased = ScheduledJobs.locked_until >= _db_clock(db)
+    query = (
+        select(ScheduledJobs, JobRuns, leased)
+        .outerjoin(latest, latest.c.job_name == ScheduledJobs.name)
+        .outerjoin(JobRuns, JobRuns.id == latest.c.run_id)
+        .where(ScheduledJobs.name.in_(list(JOBS)))
+        .order_by(ScheduledJobs.name)
+    )
+    return [
+        {
+            "name": job.name,
+            "description": JOBS[job.name].description,
+            "schedule": job.schedule,
+            "next_run_at": job.next_run_at,
+            "running_on": job.locked_by if running else None,
+            "last_run": run,
+        }
+        for job, run, running in await db.execute(query)
+    ]
+
+
+async def get_runs(db: AsyncSession, name: str, page: int, limit: int):
+    """Returns one page of runs of job name, newest first"""
+    if name not in JOBS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+    query = (
+        select(JobRuns)
+        .where(JobRuns.job_name == name)
+        .order_by(JobRuns.id.desc())
+        .limit(limit)
+        .offset((page - 1) * limit)
+    )
+    return (await db.execute(query)).scalars().all()
+
+
+async def get_run(db: AsyncSession, run_id: int):
+    run = await db.get(JobRuns, run_id)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job run not found"
+        )
+    return run
@@ -1,7 +1,15 @@
 from datetime import date, datetime
-from typing import List, Optional
+from decimal import Decimal
+from typing import Annotated, List, Literal, Optional
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, PlainSerializer
+
+# exact amount with cents like the NUMERIC(12, 2) columns, sent to clients as JSON number
+Money = Annotated[
+    Decimal,
+    Field(max_digits=12, decimal_places=2),
+    PlainSerializer(float, return_type=float, when_used="json"),
+]
 
 
 class FrequencyBase(BaseModel):
@@ -27,8 +35,12 @@ class TeacherBase(BaseModel):
     last_name: str = Field(min_length=2)
     email: str = EmailStr()
     phone_num: str = Field(min_length=5, description="Phone number of employee")
-    hourly: float = Field(description="Hourly pay rate for employee")
+    hourly: Money = Field(description="Hourly pay rate for employee")
     hire_date: date = Field(description="Date of hire for employee, defaults to now")
+    calendar_id: Optional[str] = Field(
+        None,
+        description="Google calendar of the teacher's classes, unset uses CALENDAR_ID",
+    )
 
     class Config:
         json_encoders = {EmailStr: lambda v: str(v)}
@@ -44,6 +56,9 @@ class ClassesBase(BaseModel):
     )
     description: Optional[str] = None
     frequency: Optional[FrequencyBase] = None
+    tuition: Optional[Money] = Field(
+        None, ge=0, description="Monthly amount per student for recurring classes"
+    )
 
 
 class StudentResponse(StudentBase):
@@ -87,6 +102,7 @@ class TeacherData(TeacherBase):
 class ClassResponse(ClassesBase):
     id: int
     event_id: str
+    calendar_id: Optional[str] = Field(None, description="Calendar holding event_id")
 
 
 class ClassData(ClassesBase):
@@ -100,6 +116,7 @@ class ClassData(ClassesBase):
                 "class_end": "2024-05-01T10:00:00",
                 "description": "High school maths",
                 "frequency": {"freq": "weekly", "by_day": "MO,WE,FR", "weeks": 2},
+                "tuition": 60.0,
             }
         }
 
@@ -108,13 +125,35 @@ class ReservationResponse(ClassResponse):
     students: List[StudentResponse]
 
 
+class ReservationRemoval(BaseModel):
+    class_ids: List[int] = Field(
+        default=[], description="Classes to cancel, alone cancels whole rosters"
+    )
+    student_ids: List[int] = Field(
+        default=[], description="Students to remove, alone removes from all classes"
+    )
+
+
+class ReservationRemovalResponse(BaseModel):
+    removed_reservations: int
+    deleted_invoices: int
+    class_ids: List[int]
+
+
+class BulkDeleteResponse(BaseModel):
+    deleted_ids: List[int]
+
+
 class InvoicesBase(BaseModel):
     student_id: int = Field(description="ID of student")
     invoice_date: date = Field(description="Date of invoice creation")
     description: Optional[str] = None
     payment_status: bool = Field(description="Payment status, not payed-False")
-    amount: float = Field(description="Amount for invoice payment")
+    amount: Money = Field(description="Amount for invoice payment")
     class_id: Optional[int] = None
+    billing_period: Optional[date] = Field(
+        None, description="First day of the billed month for tuition invoices"
+    )
 
 
 class InvoiceData(InvoicesBase):
@@ -133,6 +172,44 @@ class InvoiceData(InvoicesBase):
 
 class InvoiceResponse(InvoicesBase):
     id: int
+    paid_amount: Money = Decimal(0)
+    payment_date: Optional[date] = None
+
+
+class PaymentLine(BaseModel):
+    invoice_id: Optional[int] = Field(None, gt=0, description="ID of paid invoice")
+    reference: Optional[str] = Field(
+        None,
+        max_length=200,
+        description="Payment reference containing INV-<invoice id>, used without invoice_id",
+    )
+    amount: Money = Field(gt=0, description="Paid amount")
+    # payment date
+    date: date
+
+
+class InvoiceBalance(BaseModel):
+    invoice_id: int
+    amount: Money
+    paid_amount: Money
+    remaining: Money = Field(description="Still to pay, negative when overpaid")
+
+
+class UnmatchedPayment(BaseModel):
+    line: int = Field(description="Position of the payment in the statement, from 1")
+    invoice_id: Optional[int] = None
+    reference: Optional[str] = None
+    amount: Money
+    reason: str
+
+
+class ReconciliationResponse(BaseModel):
+    payments: int
+    applied_amount: Money
+    paid: List[int] = Field(description="Invoices paid in full")
+    partial: List[InvoiceBalance]
+    overpaid: List[InvoiceBalance]
+    unmatched: List[UnmatchedPayment]
 
 
 class TeacherHoursBase(BaseModel):
@@ -154,10 +231,10 @@ class TeacherHoursResponse(TeacherHoursBase):
 
 class PaycheckBase(BaseModel):
     teacher_id: int
-    amount: float = Field(description="Amount for monthly payment")
+    amount: Money = Field(description="Amount for monthly payment")
     work_hours: float = Field(description="Full work hours for paycheck")
     school_hours: float = Field(description="School 45 mins hours for paycheck")
-    hourly: float = Field(description="Hourly rate of teacher")
+    hourly: Money = Field(description="Hourly rate of teacher")
     start_date: date = Field(description="Start date of pay period")
     end_date: date = Field(description="End date of pay period")
     creation_date: date = Field(description="Date of paycheck creation")
@@ -167,3 +244,229 @@ class PaycheckBase(BaseModel):
 class PaycheckResponse(PaycheckBase):
     id: int
     payment_date: Optional[date] = None
+
+
+class RevenueReportResponse(BaseModel):
+    key: Optional[str] = Field(
+        description="Grouping key, class/teacher/student ID or month as YYYY-MM"
+    )
+    invoice_count: int
+    invoiced: float = Field(description="Total invoiced amount")
+    paid: float = Field(description="Total payed amount")
+    outstanding: float = Field(description="Total not payed amount")
+
+
+class OutstandingBalanceResponse(BaseModel):
+    student_id: int
+    first_name: str
+    last_name: str
+    email: str
+    unpaid_invoices: int = Field(description="Number of not payed invoices")
+    outstanding: float = Field(description="Total not payed amount")
+
+
+class PayrollReportResponse(BaseModel):
+    key: str = Field(description="Grouping key, teacher ID or month as YYYY-MM")
+    paycheck_count: int
+    work_hours: float = Field(description="Total work hours on paychecks")
+    amount: float = Field(description="Total paycheck amount")
+    paid: float = Field(description="Total payed amount")
+    unpaid: float = Field(description="Total not payed amount")
+
+
+class FillRateBucket(BaseModel):
+    lower: float = Field(description="Lower fill rate bound of bucket")
+    upper: float = Field(description="Upper fill rate bound of bucket")
+    classes: int = Field(description="Number of classes in bucket")
+
+
+class WeeklyUtilization(BaseModel):
+    week_start: date = Field(description="Monday of class start week")
+    classes: int
+    enrolled: int
+    capacity: int
+    utilization: float = Field(description="Enrolled students per class seat")
+
+
+class UtilizationResponse(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    classes: int
+    capacity: int = Field(description="Sum of class sizes")
+    enrolled: int = Field(description="Number of reservations")
+    utilization: float = Field(description="Enrolled students per class seat")
+    full_classes: int
+    fill_rate_histogram: List[FillRateBucket]
+    weekly_trend: List[WeeklyUtilization]
+
+
+class TeacherLoadResponse(BaseModel):
+    teacher_id: int
+    classes: int
+    enrolled: int
+    capacity: int
+    utilization: float = Field(description="Enrolled students per class seat")
+    work_hours: float = Field(description="Logged work hours in period")
+    invoiced: float = Field(description="Invoiced amount for teacher classes")
+    paid: float = Field(description="Payed amount for teacher classes")
+
+
+class ArchiveRunResponse(BaseModel):
+    before: date
+    running: bool = Field(description="True if another worker is archiving")
+    reservations: int = 0
+    invoices: int = 0
+    classes: int = 0
+    work_hours: int = 0
+
+
+class BillingRunResponse(BaseModel):
+    period: date = Field(description="First day of the billed month")
+    running: bool = Field(description="True if another worker is billing")
+    classes: int = 0
+    invoices: int = 0
+
+
+class ArchiveStatusResponse(BaseModel):
+    table: str
+    hot_rows: int
+    archived_rows: int
+
+
+class SearchResult(BaseModel):
+    type: str = Field(description="students, teachers or classes")
+    id: int
+    label: str
+    score: float = Field(description="Above 1 for word prefix matches, else similarity")
+
+
+class PageParams(BaseModel):
+    page: int = Field(ge=1, description="Page number, starts at 1")
+    limit: int = Field(10, gt=0, le=500, description="Entries per page")
+
+
+class StudentFilters(PageParams):
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone_num: Optional[str] = None
+    birth_year_from: Optional[int] = None
+    birth_year_to: Optional[int] = None
+    ids: Optional[List[int]] = None
+    sort: Literal[
+        "id", "-id", "last_name", "-last_name", "birth_year", "-birth_year"
+    ] = "id"
+
+
+class TeacherFilters(PageParams):
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone_num: Optional[str] = None
+    hired_from: Optional[date] = None
+    hired_to: Optional[date] = None
+    ids: Optional[List[int]] = None
+    sort: Literal[
+        "id",
+        "-id",
+        "last_name",
+        "-last_name",
+        "hire_date",
+        "-hire_date",
+        "hourly",
+        "-hourly",
+    ] = "id"
+
+
+class ClassFilters(PageParams):
+    class_name: Optional[str] = Field(None, description="Part of class name")
+    description: Optional[str] = Field(None, description="Part of description")
+    target_date: Optional[date] = Field(None, description="Classes starting on date")
+    start_from: Optional[datetime] = None
+    start_to: Optional[datetime] = None
+    teacher_id: Optional[List[int]] = None
+    include_archived: bool = False
+    sort: Literal[
+        "id", "-id", "class_start", "-class_start", "class_name", "-class_name"
+    ] = "id"
+
+
+class InvoiceFilters(PageParams):
+    payment_status: Optional[bool] = None
+    invoice_date: Optional[date] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    student_id: Optional[List[int]] = None
+    class_id: Optional[List[int]] = None
+    amount_from: Optional[Money] = None
+    amount_to: Optional[Money] = None
+    include_archived: bool = False
+    sort: Literal["id", "-id", "invoice_date", "-invoice_date", "amount", "-amount"] = (
+        "id"
+    )
+
+
+class WorkHoursFilters(PageParams):
+    limit: int = Field(20, gt=0, le=500, description="Entries per page")
+    teacher_id: Optional[List[int]] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    include_archived: bool = False
+    sort: Literal["id", "-id", "date", "-date", "hours", "-hours"] = "id"
+
+
+class PaycheckFilters(PageParams):
+    limit: int = Field(20, gt=0, le=500, description="Entries per page")
+    teacher_id: Optional[List[int]] = None
+    is_payed: Optional[bool] = None
+    start_date: Optional[date] = Field(
+        None, description="Paychecks starting on or after"
+    )
+    end_date: Optional[date] = Field(None, description="Paychecks ending on or before")
+    sort: Literal[
+        "id", "-id", "creation_date", "-creation_date", "amount", "-amount"
+    ] = "id"
+
+
+class SingleFlightStats(BaseModel):
+    function: str
+    leaders: int = Field(description="Calls that ran the query")
+    coalesced: int = Field(description="Calls that shared a running query")
+    bypassed: int = Field(description="Calls run alone, in flight limit reached")
+    in_flight: int
+
+
+class CompileCacheStats(BaseModel):
+    engine: str = Field(description="primary or replica_<n> in READ_REPLICA_URLS order")
+    hits: int = Field(description="Statements run with an already compiled form")
+    misses: int = Field(description="Statements compiled and added to the cache")
+    uncached: int = Field(description="Text and DDL statements, compiled every time")
+
+
+class JobRunRequest(BaseModel):
+    params: dict = Field(
+        default={}, description="Keyword params of the job, dates as YYYY-MM-DD"
+    )
+
+
+class JobRunResponse(BaseModel):
+    id: int
+    job_name: str
+    trigger: Literal["schedule", "request"]
+    status: Literal["queued", "running", "succeeded", "failed"]
+    params: dict
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    worker: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class JobResponse(BaseModel):
+    name: str
+    description: str
+    schedule: Optional[str] = Field(description="Cron expression or @every interval")
+    next_run_at: Optional[datetime] = None
+    running_on: Optional[str] = Field(
+        default=None, description="Worker holding the job lease"
+    )
+    last_run: Optional[JobRunResponse] = None
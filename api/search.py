@@ -0,0 +1,247 @@
+"""Typeahead search over students, teachers and classes.
+
+Postgres answers from GIN indexes on the search documents declared in models,
+to_tsvector for word prefixes and pg_trgm for fuzzy matches. Other databases
+use an in memory n-gram index rebuilt after writes or every SEARCH_INDEX_TTL
+seconds. Both rank whole query prefix matches first, then by trigram word similarity.
+"""
+
+import asyncio
+import heapq
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from sqlalchemy import case, func, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.db.models import SEARCH_CONFIG, SEARCH_DOCUMENTS, Classes, Students, Teachers
+
+# seconds the in memory index is reused when no write invalidated it
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", 60))
+
+# minimal trigram word similarity of a fuzzy match, pg_trgm default
+SIMILARITY_THRESHOLD = 0.6
+
+# trigrams found in more than this share of documents only rank, they dont find candidates
+COMMON_TRIGRAM_SHARE = 0.05
+
+# fuzzy candidates scored exactly, picked by shared trigram count
+FUZZY_CANDIDATES = 200
+
+# vocabulary words visited for one prefix, shortest continuations come first
+MAX_PREFIX_WORDS = 2000
+
+SEARCH_KINDS = {"students": Students, "teachers": Teachers, "classes": Classes}
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(text: str):
+    return _WORD.findall(text.lower())
+
+
+def _trigrams(text: str):
+    """pg_trgm style trigrams, every word padded with two leading and one trailing space"""
+    grams = set()
+    for word in _words(text):
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def word_similarity(query_grams, text: str):
+    """Share of query trigrams found in text"""
+    if not query_grams:
+        return 0.0
+    return len(query_grams & _trigrams(text)) / len(query_grams)
+
+
+def _label(kind: str, row):
+    if kind == "classes":
+        return f"{row.class_name} ({row.class_start:%Y-%m-%d %H:%M})"
+    return f"{row.first_name} {row.last_name} <{row.email}>"
+
+
+def _label_columns(Model):
+    if Model is Classes:
+        return [Classes.class_name, Classes.class_start]
+    return [Model.first_name, Model.last_name, Model.email]
+
+
+class NgramIndex:
+    """In memory word prefix and trigram index, used where pg_trgm is not available"""
+
+    def __init__(self, documents):
+        # documents are (kind, id, label, text)
+        self.documents = documents
+        self.lengths = [len(text) for *_, text in documents]
+        self.trigrams = defaultdict(list)
+        words = defaultdict(set)
+        for position, (*_, text) in enumerate(documents):
+            for gram in _trigrams(text):
+                self.trigrams[gram].append(position)
+            for word in _words(text):
+                words[word].add(position)
+        self.vocabulary = sorted(words)
+        self.postings = [words[word] for word in self.vocabulary]
+        self.common = max(1000, int(len(documents) * COMMON_TRIGRAM_SHARE))
+
+    def _prefix_range(self, token: str):
+        """Vocabulary slice of words starting with token"""
+        return (
+            bisect_left(self.vocabulary, token),
+            bisect_left(self.vocabulary, token + "\uffff"),
+        )
+
+    def _prefix_matches(self, tokens):
+        """Positions of documents matching every token as a word prefix. The token with
+        the narrowest vocabulary slice finds candidates, other tokens are checked per document
+        """
+        ranges = sorted(
+            ((self._prefix_range(token), token) for token in set(tokens)),
+            key=lambda item: item[0][1] - item[0][0],
+        )
+        (low, high), _ = ranges[0]
+        high = min(high, low + MAX_PREFIX_WORDS)
+        if low == high:
+            return set()
+        matches = set().union(*self.postings[low:high])
+        others = [token for _, token in ranges[1:]]
+        if not others:
+            return matches
+        return {
+            position
+            for position in matches
+            if all(
+                any(
+                    word.startswith(token)
+                    for word in _words(self.documents[position][3])
+                )
+                for token in others
+            )
+        }
+
+    def search(self, query: str, kinds, limit: int):
+        tokens = _words(query)
+        if not tokens:
+            return []
+        query_grams = _trigrams(query)
+        texts = self.documents
+
+        # whole query prefix matches rank first, shorter documents are closer matches
+        prefixed = [
+            position
+            for position in self._prefix_matches(tokens)
+            if texts[position][0] in kinds
+        ]
+        ranked = heapq.nsmallest(limit, prefixed, key=self.lengths.__getitem__)
+        results = {
+            position: 1 + word_similarity(query_grams, texts[position][3])
+            for position in ranked
+        }
+
+        # fuzzy matches found through rare trigrams, scored exactly
+        if len(results) < limit:
+            shared = Counter()
+            for gram in query_grams:
+                posting = self.trigrams.get(gram, ())
+                if len(posting) <= self.common:
+                    shared.update(posting)
+            for position, _ in shared.most_common(FUZZY_CANDIDATES):
+                kind, *_, text = texts[position]
+                if position in results or kind not in kinds:
+                    continue
+                score = word_similarity(query_grams, text)
+                if score >= SIMILARITY_THRESHOLD:
+                    results[position] = score
+
+        best = heapq.nlargest(limit, results.items(), key=lambda item: item[1])
+        return [
+            {
+                "type": texts[position][0],
+                "id": texts[position][1],
+                "label": texts[position][2],
+                "score": round(score, 4),
+            }
+            for position, score in best
+        ]
+
+
+_index = None
+_index_built_at = 0.0
+_index_lock = asyncio.Lock()
+
+
+def invalidate(Model=None):
+    """Marks the in memory index stale, called after writes to searchable tables,
+    writes to Model are ignored unless it is one of SEARCH_KINDS"""
+    global _index
+    if Model is not None and Model not in SEARCH_KINDS.values():
+        return
+    _index = None
+
+
+async def _load_documents(db: AsyncSession):
+    documents = []
+    for kind, Model in SEARCH_KINDS.items():
+        query = select(
+            Model.id, *_label_columns(Model), SEARCH_DOCUMENTS[kind].label("text")
+        )
+        for row in await db.execute(query):
+            documents.append((kind, row.id, _label(kind, row), row.text))
+    return documents
+
+
+async def get_ngram_index(db: AsyncSession):
+    """Returns in memory index, one request rebuilds it when stale while others wait"""
+    global _index, _index_built_at
+    async with _index_lock:
+        if _index is None or time.monotonic() - _index_built_at > SEARCH_INDEX_TTL:
+            documents = await _load_documents(db)
+            _index = await asyncio.to_thread(NgramIndex, documents)
+            _index_built_at = time.monotonic()
+        return _index
+
+
+async def _search_postgres(db: AsyncSession, query: str, kinds, limit: int):
+    tokens = _words(query)
+    if not tokens:
+        return []
+    prefix_query = " & ".join(f"{token}:*" for token in tokens)
+    text = literal(query.lower())
+    results = []
+    for kind in kinds:
+        Model = SEARCH_KINDS[kind]
+        document = SEARCH_DOCUMENTS[kind]
+        prefixed = func.to_tsvector(SEARCH_CONFIG, document).op("@@")(
+            func.to_tsquery(SEARCH_CONFIG, prefix_query)
+        )
+        score = case((prefixed, 1), else_=0) + func.word_similarity(text, document)
+        statement = (
+            select(Model.id, *_label_columns(Model), score.label("score"))
+            .where(or_(prefixed, text.op("<%")(document)))
+            .order_by(score.desc())
+            .limit(limit)
+        )
+        for row in await db.execute(statement):
+            results.append(
+                {
+                    "type": kind,
+                    "id": row.id,
+                    "label": _label(kind, row),
+                    "score": round(float(row.score), 4),
+                }
+            )
+    return heapq.nlargest(limit, results, key=lambda result: result["score"])
+
+
+async def search(db: AsyncSession, query: str, kinds=None, limit: int = 10):
+    """Returns best matches for query across kinds (students, teachers, classes), best first"""
+    kinds = list(kinds or SEARCH_KINDS)
+    if db.bind.dialect.name == "postgresql":
+        return await _search_postgres(db, query, kinds, limit)
+    index = await get_ngram_index(db)
+    return index.search(query, set(kinds), limit)
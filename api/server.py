@@ -1,26 +1,51 @@
+import asyncio
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from starlette.middleware.base import BaseHTTPMiddleware
 
-from api.db.db_manager import async_engine
+from api.Calendar_utils.calendar_service_manager import (CALENDAR_BACKEND,
+                                                         refresh_credentials)
+from api.changefeed import CHANGE_FEED_NOTIFY, listen
+from api.db.db_manager import read_your_writes_middleware
+from api.db.migrate import run_migrations
 from api.db.models import *
+from api.idempotency import idempotency_middleware
+from api.scheduler import SCHEDULER_ENABLED, run_scheduler
 
 from .logger import *
-from .Routers import (auth, classes_route, invoices_route, reservations_route,
-                      students_route, teacher_pay_route, teachers_route)
+from .Routers import (analytics_route, archive_route, auth, billing_route,
+                      changes_route, classes_route, invoices_route, jobs_route,
+                      metrics_route, reports_route, reservations_route,
+                      search_route, students_route, teacher_pay_route,
+                      teachers_route)
+
+# opt in schema setup on startup, otherwise run python -m api.db.migrate once per deploy
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "False") == "True"
 
 
 async def init_db():
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Create database
-    await init_db()
+    if DB_INIT_ON_STARTUP:
+        await init_db()
+    tasks = []
+    if SCHEDULER_ENABLED:
+        tasks.append(asyncio.create_task(run_scheduler()))
+    if CHANGE_FEED_NOTIFY:
+        tasks.append(asyncio.create_task(listen()))
+    if CALENDAR_BACKEND == "google":
+        tasks.append(asyncio.create_task(refresh_credentials()))
     yield
+    for task in tasks:
+        task.cancel()
+    # running jobs record their cancellation before shutdown
+    await asyncio.gather(*tasks, return_exceptions=True)
 
 
 app = FastAPI(title="Pararel system", lifespan=lifespan)
@@ -32,6 +57,8 @@ app = FastAPI(title="Pararel system", lifespan=lifespan)
 
 # middlewere
 app.add_middleware(BaseHTTPMiddleware, dispatch=request_logging_middleware)
+app.add_middleware(BaseHTTPMiddleware, dispatch=idempotency_middleware)
+app.add_middleware(BaseHTTPMiddleware, dispatch=read_your_writes_middleware)
 
 
 # routers
@@ -42,3 +69,11 @@ app.include_router(classes_route.router)
 app.include_router(reservations_route.router)
 app.include_router(invoices_route.router)
 app.include_router(teacher_pay_route.router)
+app.include_router(reports_route.router)
+app.include_router(analytics_route.router)
+app.include_router(archive_route.router)
+app.include_router(billing_route.router)
+app.include_router(search_route.router)
+app.include_router(metrics_route.router)
+app.include_router(jobs_route.router)
+app.include_router(changes_route.router)
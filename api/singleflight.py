@@ -0,0 +1,120 @@
+"""Request coalescing for hot crud reads.
+
+Concurrent calls of a decorated read with equal arguments on the same database
+share one in flight query, the first caller runs it and the others await its
+result (or its exception). Nothing is cached, a call arriving after the query
+finished runs a new one. A client that wrote after the running query started
+runs its own, so it reads its write. Shared results are plain data, ORM results
+are dumped through the response_model of the decorator.
+"""
+
+import asyncio
+import functools
+import os
+import time
+from collections import Counter, defaultdict
+
+from pydantic import BaseModel, TypeAdapter
+
+from api.db.db_manager import LAST_WRITE_INFO
+
+# max distinct in flight reads, further calls run on their own, 0 disables coalescing
+SINGLE_FLIGHT_MAX_KEYS = int(os.getenv("SINGLE_FLIGHT_MAX_KEYS", 1024))
+
+# key -> (future of the leading call, time it started)
+_flights = {}
+
+# function name -> Counter of leaders, coalesced and bypassed calls
+_stats = defaultdict(Counter)
+
+
+def _normalize(value):
+    """Hashable form of call arguments, pydantic models by their set fields"""
+    if isinstance(value, BaseModel):
+        value = value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _normalize(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_normalize(item) for item in value)
+    return value
+
+
+def single_flight(function=None, *, response_model=None):
+    """Coalesces concurrent calls of async function(db, ...) with equal arguments,
+    results are dumped through response_model when given"""
+    if function is None:
+        return functools.partial(single_flight, response_model=response_model)
+    name = function.__name__
+    adapter = TypeAdapter(response_model) if response_model is not None else None
+
+    async def run(db, args, kwargs):
+        result = await function(db, *args, **kwargs)
+        if adapter is None:
+            return result
+        # detached from the leader's session, waiters may outlive it
+        return adapter.dump_python(
+            adapter.validate_python(result, from_attributes=True)
+        )
+
+    @functools.wraps(function)
+    async def wrapper(db, *args, **kwargs):
+        stats = _stats[name]
+        try:
+            key = (name, id(db.bind), _normalize(args), _normalize(kwargs))
+            hash(key)
+        except TypeError:
+            key = None
+        if key is None or (
+            key not in _flights and len(_flights) >= SINGLE_FLIGHT_MAX_KEYS
+        ):
+            stats["bypassed"] += 1
+            return await run(db, args, kwargs)
+
+        last_write = db.info.get(LAST_WRITE_INFO, 0.0)
+        while (entry := _flights.get(key)) is not None:
+            flight, started = entry
+            if started < last_write:
+                # may not see the caller's write
+                stats["bypassed"] += 1
+                return await run(db, args, kwargs)
+            # wait returns when the leader finished, raises only if this call is cancelled
+            await asyncio.wait([flight])
+            if not flight.cancelled():
+                stats["coalesced"] += 1
+                return flight.result()
+
+        stats["leaders"] += 1
+        flight = asyncio.get_running_loop().create_future()
+        entry = _flights[key] = (flight, time.time())
+        try:
+            result = await run(db, args, kwargs)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as exc:
+            flight.set_exception(exc)
+            # waiters get the exception, mark it retrieved for the leader too
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            if _flights.get(key) is entry:
+                del _flights[key]
+
+    return wrapper
+
+
+def get_stats():
+    """Returns per function counts of leading, coalesced and bypassed calls"""
+    return [
+        {
+            "function": name,
+            "leaders": stats["leaders"],
+            "coalesced": stats["coalesced"],
+            "bypassed": stats["bypassed"],
+            "in_flight": sum(1 for key in _flights if key[0] == name),
+        }
+        for name, stats in sorted(_stats.items())
+    ]
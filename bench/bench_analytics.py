@@ -0,0 +1,97 @@
+"""Benchmark for api.analytics on a synthetic dataset.
+
+Generates a dataset with bench.datagen, then times streaming extraction,
+vectorized computation and cached lookups, optionally against an ORM per-row
+baseline.
+
+    python -m bench.bench_analytics --reservations 1000000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+DEFAULT_DB_URL = "sqlite+aiosqlite:///./bench_analytics.db"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--reservations", type=int, default=1_000_000)
+    parser.add_argument("--class-size", type=int, default=20)
+    parser.add_argument("--teachers", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--orm-baseline",
+        action="store_true",
+        help="also time loading classes with students as ORM objects",
+    )
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+from sqlalchemy.orm import selectinload  # noqa: E402
+
+from api import analytics  # noqa: E402
+from api.db.models import Classes  # noqa: E402
+from bench import datagen  # noqa: E402
+
+
+async def timed(label, coroutine):
+    start = time.perf_counter()
+    result = await coroutine
+    print(f"{label:<40}{time.perf_counter() - start:>10.3f} s")
+    return result
+
+
+async def orm_baseline(session):
+    """Per row ORM equivalent of class fill rates, for comparison"""
+    result = await session.execute(
+        select(Classes).options(selectinload(Classes.students))
+    )
+    classes = result.scalars().all()
+    return sum(len(c.students) for c in classes) / sum(c.class_size for c in classes)
+
+
+async def main():
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    engine = create_async_engine(args.db_url)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    counts = await timed(
+        "generate dataset",
+        datagen.generate(
+            engine,
+            "large",
+            args.seed,
+            class_size=args.class_size,
+            reservations=args.reservations,
+            teachers=args.teachers,
+            students=max(args.class_size, args.reservations // 10),
+        ),
+    )
+    print(counts)
+
+    async with session_maker() as session:
+        extracts = await timed("stream extracts", analytics.load_extracts(session))
+        start = time.perf_counter()
+        result = analytics.compute_analytics(extracts)
+        print(f"{'vectorized compute':<40}{time.perf_counter() - start:>10.3f} s")
+        await timed("get_analytics (cold)", analytics.get_analytics(session))
+        await timed("get_analytics (cached)", analytics.get_analytics(session))
+        print(f"utilization={result['utilization']['utilization']}")
+        if args.orm_baseline:
+            rate = await timed("ORM per row baseline", orm_baseline(session))
+            print(f"baseline utilization={round(rate, 4)}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""Throughput benchmark for api.billing.
+
+Generates recurring classes and enrollments with bench.datagen, moves every class
+into the billed month so one pass bills all enrollments, then times the first run
+(all invoices created) and a repeated run (nothing left to bill). Exits with code 1
+when the first run exceeds the budget.
+
+    python -m bench.bench_billing --reservations 100000 --budget-s 10
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import sys
+import time
+
+DEFAULT_DB_URL = "sqlite+aiosqlite:///./bench_billing.db"
+PERIOD = datetime.date(2024, 3, 1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--reservations", type=int, default=100_000)
+    parser.add_argument("--budget-s", type=float, default=10)
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+
+from sqlalchemy import update  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+from api import billing  # noqa: E402
+from api.db.models import Classes  # noqa: E402
+from bench import datagen  # noqa: E402
+
+
+async def main():
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    engine = create_async_engine(args.db_url)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    counts = await datagen.generate(
+        engine,
+        "medium",
+        students=20_000,
+        teachers=200,
+        reservations=args.reservations,
+        recurring_share=1.0,
+    )
+    print(counts)
+    start = datetime.datetime.combine(PERIOD, datetime.time(9))
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(Classes).values(
+                class_start=start, class_end=start + datetime.timedelta(hours=1)
+            )
+        )
+
+    failed = False
+    for label in ("first run", "repeated run"):
+        async with session_maker() as session:
+            started = time.perf_counter()
+            result = await billing.bill_period(session, PERIOD)
+            await session.commit()
+            elapsed = time.perf_counter() - started
+        print(
+            f"{label:<15}{elapsed:>10.3f} s{result['invoices']:>10} invoices"
+            f"{result['classes']:>8} classes"
+        )
+        if label == "first run" and elapsed > args.budget_s:
+            print(f"first run {elapsed:.3f} s over budget {args.budget_s} s")
+            failed = True
+    await engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""Class creation throughput against the number of teacher calendars.
+
+Creates --classes classes concurrently through an httpx ASGI client with the fake
+calendar answering after --latency ms, for teachers spread over 1 and then more
+calendars. Calls of one calendar start at most --writes-per-second, so throughput
+should grow with the number of calendars. Exits with code 1 when the most calendars
+reach less than --min-scaling of linear scaling over a single calendar.
+
+    python -m bench.bench_calendar --calendars 1,4,8 --writes-per-second 10 --min-scaling 0.5
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///./bench_calendar.db")
+    parser.add_argument("--calendars", default="1,4,8")
+    parser.add_argument("--classes", type=int, default=80, help="per round")
+    parser.add_argument("--latency", type=float, default=100, help="fake calendar ms")
+    parser.add_argument(
+        "--writes-per-second",
+        type=float,
+        default=10,
+        help="CALENDAR_WRITES_PER_SECOND, 0 disables the limit",
+    )
+    parser.add_argument("--min-scaling", type=float, default=0.5)
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+os.environ["DB_ECHO"] = "False"
+os.environ["CALENDAR_WRITES_PER_SECOND"] = str(args.writes_per_second)
+os.environ["CALENDAR_MAX_WORKERS"] = str(max(map(int, args.calendars.split(","))))
+
+import httpx  # noqa: E402
+from sqlalchemy import String, cast, delete, insert, update  # noqa: E402
+
+from api.Calendar_utils.calendar_service_manager import (  # noqa: E402
+    get_calendar_service_manager,
+)
+from api.Calendar_utils.fake_calendar import FakeCalendarServiceManager  # noqa: E402
+from api.db.db_manager import Base, async_engine  # noqa: E402
+from api.db.models import Classes, Teachers  # noqa: E402
+from api.server import app  # noqa: E402
+
+TEACHERS = 64
+
+
+async def setup():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            insert(Teachers),
+            [
+                {
+                    "first_name": "Bench",
+                    "last_name": f"Teacher{number}",
+                    "email": f"teacher{number}@bench.local",
+                    "phone_num": "5550000",
+                    "hourly": 20,
+                    "hire_date": datetime.date(2024, 1, 1),
+                }
+                for number in range(TEACHERS)
+            ],
+        )
+
+
+async def create_classes(client, calendars: int):
+    """Assigns teachers to calendars round robin, returns classes created per second"""
+    async with async_engine.begin() as conn:
+        await conn.execute(delete(Classes))
+        await conn.execute(
+            update(Teachers).values(
+                calendar_id="bench" + cast(Teachers.id % calendars, String)
+            )
+        )
+    start = datetime.datetime(2030, 1, 1, 9)
+
+    async def create(number):
+        class_start = start + datetime.timedelta(hours=number)
+        response = await client.post(
+            "/classes/create",
+            json={
+                "class_name": f"Bench class {number}",
+                "teacher_id": number % TEACHERS + 1,
+                "class_size": 10,
+                "class_start": class_start.isoformat(),
+                "class_end": (class_start + datetime.timedelta(hours=1)).isoformat(),
+            },
+        )
+        response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[create(number) for number in range(args.classes)])
+    return args.classes / (time.perf_counter() - started)
+
+
+async def main():
+    for name in ("sqlalchemy.engine", "api.logger"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    await setup()
+    manager = FakeCalendarServiceManager(latency=args.latency / 1000)
+    app.dependency_overrides[get_calendar_service_manager] = lambda: manager
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://b", timeout=None
+    ) as client:
+        for calendars in map(int, args.calendars.split(",")):
+            results[calendars] = await create_classes(client, calendars)
+            used = len(manager.service.calendars)
+            print(
+                f"{calendars:>4} calendars {results[calendars]:>10.1f} classes/s"
+                f"  ({used} calendars written so far)"
+            )
+    await async_engine.dispose()
+
+    single, most = results[min(results)], max(results)
+    scaling = results[most] / single / (most / min(results))
+    print(f"scaling at {most} calendars {scaling:.2f} of linear")
+    if scaling < args.min_scaling:
+        print(f"scaling under {args.min_scaling}")
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+"""Cost per row of large list pages, read models against response model validation.
+
+Generates a dataset with bench.datagen and requests full pages (--limit rows) of
+/students/all and /invoices/all through an httpx ASGI client. The baseline serves
+the same statements as RowMapping lists validated and serialized by FastAPI through
+the response models, the way list routes worked before read models. Reports p50
+latency, CPU and allocated memory per row, and exits with code 1 when read models
+are less than --min-speedup times faster.
+
+    python -m bench.bench_lists --limit 500 --requests 100 --min-speedup 1.5
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Annotated, List
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///./bench_lists.db")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--min-speedup", type=float, default=1.5)
+    parser.add_argument(
+        "--skip-generate", action="store_true", help="reuse data already in --db-url"
+    )
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+os.environ["DB_ECHO"] = "False"
+os.environ["SINGLE_FLIGHT_MAX_KEYS"] = "0"
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Query  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from api.db.db_manager import read_db_dependancy  # noqa: E402
+from api.db.db_manager import async_engine, read_your_writes_middleware
+from api.filters import INVOICE_FILTERS, STUDENT_FILTERS  # noqa: E402
+from api.idempotency import idempotency_middleware  # noqa: E402
+from api.logger import api_logger, request_logging_middleware  # noqa: E402
+from api.schemas import InvoiceResponse  # noqa: E402
+from api.schemas import InvoiceFilters, StudentFilters, StudentResponse
+from api.server import app  # noqa: E402
+from bench import datagen  # noqa: E402
+
+# same middleware stack as the app, only the routes differ
+baseline = FastAPI()
+baseline.add_middleware(BaseHTTPMiddleware, dispatch=request_logging_middleware)
+baseline.add_middleware(BaseHTTPMiddleware, dispatch=idempotency_middleware)
+baseline.add_middleware(BaseHTTPMiddleware, dispatch=read_your_writes_middleware)
+
+
+async def _mappings(db, spec, query_params):
+    """Rows as RowMapping objects, validated by the route's response model"""
+    values = query_params.model_dump(exclude_none=True)
+    page, limit = values.pop("page"), values.pop("limit")
+    sort = values.pop("sort", "id")
+    include_archived = values.pop("include_archived", False)
+    statement = spec.statement(frozenset(values), sort, include_archived)
+    params = spec.parameters(values)
+    params.update(limit=limit, offset=(page - 1) * limit)
+    return (await db.execute(statement, params)).mappings().all()
+
+
+@baseline.get("/students/all", response_model=List[StudentResponse])
+async def baseline_students(
+    db: read_db_dependancy, filters: Annotated[StudentFilters, Query()]
+):
+    return await _mappings(db, STUDENT_FILTERS, filters)
+
+
+@baseline.get("/invoices/all", response_model=List[InvoiceResponse])
+async def baseline_invoices(
+    db: read_db_dependancy, filters: Annotated[InvoiceFilters, Query()]
+):
+    return await _mappings(db, INVOICE_FILTERS, filters)
+
+
+async def measure(client, url: str, pages: int):
+    """p50 latency, CPU seconds and allocated bytes per row over pages of url"""
+    latencies, rows, cpu = [], 0, 0.0
+    for page in range(1, args.requests + 1):
+        params = {"page": (page - 1) % pages + 1, "limit": args.limit}
+        started, started_cpu = time.perf_counter(), time.process_time()
+        response = await client.get(url, params=params)
+        cpu += time.process_time() - started_cpu
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+        rows += len(response.json())
+
+    tracemalloc.start()
+    response = await client.get(url, params={"page": 1, "limit": args.limit})
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "cpu_us_per_row": cpu / rows * 1e6,
+        "peak_bytes_per_row": peak / len(response.json()),
+        "body": response.content,
+    }
+
+
+async def main():
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    api_logger.setLevel(logging.WARNING)
+    if not args.skip_generate:
+        print(await datagen.generate(async_engine, "medium"))
+    counts = await datagen.count_rows(async_engine)
+
+    failed = False
+    print(
+        f"{'endpoint':<18}{'path':<14}{'p50 ms':>10}{'cpu us/row':>12}{'peak B/row':>12}"
+    )
+    for url, table in (("/students/all", "students"), ("/invoices/all", "invoices")):
+        pages = max(1, counts[table] // args.limit)
+        results = {}
+        for label, target in (("read models", app), ("baseline", baseline)):
+            transport = httpx.ASGITransport(app=target)
+            async with httpx.AsyncClient(transport=transport, base_url="http://b") as c:
+                await measure(c, url, pages)
+                results[label] = await measure(c, url, pages)
+            result = results[label]
+            print(
+                f"{url:<18}{label:<14}{result['p50_ms']:>10.2f}"
+                f"{result['cpu_us_per_row']:>12.2f}{result['peak_bytes_per_row']:>12.0f}"
+            )
+        if results["read models"]["body"] != results["baseline"]["body"]:
+            print(f"{url} responses differ")
+            failed = True
+        speedup = results["baseline"]["p50_ms"] / results["read models"]["p50_ms"]
+        print(f"{url:<18}{'speedup':<14}{speedup:>10.2f}x")
+        if speedup < args.min_speedup:
+            print(f"{url} speedup under {args.min_speedup}x")
+            failed = True
+    await async_engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
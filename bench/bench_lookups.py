@@ -0,0 +1,139 @@
+"""Cost of hot crud lookups, statements built once against built per call.
+
+Generates a small dataset with bench.datagen and runs the class roster, student
+classes, teacher classes, invoice student and invoice by ID lookups --lookups times
+each, with the module level statements of api.crud and with the same statements
+built per call (the previous crud code). Reports microseconds per lookup and the
+compiled cache hits and misses of the measured runs, exits with code 1 when the
+prebuilt statements miss the compiled cache after warm up.
+
+    python -m bench.bench_lookups --lookups 2000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///./bench_lookups.db")
+    parser.add_argument("--lookups", type=int, default=2000)
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+os.environ["DB_ECHO"] = "False"
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.orm import joinedload, load_only, selectinload  # noqa: E402
+
+from api import crud  # noqa: E402
+from api.db.db_manager import AsyncSessionLocal  # noqa: E402
+from api.db.db_manager import async_engine, get_compile_cache_stats
+from api.db.models import Classes, Invoices, Students, Teachers  # noqa: E402
+from bench import datagen  # noqa: E402
+
+
+def built_per_call(name: str, id: int):
+    """Statement and params of a lookup as crud built them before"""
+    if name == "class roster":
+        return (
+            select(Classes)
+            .options(
+                selectinload(Classes.students).options(
+                    load_only(
+                        *[getattr(Students, field) for field in crud.STUDENT_FIELDS]
+                    )
+                )
+            )
+            .filter(Classes.id == id)
+        ), None
+    if name == "student classes":
+        return (
+            select(Students)
+            .options(selectinload(Students.classes))
+            .filter(Students.id == id)
+        ), None
+    if name == "teacher classes":
+        return (
+            select(Teachers)
+            .options(selectinload(Teachers.classes))
+            .filter(Teachers.id == id)
+        ), None
+    if name == "invoice student":
+        return (
+            select(Invoices)
+            .options(joinedload(Invoices.student))
+            .filter(Invoices.id == id)
+        ), None
+    return select(Invoices).filter(Invoices.id == id), None
+
+
+def prebuilt(name: str, id: int):
+    statement = {
+        "class roster": crud.CLASS_STUDENTS_QUERY,
+        "student classes": crud.STUDENT_CLASSES_QUERY,
+        "teacher classes": crud.TEACHER_CLASSES_QUERY,
+        "invoice student": crud.INVOICE_STUDENT_QUERY,
+        "invoice by id": crud._by_id_query(Invoices),
+    }[name]
+    return statement, {"id": id}
+
+
+def _totals():
+    stats = get_compile_cache_stats()[0]
+    return stats["hits"], stats["misses"]
+
+
+async def run(name: str, build, rows: int):
+    """Microseconds per lookup and compiled cache hits and misses of the runs"""
+    async with AsyncSessionLocal() as session:
+        for id in range(1, 11):
+            statement, params = build(name, id)
+            await session.execute(statement, params)
+        hits, misses = _totals()
+        started = time.perf_counter()
+        for number in range(args.lookups):
+            statement, params = build(name, number % rows + 1)
+            (await session.execute(statement, params)).scalars().first()
+            # lookups run in fresh request sessions, keep the identity map empty
+            session.expunge_all()
+        elapsed = time.perf_counter() - started
+    new_hits, new_misses = _totals()
+    return elapsed / args.lookups * 1e6, new_hits - hits, new_misses - misses
+
+
+async def main():
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    counts = await datagen.generate(async_engine, "small")
+    print(counts)
+    rows = {
+        "class roster": counts["classes"],
+        "student classes": counts["students"],
+        "teacher classes": counts["teachers"],
+        "invoice student": counts["invoices"],
+        "invoice by id": counts["invoices"],
+    }
+
+    failed = False
+    print(f"{'lookup':<18}{'statements':<14}{'us/lookup':>10}{'hits':>8}{'misses':>8}")
+    for name, count in rows.items():
+        results = {}
+        for label, build in (("prebuilt", prebuilt), ("per call", built_per_call)):
+            results[label] = await run(name, build, count)
+            us, hits, misses = results[label]
+            print(f"{name:<18}{label:<14}{us:>10.1f}{hits:>8}{misses:>8}")
+        if results["prebuilt"][2]:
+            print(f"{name} prebuilt statement missed the compiled cache")
+            failed = True
+    await async_engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+"""Exactness and speed of money totals on NUMERIC(12, 2) columns.
+
+Generates invoices with bench.datagen, spreads their amounts over whole cents, then
+times the revenue report (Numeric sums returned as Decimal) against the same query
+summing the amounts cast to floats, and the analytics extract (integer cents)
+against float amounts. Prints the drift of float totals from the exact total and
+exits with code 1 when the exact report is more than --max-slowdown times slower.
+
+    python -m bench.bench_money --reservations 100000 --max-slowdown 3
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sys
+import time
+from decimal import Decimal
+
+DEFAULT_DB_URL = "sqlite+aiosqlite:///./bench_money.db"
+REPEAT = 5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--reservations", type=int, default=100_000)
+    parser.add_argument("--max-slowdown", type=float, default=3)
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+
+import numpy as np  # noqa: E402
+from sqlalchemy import BigInteger, Float, cast, func, select, update  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+from api import analytics, crud  # noqa: E402
+from api.db.models import Invoices  # noqa: E402
+from bench import datagen  # noqa: E402
+
+
+async def best_of(session_maker, function):
+    """Best wall time of REPEAT runs and the last result"""
+    best = math.inf
+    for _ in range(REPEAT):
+        async with session_maker() as session:
+            started = time.perf_counter()
+            result = await function(session)
+            best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+async def float_report(session):
+    """Revenue by class summed over float casts, the pre NUMERIC behaviour"""
+    amount = cast(Invoices.amount, Float)
+    query = (
+        select(
+            Invoices.class_id,
+            func.count(Invoices.id),
+            func.sum(amount),
+            func.sum(amount * Invoices.payment_status),
+        )
+        .group_by(Invoices.class_id)
+        .order_by(Invoices.class_id)
+    )
+    return (await session.execute(query)).all()
+
+
+async def float_extract(session):
+    """Invoice amounts streamed as float64, the pre NUMERIC analytics extract"""
+    (amounts,) = await analytics._stream_columns(
+        session, select(cast(Invoices.amount, Float)), ("float64",)
+    )
+    return amounts
+
+
+async def cents_extract(session):
+    (cents,) = await analytics._stream_columns(
+        session,
+        select(cast(func.round(Invoices.amount * 100), BigInteger)),
+        ("int64",),
+    )
+    return cents
+
+
+async def main():
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    engine = create_async_engine(args.db_url)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    counts = await datagen.generate(
+        engine,
+        "medium",
+        students=20_000,
+        teachers=200,
+        reservations=args.reservations,
+    )
+    print(counts)
+    async with engine.begin() as conn:
+        # amounts 10.00 to 99.99, most of them not exact in binary floating point
+        await conn.execute(
+            update(Invoices).values(
+                amount=func.round((Invoices.id * 7919 % 9000 + 1000) / 100.0, 2)
+            )
+        )
+
+    exact_s, exact_rows = await best_of(
+        session_maker, lambda session: crud.get_revenue_report(session, "class")
+    )
+    float_s, float_rows = await best_of(session_maker, float_report)
+    cents_s, cents = await best_of(session_maker, cents_extract)
+    floats_s, floats = await best_of(session_maker, float_extract)
+
+    exact_total = sum(row["invoiced"] for row in exact_rows)
+    float_total = sum(row[2] for row in float_rows)
+    async with session_maker() as session:
+        decimal_total = (
+            await session.execute(select(func.sum(Invoices.amount)))
+        ).scalar()
+    print(f"{'revenue report exact':<28}{exact_s * 1000:>10.1f} ms")
+    print(f"{'revenue report float':<28}{float_s * 1000:>10.1f} ms")
+    print(f"{'analytics extract cents':<28}{cents_s * 1000:>10.1f} ms")
+    print(f"{'analytics extract float64':<28}{floats_s * 1000:>10.1f} ms")
+    print(f"{'exact total':<28}{decimal_total:>20}")
+    print(f"{'cents total':<28}{Decimal(int(cents.sum())) / 100:>20}")
+    print(f"{'report groups rounded':<28}{Decimal(str(round(exact_total, 2))):>20}")
+    # Decimal(float) is the exact binary value, so the drift is not hidden by rounding
+    print(f"{'float report drift':<28}{Decimal(float_total) - decimal_total:>20.3e}")
+    print(
+        f"{'float64 sum drift':<28}{Decimal(float(np.sum(floats))) - decimal_total:>20.3e}"
+    )
+
+    await engine.dispose()
+    slowdown = exact_s / float_s
+    if slowdown > args.max_slowdown:
+        print(
+            f"exact report {slowdown:.2f}x slower than float, over {args.max_slowdown}x"
+        )
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,156 @@
+"""SQL statements per request of relationship loading endpoints.
+
+Generates a small dataset with bench.datagen, creates a class and fills it one
+reservation at a time through an httpx ASGI client with the fake calendar,
+counting the statements each request sends. Counts must stay within BUDGETS and
+must not grow with the roster, relationships are lazy="raise" so a forgotten
+loader fails the request instead of adding queries. Exits with code 1 on any
+failed request or count over budget.
+
+    python -m bench.bench_queries --roster 20
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from collections import defaultdict
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///./bench_queries.db")
+    parser.add_argument("--roster", type=int, default=20, help="students to reserve")
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+os.environ["DB_ECHO"] = "False"
+os.environ["SINGLE_FLIGHT_MAX_KEYS"] = "0"
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from api.Calendar_utils.calendar_service_manager import (  # noqa: E402
+    get_calendar_service_manager,
+)
+from api.Calendar_utils.fake_calendar import FakeCalendarServiceManager  # noqa: E402
+from api.db.db_manager import async_engine  # noqa: E402
+from api.server import app  # noqa: E402
+from bench import datagen  # noqa: E402
+
+# max statements per request of each endpoint, any roster size, selectin loads
+# send the parent SELECT and one SELECT ... IN for the collection
+BUDGETS = {
+    "POST /reservations/add_new": 3,
+    "GET /reservations/all_students": 2,
+    "GET /reservations/student": 2,
+    "GET /teachers/classes": 2,
+    "GET /invoices/student": 1,
+    "PUT /reservations/remove_student": 3,
+}
+
+statements = 0
+
+
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+async def counted(client, method: str, url: str, counts, **kwargs):
+    """Sends a request, records its statement count under 'METHOD url'"""
+    global statements
+    statements = 0
+    response = await client.request(method, url, **kwargs)
+    counts[f"{method} {url}"].append(statements)
+    if response.status_code >= 400:
+        print(f"{method} {url} {kwargs} failed {response.status_code} {response.text}")
+        return None
+    return response.json()
+
+
+async def main():
+    for name in ("sqlalchemy.engine", "api.logger"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    print(await datagen.generate(async_engine, "small"))
+    manager = FakeCalendarServiceManager()
+    app.dependency_overrides[get_calendar_service_manager] = lambda: manager
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _count)
+
+    counts = defaultdict(list)
+    failed = False
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://b") as client:
+        created = await client.post(
+            "/classes/create",
+            json={
+                "class_name": "Query count",
+                "teacher_id": 1,
+                "class_size": args.roster,
+                "class_start": "2030-01-01T09:00:00",
+                "class_end": "2030-01-01T10:00:00",
+            },
+        )
+        created.raise_for_status()
+        class_id = created.json()["id"]
+        for student_id in range(1, args.roster + 1):
+            reservation = await counted(
+                client,
+                "POST",
+                "/reservations/add_new",
+                counts,
+                params={"class_id": class_id, "student_id": student_id, "amount": 20},
+            )
+            failed |= reservation is None
+            roster = await counted(
+                client,
+                "GET",
+                "/reservations/all_students",
+                counts,
+                params={"class_id": class_id},
+            )
+            failed |= roster is None or len(roster["students"]) != student_id
+        for student_id in (1, args.roster):
+            classes = await counted(
+                client,
+                "GET",
+                "/reservations/student",
+                counts,
+                params={"student_id": student_id},
+            )
+            failed |= classes is None
+        failed |= (
+            await counted(
+                client, "GET", "/teachers/classes", counts, params={"teacher_id": 1}
+            )
+            is None
+        )
+        failed |= (
+            await counted(client, "GET", "/invoices/student", counts, params={"id": 1})
+            is None
+        )
+        removed = await counted(
+            client,
+            "PUT",
+            "/reservations/remove_student",
+            counts,
+            params={"class_id": class_id, "student_id": 1},
+        )
+        failed |= removed is None or len(removed["students"]) != args.roster - 1
+    await async_engine.dispose()
+
+    print(f"{'endpoint':<36}{'min':>6}{'max':>6}{'budget':>8}")
+    for name, budget in BUDGETS.items():
+        values = counts[name]
+        print(f"{name:<36}{min(values):>6}{max(values):>6}{budget:>8}")
+        if max(values) > budget:
+            print(f"{name} over budget")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""Latency benchmark for api.search.
+
+Generates students with bench.datagen, then times typeahead queries (prefix,
+fuzzy and misses) and reports p50/p95 per query kind. On SQLite it also times
+the in memory index build, on Postgres the GIN indexes are used. Exits with
+code 1 when a p95 exceeds the budget.
+
+    python -m bench.bench_search --students 500000 --budget-ms 20
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+DEFAULT_DB_URL = "sqlite+aiosqlite:///./bench_search.db"
+
+QUERIES = {
+    "prefix": ["s42", "student12345", "stu s4999", "teacher t1"],
+    "fuzzy": ["studnet 4711", "s4999 studen", "teachr t12"],
+    "miss": ["zzqx", "nobody here"],
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default=DEFAULT_DB_URL)
+    parser.add_argument("--students", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=20)
+    parser.add_argument("--skip-generate", action="store_true")
+    parser.add_argument(
+        "--scan-baseline",
+        action="store_true",
+        help="also time an unanchored ILIKE scan of students",
+    )
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+
+from api import search  # noqa: E402
+from api.db.models import SEARCH_DOCUMENTS, Students  # noqa: E402
+from bench import datagen  # noqa: E402
+
+
+async def measure(session, query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = await search.search(session, query, limit=10)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, results
+
+
+async def scan_baseline(session, query):
+    document = SEARCH_DOCUMENTS["students"]
+    statement = select(Students.id).where(document.like(f"%{query}%")).limit(10)
+    start = time.perf_counter()
+    await session.execute(statement)
+    return (time.perf_counter() - start) * 1000
+
+
+async def main():
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    engine = create_async_engine(args.db_url)
+    session_maker = async_sessionmaker(bind=engine, expire_on_commit=False)
+    if not args.skip_generate:
+        counts = await datagen.generate(
+            engine, "large", students=args.students, teachers=200, reservations=1000
+        )
+        print(counts)
+
+    failed = False
+    async with session_maker() as session:
+        if engine.dialect.name != "postgresql":
+            start = time.perf_counter()
+            await search.get_ngram_index(session)
+            print(
+                f"{'build in memory index':<30}{time.perf_counter() - start:>10.3f} s"
+            )
+
+        print(f"{'query':<30}{'p50 ms':>10}{'p95 ms':>10}{'hits':>6}")
+        for kind, queries in QUERIES.items():
+            kind_timings = []
+            for query in queries:
+                timings, results = await measure(session, query, args.repeat)
+                kind_timings.extend(timings)
+                p95 = statistics.quantiles(timings, n=20)[18]
+                print(
+                    f"{kind + ': ' + query:<30}{statistics.median(timings):>10.2f}"
+                    f"{p95:>10.2f}{len(results):>6}"
+                )
+            p95 = statistics.quantiles(kind_timings, n=20)[18]
+            if p95 > args.budget_ms:
+                print(f"{kind} p95 {p95:.2f} ms over budget {args.budget_ms} ms")
+                failed = True
+
+        if args.scan_baseline:
+            for query in QUERIES["prefix"]:
+                elapsed = await scan_baseline(session, query)
+                print(f"{'ILIKE scan: ' + query:<30}{elapsed:>10.2f}")
+    await engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
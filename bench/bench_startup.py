@@ -0,0 +1,87 @@
+"""Startup budget benchmark.
+
+Starts fresh interpreters that import api.server and serve a first
+GET /students/all through an in-process ASGI client, then reports median
+import time, time to first 200 and total process time. Exits with code 1
+when a median exceeds its budget.
+
+    python -m bench.bench_startup --runs 5 --import-budget-ms 800
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CHILD = """
+import asyncio, json, time
+import httpx
+
+start = time.perf_counter()
+import api.server as server
+imported = time.perf_counter()
+
+
+async def first_request():
+    async with server.lifespan(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/students/all", params={"page": 1})
+    assert response.status_code == 200, response.text
+    return time.perf_counter()
+
+
+served = asyncio.run(first_request())
+print(json.dumps({"import_ms": (imported - start) * 1000, "first_200_ms": (served - start) * 1000}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///./bench_startup.db")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=800)
+    parser.add_argument("--first-request-budget-ms", type=float, default=1200)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    env = dict(os.environ, POSTGRESQL_URL=args.db_url, DB_ECHO="False")
+    subprocess.run([sys.executable, "-m", "api.db.migrate"], env=env, check=True)
+
+    runs = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process_ms"] = (time.perf_counter() - start) * 1000
+        runs.append(result)
+
+    medians = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    for key, value in medians.items():
+        print(f"{key:<16}{value:>10.1f} ms")
+
+    failed = False
+    for key, budget in (
+        ("import_ms", args.import_budget_ms),
+        ("first_200_ms", args.first_request_budget_ms),
+    ):
+        if medians[key] > budget:
+            print(f"OVER BUDGET {key}: {medians[key]:.1f} ms > {budget:.0f} ms")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Deterministic synthetic data generator for benchmarks.
+
+Fills a fresh schema with teachers, students, classes (some recurring),
+reservations, invoices and teacher hours using bulk inserts. The same seed
+and scale always produce the same rows, on SQLite and Postgres alike.
+"""
+
+import datetime
+import random
+
+from sqlalchemy import func, insert, select, text
+
+from api.db.models import (
+    Base,
+    Classes,
+    Invoices,
+    Students,
+    StudentsClasses,
+    TeacherHours,
+    Teachers,
+)
+
+SCALES = {
+    "small": {"students": 1_000, "teachers": 20, "reservations": 5_000},
+    "medium": {"students": 20_000, "teachers": 200, "reservations": 100_000},
+    "large": {"students": 200_000, "teachers": 1_000, "reservations": 1_000_000},
+}
+
+BATCH = 50_000
+START = datetime.datetime(2023, 1, 2, 9)
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR"]
+
+
+async def _insert_batches(conn, table, rows):
+    for i in range(0, len(rows), BATCH):
+        await conn.execute(insert(table), rows[i : i + BATCH])
+
+
+async def _reset_sequences(conn, tables):
+    """Moves Postgres id sequences past generated ids so API inserts do not collide"""
+    for table in tables:
+        name = table.__tablename__
+        await conn.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                f"COALESCE((SELECT MAX(id) FROM {name}), 1))"
+            )
+        )
+
+
+async def generate(
+    engine,
+    scale="small",
+    seed=42,
+    class_size=20,
+    recurring_share=0.3,
+    paid_share=0.7,
+    **overrides,
+):
+    """Drops and recreates schema, fills it with synthetic rows, returns generated row counts.
+    Scale is a SCALES preset, keyword overrides replace preset students, teachers or reservations
+    """
+    params = dict(SCALES[scale], **overrides)
+    rng = random.Random(seed)
+    n_students = max(params["students"], class_size)
+    n_teachers = params["teachers"]
+
+    teachers = [
+        dict(
+            id=i,
+            first_name="Teacher",
+            last_name=f"T{i}",
+            email=f"teacher{i}@bench.local",
+            phone_num=f"{100000 + i}",
+            hourly=15 + i % 10,
+            hire_date=datetime.date(2020, 1, 1),
+        )
+        for i in range(1, n_teachers + 1)
+    ]
+    students = [
+        dict(
+            id=i,
+            first_name="Student",
+            last_name=f"S{i % 5000}",
+            email=f"student{i}@bench.local",
+            phone_num=f"{100000 + i}",
+            birth_year=2005 + i % 10,
+        )
+        for i in range(1, n_students + 1)
+    ]
+
+    classes, reservations, invoices, hours = [], [], [], []
+    class_id = 0
+    while len(reservations) < params["reservations"]:
+        class_id += 1
+        teacher_id = rng.randint(1, n_teachers)
+        class_start = START + datetime.timedelta(hours=class_id * 3)
+        frequency = None
+        if rng.random() < recurring_share:
+            frequency = {
+                "freq": "weekly",
+                "by_day": ",".join(rng.sample(WEEKDAYS, rng.randint(1, 3))),
+                "weeks": rng.randint(2, 12),
+            }
+        classes.append(
+            dict(
+                id=class_id,
+                class_name=f"Class {class_id}",
+                teacher_id=teacher_id,
+                class_size=class_size,
+                class_start=class_start,
+                class_end=class_start + datetime.timedelta(hours=1),
+                event_id=f"bench{class_id}",
+                description=f"Synthetic class {class_id}",
+                frequency=frequency,
+                tuition=60.0 if frequency else None,
+            )
+        )
+        hours.append(dict(teacher_id=teacher_id, hours=1.0, date=class_start.date()))
+
+        enrolled = min(
+            rng.randint(0, class_size), params["reservations"] - len(reservations)
+        )
+        for student_id in rng.sample(range(1, n_students + 1), enrolled):
+            reservation_id = len(reservations) + 1
+            reservations.append(
+                dict(id=reservation_id, student_id=student_id, class_id=class_id)
+            )
+            paid = rng.random() < paid_share
+            invoices.append(
+                dict(
+                    id=reservation_id,
+                    student_id=student_id,
+                    class_id=class_id,
+                    invoice_date=class_start.date(),
+                    description=f"Reservation for: Class {class_id}",
+                    amount=20.0,
+                    payment_status=paid,
+                    paid_amount=20.0 if paid else 0.0,
+                )
+            )
+
+    tables = [Teachers, Students, Classes, StudentsClasses, Invoices, TeacherHours]
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        for table, rows in zip(
+            tables, [teachers, students, classes, reservations, invoices, hours]
+        ):
+            await _insert_batches(conn, table, rows)
+        if conn.dialect.name == "postgresql":
+            await _reset_sequences(conn, tables)
+
+    return {
+        "teachers": len(teachers),
+        "students": len(students),
+        "classes": len(classes),
+        "reservations": len(reservations),
+        "invoices": len(invoices),
+        "teacher_hours": len(hours),
+    }
+
+
+async def count_rows(engine):
+    """Returns row counts of an already generated dataset, same keys as generate"""
+    tables = {
+        "teachers": Teachers,
+        "students": Students,
+        "classes": Classes,
+        "reservations": StudentsClasses,
+        "invoices": Invoices,
+        "teacher_hours": TeacherHours,
+    }
+    async with engine.connect() as conn:
+        return {
+            name: (await conn.execute(select(func.max(table.id)))).scalar() or 0
+            for name, table in tables.items()
+        }
@@ -0,0 +1,443 @@
+"""In-process load test for every router.
+
+Generates a deterministic dataset, then drives the FastAPI app through an
+httpx ASGI client with the calendar dependency replaced by an in-memory fake.
+Reports p50/p95/p99 latency and throughput per scenario and can compare the
+run against a saved baseline to catch regressions.
+
+    python -m bench.load --scale small --requests 200 --concurrency 10
+    python -m bench.load --json run.json --baseline main.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-url", default="sqlite+aiosqlite:///./bench_load.db")
+    parser.add_argument(
+        "--scale", default="small", choices=["small", "medium", "large"]
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--routers", default="", help="comma separated routers, default all"
+    )
+    parser.add_argument(
+        "--calendar-latency", type=float, default=0.0, help="fake calendar ms per call"
+    )
+    parser.add_argument(
+        "--calendar-error-rate",
+        type=float,
+        default=0.0,
+        help="share of fake calendar calls failing with HTTP 503",
+    )
+    parser.add_argument(
+        "--skip-generate", action="store_true", help="reuse data already in --db-url"
+    )
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="allowed p95 increase over baseline, 0.2 is 20%%",
+    )
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ["POSTGRESQL_URL"] = args.db_url
+os.environ["DB_ECHO"] = "False"
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from api.Calendar_utils.calendar_func import calendar_or_default  # noqa: E402
+from api.Calendar_utils.calendar_service_manager import (  # noqa: E402
+    get_calendar_service_manager,
+)
+from api.Calendar_utils.fake_calendar import FakeCalendarServiceManager  # noqa: E402
+from api.db.db_manager import async_engine  # noqa: E402
+from api.db.models import Classes, Students, StudentsClasses  # noqa: E402
+from api.server import app  # noqa: E402
+from bench import datagen  # noqa: E402
+
+PAGE_SIZE = 50
+
+
+class LoadState:
+    """Dataset sizes and ids shared by scenarios"""
+
+    def __init__(self, counts):
+        self.counts = counts
+        self.sequence = itertools.count(1)
+        # keeps created emails and class names unique across --skip-generate runs
+        self.run = int(time.time())
+        self.reservations = []
+
+    def random_id(self, rng, table):
+        return rng.randint(1, self.counts[table])
+
+    def random_page(self, rng, table):
+        return rng.randint(1, max(1, self.counts[table] // PAGE_SIZE))
+
+
+def _student_payload(n, run=0):
+    return {
+        "first_name": "Load",
+        "last_name": f"L{n}",
+        "email": f"load{run}-{n}@bench.local",
+        "phone_num": f"{500000 + n}",
+        "birth_year": 2008,
+    }
+
+
+def _class_payload(n, state):
+    start = datetime.datetime(2030, 1, 1, 8) + datetime.timedelta(hours=n)
+    return {
+        "class_name": f"Load class {state.run}-{n}",
+        "teacher_id": n % state.counts["teachers"] + 1,
+        "class_size": 30,
+        "class_start": start.isoformat(),
+        "class_end": (start + datetime.timedelta(hours=1)).isoformat(),
+        "description": "Load test class",
+        "frequency": {"freq": "weekly", "by_day": "MO,WE", "weeks": 4},
+    }
+
+
+# scenarios, each sends one request and returns the response
+
+
+async def students_list(client, state, rng):
+    page = state.random_page(rng, "students")
+    return await client.get("/students/all", params={"page": page, "limit": PAGE_SIZE})
+
+
+async def students_filter(client, state, rng):
+    params = {"page": 1, "last_name": f"S{rng.randint(0, 4999)}"}
+    return await client.get("/students/all", params=params)
+
+
+async def students_create(client, state, rng):
+    return await client.post(
+        "/students/create", json=_student_payload(next(state.sequence), state.run)
+    )
+
+
+async def students_update(client, state, rng):
+    student_id = state.random_id(rng, "students")
+    payload = dict(
+        _student_payload(student_id), email=f"student{student_id}@bench.local"
+    )
+    return await client.put("/students/update", params={"id": student_id}, json=payload)
+
+
+async def teachers_list(client, state, rng):
+    page = state.random_page(rng, "teachers")
+    return await client.get("/teachers/all", params={"page": page, "limit": PAGE_SIZE})
+
+
+async def teachers_classes(client, state, rng):
+    params = {"teacher_id": state.random_id(rng, "teachers")}
+    return await client.get("/teachers/classes", params=params)
+
+
+async def classes_list(client, state, rng):
+    page = state.random_page(rng, "classes")
+    return await client.get("/classes/all", params={"page": page, "limit": PAGE_SIZE})
+
+
+async def classes_filter(client, state, rng):
+    day = datagen.START.date() + datetime.timedelta(days=rng.randint(0, 60))
+    params = {"page": 1, "target_date": day.isoformat(), "class_name": "Class"}
+    return await client.get("/classes/all", params=params)
+
+
+async def classes_create(client, state, rng):
+    payload = _class_payload(next(state.sequence), state)
+    return await client.post("/classes/create", json=payload)
+
+
+async def reservations_add(client, state, rng):
+    class_id = state.random_id(rng, "classes")
+    student_id = state.random_id(rng, "students")
+    params = {"class_id": class_id, "student_id": student_id, "amount": 20}
+    response = await client.post("/reservations/add_new", params=params)
+    if response.status_code == 201:
+        state.reservations.append((class_id, student_id))
+    return response
+
+
+async def reservations_class(client, state, rng):
+    params = {"class_id": state.random_id(rng, "classes")}
+    return await client.get("/reservations/all_students", params=params)
+
+
+async def reservations_student(client, state, rng):
+    params = {"student_id": state.random_id(rng, "students")}
+    return await client.get("/reservations/student", params=params)
+
+
+async def reservations_remove(client, state, rng):
+    if not state.reservations:
+        response = await reservations_add(client, state, rng)
+        # full class, duplicate or taken by another worker
+        if not state.reservations:
+            return response
+    class_id, student_id = state.reservations.pop()
+    params = {"class_id": class_id, "student_id": student_id}
+    return await client.put("/reservations/remove_student", params=params)
+
+
+async def invoices_list(client, state, rng):
+    page = state.random_page(rng, "invoices")
+    return await client.get("/invoices/all", params={"page": page, "limit": PAGE_SIZE})
+
+
+async def invoices_unpaid(client, state, rng):
+    params = {"page": 1, "limit": PAGE_SIZE, "payment_status": False}
+    return await client.get("/invoices/all", params=params)
+
+
+async def invoices_create(client, state, rng):
+    payload = {
+        "student_id": state.random_id(rng, "students"),
+        "invoice_date": "2030-01-01",
+        "description": "Load test invoice",
+        "payment_status": False,
+        "amount": 17.5,
+    }
+    return await client.post("/invoices/create", json=payload)
+
+
+async def invoices_pay(client, state, rng):
+    params = {"id": state.random_id(rng, "invoices")}
+    return await client.put("/invoices/pay_invoice", params=params)
+
+
+async def invoices_student(client, state, rng):
+    params = {"id": state.random_id(rng, "invoices")}
+    return await client.get("/invoices/student", params=params)
+
+
+async def paycheck_add_hours(client, state, rng):
+    n = next(state.sequence)
+    payload = {
+        "teacher_id": state.random_id(rng, "teachers"),
+        "hours": 1 + n % 7,
+        "date": (datetime.date(2030, 1, 1) + datetime.timedelta(days=n)).isoformat(),
+    }
+    return await client.post("/paycheck/add_work_hours", json=payload)
+
+
+async def paycheck_get_hours(client, state, rng):
+    params = {"page": 1, "teacher_id": state.random_id(rng, "teachers")}
+    return await client.get("/paycheck/get_work_hours", params=params)
+
+
+async def paycheck_generate(client, state, rng):
+    n = next(state.sequence)
+    start = datagen.START.date() + datetime.timedelta(days=n % 30)
+    params = {
+        "teacher_id": state.random_id(rng, "teachers"),
+        "start_date": start.isoformat(),
+        "end_date": (start + datetime.timedelta(days=30 + n)).isoformat(),
+    }
+    return await client.post("/paycheck/generate_paycheck", params=params)
+
+
+async def paycheck_list(client, state, rng):
+    return await client.get("/paycheck/all_paychecks/", params={"page": 1})
+
+
+async def paycheck_pay(client, state, rng):
+    return await client.put("/paycheck/pay", params={"paycheck_id": rng.randint(1, 20)})
+
+
+async def reports_revenue(client, state, rng):
+    group_by = rng.choice(["class", "teacher", "student", "month"])
+    return await client.get("/reports/revenue", params={"group_by": group_by})
+
+
+async def analytics_utilization(client, state, rng):
+    return await client.get("/analytics/utilization")
+
+
+async def search_typeahead(client, state, rng):
+    query = rng.choice(["s", "stu s", "studnet "]) + str(rng.randint(1, 4999))
+    return await client.get("/search", params={"q": query})
+
+
+SCENARIOS = {
+    "students": [students_list, students_filter, students_create, students_update],
+    "teachers": [teachers_list, teachers_classes],
+    "classes": [classes_list, classes_filter, classes_create],
+    "reservations": [
+        reservations_add,
+        reservations_class,
+        reservations_student,
+        reservations_remove,
+    ],
+    "invoices": [
+        invoices_list,
+        invoices_unpaid,
+        invoices_create,
+        invoices_pay,
+        invoices_student,
+    ],
+    "paycheck": [
+        paycheck_add_hours,
+        paycheck_get_hours,
+        paycheck_generate,
+        paycheck_list,
+        paycheck_pay,
+    ],
+    "reports": [reports_revenue, analytics_utilization],
+    "search": [search_typeahead],
+}
+
+
+async def run_scenario(client, scenario, state, seed):
+    """Runs scenario with args.requests requests spread over args.concurrency workers"""
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(args.requests))
+
+    async def worker(rng):
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await scenario(client, state, rng)
+            latencies.append(time.perf_counter() - start)
+            statuses[f"{response.status_code // 100}xx"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(worker(random.Random(seed + i)) for i in range(args.concurrency))
+    )
+    elapsed = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "statuses": dict(statuses),
+    }
+
+
+def print_results(results):
+    header = f"{'scenario':<24}{'req':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        statuses = " ".join(f"{k}={v}" for k, v in sorted(result["statuses"].items()))
+        print(
+            f"{name:<24}{result['requests']:>6}{result['throughput']:>9}"
+            f"{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}  {statuses}"
+        )
+
+
+def compare_baseline(results, baseline):
+    """Returns scenarios whose p95 grew more than args.max_regression over baseline"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous and result["p95_ms"] > previous["p95_ms"] * (
+            1 + args.max_regression
+        ):
+            regressions.append((name, previous["p95_ms"], result["p95_ms"]))
+    return regressions
+
+
+async def seed_calendar(manager):
+    """Creates fake calendar events of the dataset classes with their students as
+    attendees, so calendar calls of the scenarios find their events"""
+    query = (
+        select(Classes.calendar_id, Classes.event_id, Students.email)
+        .outerjoin(StudentsClasses, StudentsClasses.class_id == Classes.id)
+        .outerjoin(Students, Students.id == StudentsClasses.student_id)
+        .where(Classes.event_id.is_not(None))
+    )
+    events = {}
+    async with async_engine.connect() as conn:
+        for calendar_id, event_id, email in await conn.execute(query):
+            attendees = events.setdefault(
+                (calendar_or_default(calendar_id), event_id), []
+            )
+            if email:
+                attendees.append(email)
+    manager.service.seed_events(
+        (calendar_id, event_id, attendees)
+        for (calendar_id, event_id), attendees in events.items()
+    )
+    return len(events)
+
+
+async def main():
+    for name in ("sqlalchemy.engine", "api.logger"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    if args.skip_generate:
+        counts = await datagen.count_rows(async_engine)
+    else:
+        start = time.perf_counter()
+        counts = await datagen.generate(async_engine, args.scale, args.seed)
+        print(f"generated {counts} in {time.perf_counter() - start:.1f} s")
+
+    manager = FakeCalendarServiceManager(
+        latency=args.calendar_latency / 1000,
+        error_rate=args.calendar_error_rate,
+        seed=args.seed,
+    )
+    app.dependency_overrides[get_calendar_service_manager] = lambda: manager
+    print(f"seeded {await seed_calendar(manager)} fake calendar events")
+
+    routers = [r for r in args.routers.split(",") if r] or list(SCENARIOS)
+    state = LoadState(counts)
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for router in routers:
+            for scenario in SCENARIOS[router]:
+                results[scenario.__name__] = await run_scenario(
+                    client, scenario, state, args.seed
+                )
+    await async_engine.dispose()
+
+    print_results(results)
+    print(f"fake calendar calls: {manager.service.calls}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(
+                {"args": vars(args), "counts": counts, "results": results},
+                file,
+                indent=2,
+            )
+
+    if args.baseline:
+        regressions = compare_baseline(results, json.load(open(args.baseline)))
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: p95 {before} ms -> {after} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,6 @@
 #!/bin/bash
 
-uvicorn api.server:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+# one time schema setup, workers skip it on startup
+python -m api.db.migrate
+
+DB_INIT_ON_STARTUP=False uvicorn api.server:app --host 0.0.0.0 --port 8000 --workers ${WEB_WORKERS:-1}
@@ -0,0 +1,17 @@
+#!/bin/bash
+# Clones the primary with pg_basebackup on first start, then runs as hot standby
+set -e
+
+mkdir -p "$PGDATA"
+chown postgres:postgres "$PGDATA"
+chmod 0700 "$PGDATA"
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    until gosu postgres pg_basebackup -h db -U replicator -D "$PGDATA" -R -X stream; do
+        echo "waiting for primary"
+        rm -rf "${PGDATA:?}"/*
+        sleep 2
+    done
+fi
+
+exec gosu postgres postgres -c hot_standby=on
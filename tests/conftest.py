@@ -0,0 +1,69 @@
+"""Fixtures for API tests on an in-memory SQLite database and the fake calendar.
+
+python -m pytest
+"""
+
+import os
+
+# read by api.db.db_manager at import, before any api module is loaded
+os.environ["POSTGRESQL_URL"] = "sqlite+aiosqlite:///:memory:"
+os.environ["DB_ECHO"] = "False"
+os.environ["SINGLE_FLIGHT_MAX_KEYS"] = "0"
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from api.Calendar_utils.calendar_service_manager import (  # noqa: E402
+    get_calendar_service_manager,
+)
+from api.Calendar_utils.fake_calendar import FakeCalendarServiceManager  # noqa: E402
+from api.db.db_manager import Base, async_engine  # noqa: E402
+from api.server import app  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    """Fresh schema per test, the in-memory database lives on the engine's one connection"""
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_engine
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+
+
+@pytest.fixture
+async def client(database):
+    """httpx client calling the app in process, calendar writes go to the fake calendar"""
+    manager = FakeCalendarServiceManager()
+    app.dependency_overrides[get_calendar_service_manager] = lambda: manager
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+class StatementCounter:
+    """Counts statements sent to the database since the last reset"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+
+@pytest.fixture
+def statements(database):
+    counter = StatementCounter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(async_engine.sync_engine, "before_cursor_execute", counter)
@@ -0,0 +1,153 @@
+"""Statements per request of reservation and relationship loading endpoints.
+
+Counts must not grow with the roster, relationships are lazy="raise" so a
+forgotten loader fails the request instead of adding queries.
+"""
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+ROSTER = 5
+
+
+async def _create(client, url, payload):
+    response = await client.post(url, json=payload)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@pytest.fixture
+async def roster_class(client):
+    """Teacher, ROSTER students and an empty class big enough for all of them"""
+    teacher = await _create(
+        client,
+        "/teachers/create",
+        {
+            "first_name": "Tom",
+            "last_name": "Teacher",
+            "email": "tom@email.com",
+            "phone_num": "12345",
+            "hourly": 10,
+            "hire_date": "2024-01-01",
+        },
+    )
+    students = [
+        await _create(
+            client,
+            "/students/create",
+            {
+                "first_name": "Sam",
+                "last_name": f"Student{number}",
+                "email": f"sam{number}@email.com",
+                "phone_num": "12345",
+                "birth_year": 2008,
+            },
+        )
+        for number in range(ROSTER)
+    ]
+    created = await _create(
+        client,
+        "/classes/create",
+        {
+            "class_name": "Math",
+            "teacher_id": teacher["id"],
+            "class_size": ROSTER,
+            "class_start": "2030-01-01T09:00:00",
+            "class_end": "2030-01-01T10:00:00",
+        },
+    )
+    return created, students
+
+
+async def _counted(client, statements, method, url, **kwargs):
+    """Sends a request, returns its JSON and the statements it sent"""
+    statements.reset()
+    response = await client.request(method, url, **kwargs)
+    assert response.status_code < 400, response.text
+    return response.json(), statements.count
+
+
+async def _fill(client, statements, class_id, students):
+    counts = []
+    for student in students:
+        _, count = await _counted(
+            client,
+            statements,
+            "POST",
+            "/reservations/add_new",
+            params={"class_id": class_id, "student_id": student["id"], "amount": 20},
+        )
+        counts.append(count)
+    return counts
+
+
+async def test_add_reservation(client, statements, roster_class):
+    created, students = roster_class
+    # roster SELECT locking the class, reservation INSERT, invoice INSERT
+    assert await _fill(client, statements, created["id"], students) == [3] * ROSTER
+
+
+async def test_class_roster(client, statements, roster_class):
+    created, students = roster_class
+    counts = []
+    for number, student in enumerate(students, 1):
+        await _fill(client, statements, created["id"], [student])
+        roster, count = await _counted(
+            client,
+            statements,
+            "GET",
+            "/reservations/all_students",
+            params={"class_id": created["id"]},
+        )
+        assert len(roster["students"]) == number
+        counts.append(count)
+    # class SELECT plus one SELECT ... IN for the students
+    assert counts == [2] * ROSTER
+
+
+async def test_relationship_reads(client, statements, roster_class):
+    created, students = roster_class
+    await _fill(client, statements, created["id"], students)
+
+    classes, count = await _counted(
+        client,
+        statements,
+        "GET",
+        "/reservations/student",
+        params={"student_id": students[0]["id"]},
+    )
+    assert [item["id"] for item in classes] == [created["id"]]
+    assert count == 2
+
+    classes, count = await _counted(
+        client,
+        statements,
+        "GET",
+        "/teachers/classes",
+        params={"teacher_id": created["teacher_id"]},
+    )
+    assert [item["id"] for item in classes] == [created["id"]]
+    assert count == 2
+
+    # many to one, joined into the invoice SELECT
+    student, count = await _counted(
+        client, statements, "GET", "/invoices/student", params={"id": 1}
+    )
+    assert student["id"] == students[0]["id"]
+    assert count == 1
+
+
+async def test_remove_reservation(client, statements, roster_class):
+    created, students = roster_class
+    await _fill(client, statements, created["id"], students)
+    roster, count = await _counted(
+        client,
+        statements,
+        "PUT",
+        "/reservations/remove_student",
+        params={"class_id": created["id"], "student_id": students[0]["id"]},
+    )
+    assert len(roster["students"]) == ROSTER - 1
+    # roster SELECT, reservation DELETE, invoice DELETE
+    assert count == 3